@@ -0,0 +1,178 @@
+import argparse
+from datetime import datetime
+
+import yaml
+import numpy as np
+import pandas as pd
+
+from prediction_store import get_prediction_store
+from evalutate_yaml_chunked_get_scores import estimate_row_scores
+from sequential_eval import BINARY_BENCHMARKS
+from tiny_benchmark import (load_anchors, save_anchors, ANCHORS_PATH, ANCHORS_PER_DATASET, ANCHORS_MIN_MODELS,
+                            ANCHORS_MIN_COVERAGE, ANCHORS_SEED)
+
+
+"""
+    Tooling stage of the tiny benchmark mode (run.mode: tiny). The per-item scores of past full runs (prediction
+    store; QA/ContextQA judge scores are read from the judge cache only, no judge request is sent, and rows without
+    a cached score are left out) form one vector per item, its scores across the models.
+    Items are clustered with k-means on these vectors and the items closest to each cluster centre become anchors,
+    weighted by their cluster's share of the dataset. Each model is also estimated from anchors picked without it
+    (leave-one-model-out); the RMSE of these estimates widens the error bars of the tiny estimates.
+        python anchor_selection.py [--anchors 50] [--benchmark B] [--model M]
+"""
+
+
+with open('config.yaml', 'r') as file:
+    config = yaml.safe_load(file)
+
+metadata = config['metadata']
+
+KMEANS_ITERATIONS = 100
+
+
+def item_score_matrix(benchmark_type: str, models: list, min_coverage: float = ANCHORS_MIN_COVERAGE) -> pd.DataFrame:
+    """
+    Per-item scores of the stored predictions, one column per model, rows scored for every model only.
+    Models with fewer than min_coverage of the rows of the most complete model (e.g. tiny runs) are left out.
+    """
+    store = get_prediction_store()
+    frames = {model_name: store.to_frame(benchmark_type, model_name) for model_name in models}
+    most_rows = max([len(predictions_df) for predictions_df in frames.values()], default=0)
+    columns = {}
+    for model_name, predictions_df in frames.items():
+        if predictions_df.empty:
+            continue
+        if len(predictions_df) < min_coverage * most_rows:
+            print(f"{benchmark_type}: {model_name} skipped, {len(predictions_df)} of {most_rows} rows stored")
+            continue
+        scores = pd.Series(estimate_row_scores(predictions_df, benchmark_type, model_name, cache_only=True),
+                           index=predictions_df.index, dtype=float)
+        if scores.isna().any():
+            print(f"{benchmark_type}: {model_name} has {scores.isna().sum()} rows without a cached judge score, left out "
+                  f"(run step 2 for them first)")
+        columns[model_name] = scores
+    return pd.DataFrame(columns).dropna()
+
+
+def kmeans(points: np.ndarray, k: int, seed=ANCHORS_SEED, iterations: int = KMEANS_ITERATIONS):
+    """
+    Seeded k-means (k-means++ initialization over the distinct points). Returns (labels, centroids); there are fewer
+    than k clusters when there are fewer than k distinct points.
+    """
+    rng = np.random.default_rng(seed)
+    distinct = np.unique(points, axis=0)
+    centroids = [distinct[rng.integers(len(distinct))]]
+    while len(centroids) < min(k, len(distinct)):
+        distances = ((distinct[:, None, :] - np.array(centroids)[None]) ** 2).sum(axis=2).min(axis=1)
+        centroids.append(distinct[rng.choice(len(distinct), p=distances / distances.sum())])
+    centroids = np.array(centroids, dtype=float)
+
+    for _ in range(iterations):
+        labels = ((points[:, None, :] - centroids[None]) ** 2).sum(axis=2).argmin(axis=1)
+        updated = np.array([points[labels == cluster].mean(axis=0) if (labels == cluster).any() else centroids[cluster]
+                            for cluster in range(len(centroids))])
+        if np.allclose(updated, centroids):
+            break
+        centroids = updated
+    labels = ((points[:, None, :] - centroids[None]) ** 2).sum(axis=2).argmin(axis=1)
+    return labels, centroids
+
+
+def allocate_anchors(cluster_sizes: list, k: int) -> list:
+    """
+    Anchors per cluster: one each, the rest in proportion to the cluster sizes (D'Hondt), at most the cluster size.
+    There are fewer clusters than k when the models' score vectors take few distinct values (0/1 scores).
+    """
+    allocation = [1] * len(cluster_sizes)
+    while sum(allocation) < min(k, sum(cluster_sizes)):
+        cluster = max((size / (count + 1), index) for index, (size, count) in enumerate(zip(cluster_sizes, allocation))
+                      if count < size)[1]
+        allocation[cluster] += 1
+    return allocation
+
+
+def select_anchors(score_matrix: pd.DataFrame, k: int, seed=ANCHORS_SEED) -> pd.DataFrame:
+    """
+    Anchors of the clusters of item score vectors, the items closest to each cluster centre: row_id, weight (cluster
+    share of the items / anchors of the cluster) and within_variance (variance of the item scores inside the cluster,
+    averaged over the models).
+    """
+    points = score_matrix.to_numpy(dtype=float)
+    labels, centroids = kmeans(points, k, seed)
+    clusters = [(centroid, np.flatnonzero(labels == cluster)) for cluster, centroid in enumerate(centroids)
+                if (labels == cluster).any()]
+    allocation = allocate_anchors([len(members) for centroid, members in clusters], k)
+
+    rng = np.random.default_rng(seed)
+    anchors = []
+    for (centroid, members), count in zip(clusters, allocation):
+        distances = ((points[members] - centroid) ** 2).sum(axis=1)
+        # Items with identical score vectors are equally close: ties are broken at random rather than by row order
+        closest = members[np.lexsort((rng.random(len(members)), distances))[:count]]
+        within_variance = float(points[members].var(axis=0).mean())
+        anchors.extend({'row_id': int(score_matrix.index[anchor]),
+                        'weight': len(members) / len(points) / count,
+                        'within_variance': within_variance} for anchor in closest)
+    return pd.DataFrame(anchors)
+
+
+def backtest(score_matrix: pd.DataFrame, k: int, seed=ANCHORS_SEED) -> pd.DataFrame:
+    """
+    Full score and tiny estimate of every model, each estimated from anchors picked on the other models only.
+    """
+    rows = {}
+    for model_name in score_matrix.columns:
+        anchors = select_anchors(score_matrix.drop(columns=[model_name]), k, seed)
+        anchor_scores = score_matrix.loc[anchors['row_id'], model_name].to_numpy()
+        estimate = float((anchors['weight'].to_numpy() * anchor_scores).sum())
+        full_score = float(score_matrix[model_name].mean())
+        rows[model_name] = {'full score': full_score, 'tiny estimate': estimate, 'abs error': abs(estimate - full_score)}
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+
+def build_anchor_set(benchmark_type: str, models: list, k: int = ANCHORS_PER_DATASET, seed=ANCHORS_SEED,
+                     min_models: int = ANCHORS_MIN_MODELS):
+    """
+    Anchor set of a benchmark from the stored runs of `models`, None if fewer than min_models models have results.
+    """
+    score_matrix = item_score_matrix(benchmark_type, models)
+    if len(score_matrix.columns) < min_models or score_matrix.empty:
+        print(f"{benchmark_type}: {len(score_matrix)} rows scored by {len(score_matrix.columns)} models, "
+              f"rows scored by {min_models} models needed")
+        return None
+
+    anchors = select_anchors(score_matrix, k, seed)
+    backtest_df = backtest(score_matrix, k, seed)
+    print(f"{benchmark_type}: {len(anchors)} anchors for {len(score_matrix)} rows scored by {len(score_matrix.columns)} models")
+    print(backtest_df)
+    return {
+        'row_ids': anchors['row_id'].tolist(),
+        'weights': anchors['weight'].tolist(),
+        'within_variances': anchors['within_variance'].tolist(),
+        'models': list(score_matrix.columns),
+        'dataset_rows': len(score_matrix),
+        'score_range': [0, 1] if benchmark_type in BINARY_BENCHMARKS else [0, 100],
+        'seed': seed,
+        'backtest_rmse': float(np.sqrt((backtest_df['abs error'] ** 2).mean())),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pick the anchor rows of the tiny benchmark mode from past full runs")
+    parser.add_argument('--anchors', type=int, default=ANCHORS_PER_DATASET, help="anchors per benchmark")
+    parser.add_argument('--benchmark', action='append', help="only this benchmark type (repeatable)")
+    parser.add_argument('--model', action='append', help="only the runs of this model (repeatable)")
+    args = parser.parse_args()
+
+    models = [model for model in metadata['supported_models'] if not args.model or model in args.model]
+    anchor_sets = load_anchors()
+    for benchmark_type in metadata['benchmark_types'].keys():
+        if args.benchmark and benchmark_type not in args.benchmark:
+            continue
+        anchor_set = build_anchor_set(benchmark_type, models, args.anchors)
+        if anchor_set is not None:
+            anchor_sets[benchmark_type] = anchor_set
+    save_anchors(anchor_sets)
+    print(f"Anchors saved to {ANCHORS_PATH}")
@@ -0,0 +1,82 @@
+import ast
+import sys
+import pandas as pd
+
+
+"""
+    One-time ARC ingest: parses the `choices` column of arc_translated_mmlu_arc.xlsx
+    (a printed dict of numpy arrays) into a normalized options list column, validated up front.
+    The prepared frame is cached by dataset_loader next to the dataset, so no row is parsed twice.
+"""
+
+
+# Bump when the ingest output changes (part of the dataset cache file name)
+ARC_INGEST_VERSION = "arc1"
+ARC_OPTIONS_COLUMN = 'az_options'
+
+
+def _literal(node):
+    # Literals plus numpy's array([...], dtype=object) calls, nothing else is evaluated
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_literal(element) for element in node.elts]
+    if isinstance(node, ast.Dict):
+        return {_literal(key): _literal(value) for key, value in zip(node.keys, node.values)}
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'array' and node.args:
+        return _literal(node.args[0])
+    raise ValueError(f"Unsupported expression in ARC choices: {ast.dump(node)[:80]}")
+
+
+def parse_arc_choices(choices_txt: str) -> dict:
+    """
+    Safely parse an ARC `choices` cell, e.g.
+    "{'az_choices': array(['a', 'b'], dtype=object), 'label': array(['A', 'B'], dtype=object)}".
+
+    Returns:
+        dict: Field name -> list of strings (e.g. 'az_choices', 'en_choices', 'label').
+    """
+    choices = _literal(ast.parse(choices_txt.strip(), mode='eval').body)
+    if not isinstance(choices, dict):
+        raise ValueError("ARC choices must be a dict")
+    return choices
+
+
+def prepare_arc_dataset(df: pd.DataFrame, choices_col: str = 'choices', answer_col: str = 'answerKey') -> pd.DataFrame:
+    """
+    Add the parsed options list column (ARC_OPTIONS_COLUMN) to an ARC dataset.
+
+    Raises:
+        ValueError: If any row has unparsable choices, no Azerbaijani options, or an answer key
+        that is not one of its option letters.
+    """
+    choices_col = choices_col if choices_col in df.columns else df.columns[1]
+    answer_col = answer_col if answer_col in df.columns else df.columns[2]
+
+    options_column = []
+    invalid_rows = []
+    for index, choices_txt, answer in zip(df.index, df[choices_col], df[answer_col]):
+        try:
+            choices = parse_arc_choices(choices_txt)
+            options = [str(option) for option in choices['az_choices']]
+            # Options are always presented as A), B), ... (some source rows are labelled 1-4)
+            letters = [chr(65 + i) for i in range(len(options))]
+            if not options or answer not in letters:
+                raise ValueError(f"{len(options)} options, answer {answer!r}")
+        except Exception as e:
+            invalid_rows.append(f"row {index}: {e}")
+            options = []
+        options_column.append(options)
+
+    if invalid_rows:
+        raise ValueError(f"{len(invalid_rows)} invalid ARC rows:\n" + "\n".join(invalid_rows[:10]))
+
+    df = df.copy()
+    df[ARC_OPTIONS_COLUMN] = options_column
+    return df
+
+
+if __name__ == '__main__':
+    # Validate an ARC workbook: python arc_ingest.py datasets/input_datasets/arc_translated_mmlu_arc.xlsx
+    prepared = prepare_arc_dataset(pd.read_excel(sys.argv[1]))
+    print(f"{len(prepared)} ARC rows parsed, options per row: {prepared[ARC_OPTIONS_COLUMN].map(len).value_counts().to_dict()}")
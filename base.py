@@ -12,6 +12,9 @@ import httpx
 import os
 from dotenv import load_dotenv
 import re
+import yaml
+import asyncio
+from rate_limiter import TokenBucket, estimate_tokens
 
 load_dotenv()
 
@@ -22,16 +25,52 @@ MODEL_LLAMA_3_1_8B = "meta/llama-3.1-8b-instruct"
 API_KEY_LLM = os.getenv('API_KEY_NVIDIA_LLM')
 NUM_RETRIES = 3
 BASE_SLEEP_TIME = 1
+CONFIG_FILE = os.getenv('BENCHMARK_CONFIG', 'config.yaml')
+
+
+def load_config(path: str = CONFIG_FILE) -> dict:
+    """
+    Load the run configuration (config.yaml). Returns an empty dict if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as file:
+        return yaml.safe_load(file) or {}
+
+
+CONFIG = load_config()
+
+# Endpoints: empty = the real services; set both to fake_servers.py for offline runs
+ENDPOINTS_CONFIG = CONFIG.get('endpoints') or {}
+OLLAMA_HOST = ENDPOINTS_CONFIG.get('ollama_host') or os.getenv('OLLAMA_HOST')  # None = http://localhost:11434
+BASE_URL_LLM = ENDPOINTS_CONFIG.get('judge_base_url') or BASE_URL_LLM
+if ENDPOINTS_CONFIG.get('judge_base_url') and not API_KEY_LLM:
+    API_KEY_LLM = "local"  # stand-in servers accept any key
+
+# Generation: number of Ollama requests kept in flight per model (match OLLAMA_NUM_PARALLEL on the server)
+GENERATION_CONCURRENCY = int((CONFIG.get('generation') or {}).get('concurrency') or os.getenv('OLLAMA_NUM_PARALLEL', 4))
+
+# How long Ollama keeps the active model loaded after each request (sent with every generation call)
+OLLAMA_KEEP_ALIVE = (CONFIG.get('generation') or {}).get('keep_alive') or os.getenv('OLLAMA_KEEP_ALIVE', "30m")
+
+# Judge: parallel scoring workers and the provider quota they share
+JUDGE_CONFIG = CONFIG.get('judge') or {}
+JUDGE_WORKERS = int(JUDGE_CONFIG.get('workers', 8))
+JUDGE_REQUESTS_PER_MINUTE = JUDGE_CONFIG.get('requests_per_minute', 40)
+JUDGE_TOKENS_PER_MINUTE = JUDGE_CONFIG.get('tokens_per_minute')
 
 
 # SSL certificate problem fixing
 httpx_client = httpx.Client(http2=True, verify=False)
 
-# Initialize OpenAI client for NVIDIA
-client_openai = OpenAI(base_url=BASE_URL_LLM, api_key=API_KEY_LLM, http_client=httpx_client)
+# Initialize OpenAI client for NVIDIA (retries are done by resilience.py, not by the client)
+client_openai = OpenAI(base_url=BASE_URL_LLM, api_key=API_KEY_LLM, http_client=httpx_client, max_retries=0)
+
+# Rate limiter shared by every client_openai judge call
+judge_rate_limiter = TokenBucket(JUDGE_REQUESTS_PER_MINUTE, JUDGE_TOKENS_PER_MINUTE)
 
 # Initialize the Ollama client
-client_ollama = ollama.Client()
+client_ollama = ollama.Client(host=OLLAMA_HOST)
 
 
 # __all__ = ['ollama', 'openai'] # Only ollama and openai will be imported with  ->  from . import *
@@ -0,0 +1,193 @@
+import re
+import json
+import logging
+
+from base import MODEL_LLAMA_3_1_405B, JUDGE_CONFIG, JUDGE_WORKERS
+from result_cache import judge_cache, judge_cache_key
+from telemetry import cached_telemetry
+from judge_executor import run_judge_jobs, request_judge, parse_score
+from judge_cascade import JUDGE_MODE, judge_model_key
+
+
+"""
+    Batched LLM judge: packs several (question, actual answer, predicted answer) items into one 405B request,
+    so the rubric and the few-shot example are sent once per batch instead of once per row.
+    Items carry their dataset row id, the judge answers with a JSON array of {"id", "score"} objects, and every item
+    whose score is missing or invalid is scored again on its own by the single-item judge.
+"""
+
+
+# Items per judge request (1 = one request per row, the single-item judge)
+JUDGE_BATCH_SIZE = int(JUDGE_CONFIG.get('batch_size', 8))
+# Completion tokens per item of the JSON reply
+JUDGE_BATCH_TOKENS_PER_ITEM = 16
+
+# Bump when the batch prompt changes (part of the judge cache key)
+JUDGE_BATCH_PROMPT_VERSION = "batch-v1"
+
+ITEM_HEADER = "### Item"
+
+
+def create_batch_judge_prompt(items: list) -> str:
+    """
+    Judge prompt of a batch of (item_id, question, actual_answer, predicted_answer) items.
+    """
+    item_blocks = "\n\n".join(
+        f"{ITEM_HEADER} {item_id}\n"
+        f"Question: {question}\n"
+        f"Actual Answer: {actual_answer}\n"
+        f"Predicted Answer: {predicted_answer}"
+        for item_id, question, actual_answer, predicted_answer in items
+    )
+    return f"""
+            Evaluate each of the following items and give it a score from 0 to 100 based on how well the predicted
+            answer matches the actual answer based on the asked question. Score every item on its own.
+
+            0-10: No answer or completely incorrect
+            11-30: Significant errors or missing key information
+            31-50: Some errors or incomplete information, but recognizable effort
+            51-70: Mostly accurate with minor errors or omissions
+            71-90: Very close to the actual answer with only minor discrepancies
+            91-100: Accurate or nearly perfect match
+
+            **Example:**
+
+            {ITEM_HEADER} example
+            Question: Makroiqtisadiyyat nədir və mikroiqtisadiyyatdan necə fərqlənir?
+            Actual Answer: Makroiqtisadiyyat iqtisadiyyatın böyük miqyasda təhlili ilə məşğul olur, mikroiqtisadiyyat isə kiçik miqyasda, yəni fərdi bazarlarda və şirkətlərdə baş verən prosesləri öyrənir.
+            Predicted Answer: Makroiqtisadiyyat iqtisadiyyatın ümumi aspektlərini öyrənir, mikroiqtisadiyyat isə fərdi bazarları təhlil edir.
+
+            Reply: [{{"id": "example", "score": 65}}]
+
+            **Your Task:**
+
+{item_blocks}
+
+            Reply with a JSON array only, one {{"id": ..., "score": ...}} object per item, using the item ids above.
+            """
+
+
+def parse_batch_scores(content: str, item_ids: list) -> dict:
+    """
+    Scores of a batch reply, {item_id: score string}. Items with a missing, duplicated or out-of-range score are left out.
+    """
+    match = re.search(r'\[.*\]', content or '', re.DOTALL)
+    if not match:
+        return {}
+    try:
+        entries = json.loads(match.group(0))
+    except ValueError:
+        return {}
+
+    expected = {str(item_id) for item_id in item_ids}
+    scores = {}
+    duplicates = set()
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict) or str(entry.get('id')) not in expected:
+            continue
+        try:
+            score = float(entry.get('score'))
+        except (TypeError, ValueError):
+            continue
+        if not 0 <= score <= 100:
+            continue
+        item_id = str(entry['id'])
+        if item_id in scores:
+            duplicates.add(item_id)
+        scores[item_id] = f"{score:g}"
+    return {item_id: score for item_id, score in scores.items() if item_id not in duplicates}
+
+
+def score_batch(items: list) -> list:
+    """
+    Score a batch with one judge request. Returns (score, telemetry) per item, None for the items without a valid score.
+    """
+    prompt = create_batch_judge_prompt(items)
+    payload = {
+        "model": MODEL_LLAMA_3_1_405B,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.0,
+        "max_tokens": 20 + JUDGE_BATCH_TOKENS_PER_ITEM * len(items)
+    }
+
+    content, telemetry = request_judge(payload)
+    if content is None:
+        return [None] * len(items)
+
+    scores = parse_batch_scores(content, [item[0] for item in items])
+
+    # Every item carries the request telemetry, with its share of the tokens
+    telemetry['batch_size'] = len(items)
+    for field in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+        if telemetry[field] is not None:
+            telemetry[field] = telemetry[field] / len(items)
+    return [(scores[str(item[0])], dict(telemetry)) if str(item[0]) in scores else None for item in items]
+
+
+def judge_in_batches(items: list, single_judge, batch_size: int = JUDGE_BATCH_SIZE, workers: int = JUDGE_WORKERS) -> list:
+    """
+    Judge scores of (item_id, question, actual_answer, predicted_answer) items, in item order.
+
+    Args:
+        items (list): Items to score, item_id must be unique (the dataset row id).
+        single_judge (callable): Single-item judge for the fallback,
+            single_judge(question, actual_answer, predicted_answer, with_telemetry=True) -> (score, telemetry).
+        batch_size (int): Items per judge request (1 = single-item judge only; the cascade judge scores single items).
+        workers (int): Parallel judge requests.
+
+    Returns:
+        list: (score, telemetry) per item.
+    """
+    if batch_size <= 1 or JUDGE_MODE == 'cascade':
+        return run_judge_jobs([lambda item=item: single_judge(*item[1:], with_telemetry=True) for item in items], workers)
+
+    results = [None] * len(items)
+    cache_keys = [judge_cache_key(MODEL_LLAMA_3_1_405B, JUDGE_BATCH_PROMPT_VERSION, *item[1:]) for item in items]
+    pending = []
+    for position, cache_key in enumerate(cache_keys):
+        cached_score = judge_cache.get(cache_key)
+        if cached_score is not None:
+            results[position] = (cached_score, cached_telemetry())
+        else:
+            pending.append(position)
+
+    batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+    batch_results = run_judge_jobs([lambda batch=batch: score_batch([items[position] for position in batch])
+                                    for batch in batches], workers)
+
+    fallback = []
+    for batch, scores in zip(batches, batch_results):
+        for position, result in zip(batch, scores):
+            if result is None:
+                fallback.append(position)
+            else:
+                judge_cache.put(cache_keys[position], result[0])
+                results[position] = result
+
+    # Items the batch reply did not score are judged on their own
+    if fallback:
+        logging.info(f"Batch judge: {len(fallback)} of {len(items)} items scored on their own")
+        fallback_results = run_judge_jobs([lambda item=items[position]: single_judge(*item[1:], with_telemetry=True)
+                                           for position in fallback], workers)
+        for position, result in zip(fallback, fallback_results):
+            results[position] = result
+    return results
+
+
+def cached_judge_scores(items: list, prompt_version: str) -> list:
+    """
+    Judge scores of (item_id, question, actual_answer, predicted_answer) items from the judge cache only, None for the
+    items without a cached score. Batch entries and single-item entries (prompt_version, 405B or the current judge
+    mode) are all looked up, no judge request is sent.
+    """
+    identities = [(MODEL_LLAMA_3_1_405B, JUDGE_BATCH_PROMPT_VERSION), (MODEL_LLAMA_3_1_405B, prompt_version),
+                  (judge_model_key(), prompt_version)]
+    scores = []
+    for item in items:
+        score = None
+        for judge_model, version in dict.fromkeys(identities):
+            score = parse_score(judge_cache.get(judge_cache_key(judge_model, version, *item[1:])))
+            if score is not None:
+                break
+        scores.append(f"{score:g}" if score is not None else None)
+    return scores
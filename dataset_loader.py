@@ -0,0 +1,154 @@
+import os
+import glob
+import hashlib
+import logging
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from base import CONFIG
+from arc_ingest import prepare_arc_dataset, ARC_INGEST_VERSION
+
+
+"""
+    Dataset loader with a columnar cache: each input workbook is parsed with openpyxl once,
+    converted to an uncompressed Arrow IPC file keyed by the workbook's hash, and memory-mapped on later loads
+    (processes loading the same dataset share the OS page cache instead of re-parsing Excel).
+    Benchmark-specific ingest stages (e.g. ARC choices parsing) run before the conversion and are cached with it.
+"""
+
+
+DATASET_CACHE_CONFIG = CONFIG.get('dataset_cache') or {}
+DATASET_CACHE_ENABLED = DATASET_CACHE_CONFIG.get('enabled', True)
+DATASET_CACHE_DIR = DATASET_CACHE_CONFIG.get('dir', "datasets/cache/arrow")
+DATASET_LOAD_WORKERS = DATASET_CACHE_CONFIG.get('workers') or os.cpu_count() or 1
+
+# benchmark type -> (ingest function, version suffix of the cache file)
+DATASET_PREPARERS = {
+    "ARC": (prepare_arc_dataset, ARC_INGEST_VERSION),
+}
+
+
+def read_dataset(path: str, benchmark_type: str = None) -> pd.DataFrame:
+    """
+    Parse the workbook and run the ingest stage of its benchmark type, if any.
+    """
+    df = pd.read_excel(path)
+    if benchmark_type in DATASET_PREPARERS:
+        prepare, _ = DATASET_PREPARERS[benchmark_type]
+        df = prepare(df)
+    return df
+
+
+def file_hash(path: str) -> str:
+    """
+    sha256 of the file content.
+    """
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def cache_path_for(path: str, cache_dir: str = DATASET_CACHE_DIR, benchmark_type: str = None) -> str:
+    """
+    Arrow cache file of a workbook (name + content hash + ingest version).
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    suffix = f"-{DATASET_PREPARERS[benchmark_type][1]}" if benchmark_type in DATASET_PREPARERS else ""
+    return os.path.join(cache_dir, f"{name}-{file_hash(path)[:16]}{suffix}.arrow")
+
+
+def build_cache(path: str, cache_dir: str = DATASET_CACHE_DIR, benchmark_type: str = None, cache_path: str = None):
+    """
+    Parse the workbook and write its Arrow cache file. Returns the cache path, or None if the
+    dataset could not be converted (e.g. pyarrow missing or mixed-type columns).
+    cache_path skips hashing the workbook again when the caller already has it (cache_path_for).
+    """
+    cache_path = cache_path or cache_path_for(path, cache_dir, benchmark_type)
+    if os.path.exists(cache_path):
+        return cache_path
+
+    try:
+        import pyarrow as pa
+    except ImportError:
+        logging.warning("pyarrow is not installed, datasets are read from Excel on every run.")
+        return None
+
+    df = read_dataset(path, benchmark_type)
+    try:
+        table = pa.Table.from_pandas(df)
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        logging.warning(f"Could not convert {path} to Arrow, it will be read from Excel: {e}")
+        return None
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to a temporary file first so concurrent workers never read a partial cache file
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, cache_path)
+
+    # Drop the caches of older versions of the same workbook
+    name = os.path.splitext(os.path.basename(path))[0]
+    current_hash = os.path.basename(cache_path)[len(name) + 1:len(name) + 17]
+    for stale_path in glob.glob(os.path.join(cache_dir, f"{name}-{'[0-9a-f]' * 16}*.arrow")):
+        if os.path.basename(stale_path)[len(name) + 1:len(name) + 17] != current_hash:
+            os.remove(stale_path)
+    return cache_path
+
+
+def read_cache(cache_path: str) -> pd.DataFrame:
+    """
+    Memory-map an Arrow cache file and return it as a DataFrame of Arrow-backed columns (pd.ArrowDtype): the
+    column buffers stay in the mapped file, no copy and no Python string objects are made.
+    """
+    import pyarrow as pa
+
+    with pa.memory_map(cache_path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    df = table.to_pandas(types_mapper=pd.ArrowDtype)
+    # List columns (e.g. the parsed ARC options) are kept as plain lists, as the handlers expect
+    for field in table.schema:
+        if pa.types.is_list(field.type):
+            df[field.name] = pd.Series(table.column(field.name).to_pylist(), index=df.index, dtype=object)
+    return df
+
+
+def load_dataset(path: str, cache_dir: str = DATASET_CACHE_DIR, benchmark_type: str = None,
+                 cache_path: str = None) -> pd.DataFrame:
+    """
+    Load an input workbook, through the Arrow cache when possible.
+    """
+    if not DATASET_CACHE_ENABLED:
+        return read_dataset(path, benchmark_type)
+    cache_path = build_cache(path, cache_dir, benchmark_type, cache_path)
+    return read_cache(cache_path) if cache_path else read_dataset(path, benchmark_type)
+
+
+def load_datasets(paths: list, benchmark_types: dict = None, cache_dir: str = DATASET_CACHE_DIR,
+                  workers: int = DATASET_LOAD_WORKERS) -> dict:
+    """
+    Load several workbooks, converting the uncached ones in parallel worker processes.
+
+    Args:
+        paths (list): Workbook paths (config.yaml dataset_files).
+        benchmark_types (dict): Optional path -> benchmark type, selects the ingest stage of each dataset.
+
+    Returns:
+        dict: path -> DataFrame, in the order of `paths`.
+    """
+    benchmark_types = benchmark_types or {}
+    if not DATASET_CACHE_ENABLED:
+        return {path: read_dataset(path, benchmark_types.get(path)) for path in paths}
+
+    # Each workbook is hashed once, its cache path is passed down
+    cache_paths = {path: cache_path_for(path, cache_dir, benchmark_types.get(path)) for path in paths}
+    missing = [path for path in paths if not os.path.exists(cache_paths[path])]
+    if len(missing) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(missing))) as executor:
+            list(executor.map(build_cache, missing, [cache_dir] * len(missing), [benchmark_types.get(path) for path in missing],
+                              [cache_paths[path] for path in missing]))
+
+    return {path: load_dataset(path, cache_dir, benchmark_types.get(path), cache_paths[path]) for path in paths}
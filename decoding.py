@@ -0,0 +1,134 @@
+import re
+import time
+
+from base import CONFIG
+
+
+"""
+    Decoding profiles per benchmark type (Ollama `options`) and stream consumption with early abort:
+    QA answers stop being read once they pass the 400-char limit, multiple-choice answers
+    as soon as the option letter is known.
+"""
+
+
+DECODING_PROFILES = CONFIG.get('decoding_profiles') or {}
+DECODING_OPTION_KEYS = ('num_predict', 'stop', 'temperature', 'seed')
+MAX_ANSWER_CHARS = 400
+# Start of the reply kept by StreamCollector for the multiple-choice stop conditions
+HEAD_CHARS = 32
+
+
+def is_constrained(kind: str) -> bool:
+    """
+    True if the profile asks for constrained single-letter answers (JSON schema `format`, Ollama 0.5+).
+    """
+    return bool((DECODING_PROFILES.get(kind) or {}).get('constrained', False))
+
+
+def get_decoding_options(kind: str):
+    """
+    Ollama options of a decoding profile ('qa', 'cqa', 'mc', 'tc' or 'arc'), None if the profile is not configured.
+    """
+    profile = DECODING_PROFILES.get(kind) or {}
+    options = {key: profile[key] for key in DECODING_OPTION_KEYS if profile.get(key) is not None}
+    return options or None
+
+
+class StreamCollector:
+    """
+    Accumulates streamed content (list of parts, joined once) and tells when the stream can be abandoned.
+    Stop conditions look at the new chunk (last) and the start of the reply (head, leading whitespace dropped),
+    never at the whole text. Also keeps the request timings and the final chunk (Ollama's eval stats) for
+    telemetry; create it right before sending the request.
+
+    Args:
+        stop_when (callable): Optional stop_when(collector) -> bool, checked after every chunk.
+    """
+
+    def __init__(self, stop_when=None):
+        self.parts = []
+        self.length = 0
+        self.head = ''
+        self.last = ''
+        self.stop_when = stop_when
+        self.aborted = False
+        self.started_at = time.perf_counter()
+        self.first_token_at = None
+        self.final = None
+
+    @property
+    def text(self) -> str:
+        return ''.join(self.parts)
+
+    def add(self, chunk) -> bool:
+        """
+        Add a stream chunk, returns True when reading should stop.
+        """
+        if 'message' in chunk and 'content' in chunk['message']:
+            content = chunk['message']['content']
+            if content and self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            self.parts.append(content)
+            self.length += len(content)
+            self.last = content
+            if len(self.head) < HEAD_CHARS:
+                self.head = (self.head + content).lstrip()[:HEAD_CHARS]
+        else:
+            print(f"Unexpected chunk format: {chunk}")
+        if chunk.get('done'):
+            self.final = chunk
+        if self.stop_when is not None and self.stop_when(self):
+            self.aborted = True
+        return self.aborted
+
+
+def answer_too_long(collector: StreamCollector) -> bool:
+    # The answer is discarded as 'Long answer' anyway
+    return collector.length > MAX_ANSWER_CHARS
+
+
+def format_answer(answer) -> str:
+    """
+    QA / ContextQA answer as stored: 'Long answer' past the 400-char limit, "Error" if there is none.
+    """
+    if not answer:
+        return "Error"
+    return 'Long answer' if len(answer) > MAX_ANSWER_CHARS else answer.strip()
+
+
+def option_letter_parsed(collector: StreamCollector) -> bool:
+    # compare_answers takes the first capital letter, nothing generated after it changes the score
+    # (unless the whole reply turns out to be "answer", which scores 0). A reply that can still spell "answer"
+    # is at most 6 characters after its leading whitespace, so the head is enough to tell.
+    if re.search(r'[A-Z]', collector.last) is None and re.search(r'[A-Z]', collector.head) is None:
+        return False
+    return not "answer".startswith(collector.head.rstrip().lower())
+
+
+def json_answer_parsed(collector: StreamCollector) -> bool:
+    # Constrained replies look like {"answer": "B"}, the letter is all we need
+    return re.search(r'"answer"\s*:\s*"([A-Z])"', collector.head) is not None
+
+
+def consume_stream(stream, collector: StreamCollector) -> str:
+    """
+    Read a sync Ollama stream into the collector, closing it early when the collector says so.
+    """
+    for chunk in stream:
+        if collector.add(chunk):
+            if hasattr(stream, 'close'):
+                stream.close()
+            break
+    return collector.text
+
+
+async def consume_stream_async(stream, collector: StreamCollector) -> str:
+    """
+    Async variant of consume_stream.
+    """
+    async for chunk in stream:
+        if collector.add(chunk):
+            if hasattr(stream, 'aclose'):
+                await stream.aclose()
+            break
+    return collector.text
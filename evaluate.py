@@ -13,6 +13,10 @@ from rag import get_evaluation_score_context
 from qa_quality import get_answer_from_local_ollama
 from qa_quality import get_evaluation_score, calculate_levenshtein_score, calculate_bleu_score, calculate_rouge_score
 
+from dataset_loader import load_datasets
+from arc_ingest import ARC_OPTIONS_COLUMN
+from run_planner import run_model_major
+
 
 dataset_files = [
     "LLM_BENCH_qa.xlsx",
@@ -118,10 +122,7 @@ def run_benchmark(model_name, benchmark_type, df, results):
     elif benchmark_type == "ARC":
         for index, row in df.iterrows():
             question = row['Azerbaijani_q']
-            options_txt = row['choices']
-            array = pd.array
-            options_dict = eval(options_txt)
-            options = options_dict['az_choices'].tolist()
+            options = row[ARC_OPTIONS_COLUMN]  # parsed once by the ARC ingest stage of the dataset loader
             # print(options)
             correct_answer = row['answerKey']
             score = handle_arc(question, options, correct_answer, model_name)
@@ -136,17 +137,21 @@ def run_benchmark(model_name, benchmark_type, df, results):
 
 results = pd.DataFrame(columns=metadata['benchmark_types'].keys(), index=metadata['supported_models'])
 
-for file in dataset_files:
+# Parsed once, then served from the Arrow dataset cache
+datasets = load_datasets(dataset_files, {file: get_benchmark_from_filename(file, metadata) for file in dataset_files})
+
+def run_dataset(model_name, file):
     benchmark_type = get_benchmark_from_filename(file, metadata)
-    print(f"Running {benchmark_type} benchmark for file: {file}")
-    
-    df = pd.read_excel(file)
+    print(f"Running {benchmark_type} benchmark for file: {file} with model {model_name}")
+
+    df = datasets[file]
     df = df[70:72]  
     print(df)
 
-    for model_name in metadata['supported_models']:
-        print(f"Running {benchmark_type} for model {model_name}")
-        run_benchmark(model_name, benchmark_type, df, results)
+    run_benchmark(model_name, benchmark_type, df, results)
+
+# Model-major: every dataset runs for one model before the next one is loaded
+run_model_major(metadata['supported_models'], dataset_files, run_dataset)
 
 print("\nAverage Scores:\n", results)
 
@@ -14,6 +14,12 @@ from rag import get_evaluation_score_context
 from qa_quality import get_answer_from_local_ollama
 from qa_quality import get_evaluation_score, calculate_rouge_score, calculate_bleu_score, calculate_levenshtein_score
 
+from dataset_loader import load_datasets
+from arc_ingest import ARC_OPTIONS_COLUMN
+from run_planner import run_model_major
+from sequential_eval import SequentialEstimate, sequential_order, sequential_results, SEQUENTIAL_ENABLED
+from tiny_benchmark import dataset_rows, tiny_score, tiny_results, RUN_MODE, TINY
+
 
 """
     This is the main file for executing the code in a single run to obtain the result for the YAML version.
@@ -68,14 +74,28 @@ def handle_arc(question, options, correct_answer, model):
     score = compare_answers(actual_answer=correct_answer, predicted_answer=predicted_option)
     return score
 
-def run_benchmark(model_name, benchmark_type, df, results):
+# tiny: df holds the anchor rows only, the result is the estimated full-dataset score (tiny_benchmark.py)
+def run_benchmark(model_name, benchmark_type, df, results, sequential=SEQUENTIAL_ENABLED, tiny=False):
     scores = []
+    # Sequential mode: seeded row order, stop once the confidence interval of the mean is narrow enough
+    estimate = SequentialEstimate(benchmark_type) if sequential and not tiny else None
+    if estimate is not None:
+        df = sequential_order(df)
+
+    def enough(score):
+        if estimate is None:
+            return False
+        estimate.add([score])
+        return estimate.done()
+
     if benchmark_type == "QA":
         for index, row in df.iterrows():
             question = row['Sual']
             actual_answer = row['Cavab']
             score = handle_qa(question, actual_answer, model_name)
             scores.append(score)
+            if enough(score):
+                break
     
     elif benchmark_type == "Reshad":
         for index, row in df.iterrows():
@@ -84,6 +104,8 @@ def run_benchmark(model_name, benchmark_type, df, results):
             correct_option = row['answer']
             score = handle_topic_classification(question, options, correct_option, model_name)
             scores.append(score)
+            if enough(score):
+                break
 
     elif benchmark_type == "ContextQA":
         for index, row in df.iterrows():
@@ -92,6 +114,8 @@ def run_benchmark(model_name, benchmark_type, df, results):
             actual_answer = row['answer']
             score = handle_context_qa(question, context, actual_answer, model_name)
             scores.append(score)
+            if enough(score):
+                break
 
     elif benchmark_type == "Arzuman":
         for index, row in df.iterrows():
@@ -100,43 +124,65 @@ def run_benchmark(model_name, benchmark_type, df, results):
             correct_topic = row['answer']
             score = handle_multiple_choice(question, topic_options, correct_topic, model_name)
             scores.append(score)
+            if enough(score):
+                break
 
     elif benchmark_type == "ARC":
         for index, row in df.iterrows():
             question = row['Azerbaijani_q']
-            options_txt = row['choices']
-            array = pd.array
-            options_dict = eval(options_txt)
-            options = options_dict['az_choices'].tolist()
+            options = row[ARC_OPTIONS_COLUMN]  # parsed once by the ARC ingest stage of the dataset loader
             # print(options)
             correct_answer = row['answerKey']
             score = handle_arc(question, options, correct_answer, model_name)
             scores.append(score)
+            if enough(score):
+                break
 
     else:
         raise ValueError(f"Unknown benchmark type: {benchmark_type}")
 
-    if scores:
+    if scores and tiny:
+        # Every row was scored in df order
+        results.loc[model_name, benchmark_type] = tiny_score(model_name, benchmark_type, df.index[:len(scores)], scores)
+    elif scores:
         average_score = sum(scores) / len(scores)
         results.loc[model_name, benchmark_type] = average_score
 
+    if estimate is not None:
+        sequential_results.record(model_name, benchmark_type, estimate, len(df))
+        print(f"Sequential {model_name}/{benchmark_type}: {estimate.describe()} of {len(df)} rows")
+
 results = pd.DataFrame(columns=metadata['benchmark_types'].keys(), index=metadata['supported_models'])
 
-for file in dataset_files:
+# Parsed once, then served from the Arrow dataset cache
+datasets = load_datasets(dataset_files, {file: get_benchmark_from_filename(file, metadata) for file in dataset_files})
+
+def run_dataset(model_name, file):
     benchmark_type = get_benchmark_from_filename(file, metadata)
-    print(f"Running {benchmark_type} benchmark for file: {file}")
-    
-    df = pd.read_excel(file)
-    df = df[:2]  
+    print(f"Running {benchmark_type} benchmark for file: {file} with model {model_name}")
+
+    # run.mode: every row (up to run.limit_rows) or only the tiny benchmark anchors
+    df = dataset_rows(datasets[file], benchmark_type)
     print(df)
 
-    for model_name in metadata['supported_models']:
-        print(f"Running {benchmark_type} for model {model_name}")
-        run_benchmark(model_name, benchmark_type, df, results)
+    run_benchmark(model_name, benchmark_type, df, results, tiny=RUN_MODE == TINY)
+
+# Model-major: every dataset runs for one model before the next one is loaded
+run_model_major(metadata['supported_models'], dataset_files, run_dataset)
 
 print("\nAverage Scores:\n", results)
 
 # results.to_excel("benchmark_results.xlsx", engine='openpyxl')
-results.to_excel(results_file)
+# Sequential mode: rows used and confidence interval per model/benchmark
+sequential_summary = sequential_results.summary()
+tiny_summary = tiny_results.summary()
+with pd.ExcelWriter(results_file) as excel_writer:
+    results.to_excel(excel_writer, sheet_name='Sheet1')
+    if not sequential_summary.empty:
+        sequential_summary.to_excel(excel_writer, sheet_name='Sequential')
+        print("\nSequential evaluation:\n", sequential_summary)
+    if not tiny_summary.empty:
+        tiny_summary.to_excel(excel_writer, sheet_name='Tiny estimates')
+        print("\nTiny benchmark estimates:\n", tiny_summary)
 
 
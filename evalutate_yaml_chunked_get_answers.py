@@ -5,11 +5,17 @@ import pandas as pd
 import traceback  
 
 
-from multiple_choice import get_model_answer_multiple_options
+from multiple_choice import get_model_answer_multiple_options_async
 
-from rag import get_answer_from_local_ollama_context
+from rag import get_answer_from_local_ollama_context_async
 
-from qa_quality import get_answer_from_local_ollama
+from qa_quality import get_answer_from_local_ollama_async
+
+from generation_engine import run_generation_jobs
+
+from prediction_store import get_prediction_store, EXPORT_EXCEL, ERROR, LONG
+
+from arc_ingest import prepare_arc_dataset, ARC_OPTIONS_COLUMN
 
 
 with open('config.yaml', 'r') as file:
@@ -27,157 +33,184 @@ def get_benchmark_from_filename(filename, metadata):
             return benchmark_type
     raise ValueError(f"Filename {filename} does not match any known benchmark type")
 
-# Prediction handlers
-def handle_qa_prediction(question, model):
-    return get_answer_from_local_ollama(model, question)
+# Prediction handlers (async, run by the generation engine), each returns (prediction, telemetry)
+async def handle_qa_prediction(question, model, client):
+    return await get_answer_from_local_ollama_async(model, question, client, with_telemetry=True)
+
+async def handle_context_qa_prediction(question, context, model, client):
+    return await get_answer_from_local_ollama_context_async(model, question, context, client, with_telemetry=True)
+
+async def handle_multiple_choice_prediction(question, options, model, client):
+    return await get_model_answer_multiple_options_async(question, options=options, model=model, dstype='mc', client=client, with_telemetry=True)
+
+async def handle_topic_classification_prediction(question, options, model, client):
+    return await get_model_answer_multiple_options_async(question=question, model=model, options=options, dstype='tc', client=client, with_telemetry=True)
+
+async def handle_arc_prediction(question, options, model, client):
+    return await get_model_answer_multiple_options_async(question, options=options, model=model, dstype='arc', client=client, with_telemetry=True)
+
+# Columns of the predictions output per benchmark type
+PREDICTION_COLUMNS = {
+    "QA": ['Question', 'Correct Answer', 'Predicted Answer'],
+    "ContextQA": ['Question', 'Context', 'Correct Answer', 'Predicted Answer'],
+    "Arzuman": ['Question', 'Correct Answer', 'Predicted Option'],
+    "Reshad": ['Question', 'Correct Answer', 'Predicted Topic'],
+    "ARC": ['Question', 'Correct Answer', 'Predicted Option'],
+}
+
+
+# Seed the prediction store from a predictions Excel file written before the store existed
+# Every row is imported with its status (ok/error/long), failed rows are regenerated with --repair
+def import_legacy_predictions(store, output_filename, benchmark_type, model_name):
+    existing_df = pd.read_excel(output_filename)
+
+    # Filter the existing DataFrame to keep only relevant columns
+    columns_to_keep = PREDICTION_COLUMNS[benchmark_type]
+    existing_df = existing_df[columns_to_keep]
+
+    for row_id, values in enumerate(existing_df.values.tolist()):
+        store.put_result(benchmark_type, model_name, row_id, columns_to_keep, values)
+    store.flush()
+    print(f"Imported {len(existing_df)} rows from {output_filename}")
+
+
+# Build one generation job per dataset row, skipping the rows in skip_row_ids
+# Returns (row_ids, rows, jobs): dataset row ids, the row values stored before the prediction, and the job callables
+def build_prediction_jobs(df, benchmark_type, model_name, skip_row_ids=()):
+    if benchmark_type not in PREDICTION_COLUMNS:
+        raise ValueError("Unknown benchmark type.")
+
+    # Define columns based on benchmark type
+    if benchmark_type == "QA":
+        question_col = 'Sual' if 'Sual' in df.columns else df.columns[0]
+        answer_col = 'Cavab' if 'Cavab' in df.columns else df.columns[1]
+
+    elif benchmark_type == "ContextQA":
+        question_col = 'question' if 'question' in df.columns else df.columns[0]
+        context_col = 'context' if 'context' in df.columns else df.columns[1]
+        answer_col = 'answer' if 'answer' in df.columns else df.columns[2]
+
+    elif benchmark_type == "Arzuman":
+        question_col = 'text' if 'text' in df.columns else df.columns[0]
+        options_col = 'options' if 'options' in df.columns else df.columns[1]
+        answer_col = 'answer' if 'answer' in df.columns else df.columns[2]
+
+    elif benchmark_type == "Reshad":
+        question_col = 'text' if 'text' in df.columns else df.columns[0]
+        options_col = 'options' if 'options' in df.columns else df.columns[1]
+        answer_col = 'answer' if 'answer' in df.columns else df.columns[2]
+
+    elif benchmark_type == "ARC":
+        question_col = 'Azerbaijani_q' if 'Azerbaijani_q' in df.columns else df.columns[0]
+        choices_col = 'choices' if 'choices' in df.columns else df.columns[1]
+        answer_col = 'answerKey' if 'answerKey' in df.columns else df.columns[2]
+        # Options parsed by the ARC ingest stage (dataset_loader); frames loaded elsewhere are parsed here once
+        if ARC_OPTIONS_COLUMN not in df.columns:
+            df = prepare_arc_dataset(df, choices_col=choices_col, answer_col=answer_col)
+
+    row_ids = []
+    rows = []
+    jobs = []
+    for index, row in df.iterrows():
+        if index in skip_row_ids:  # Skip already processed rows
+            continue
+        row_ids.append(index)
+        
+        if benchmark_type == "QA":
+            question = row[question_col]
+            rows.append([question, row[answer_col]])
+            jobs.append(lambda client, question=question: handle_qa_prediction(question, model_name, client))
+
+        elif benchmark_type == "ContextQA":
+            question = row[question_col]
+            context = row[context_col]
+            rows.append([question, context, row[answer_col]])
+            jobs.append(lambda client, question=question, context=context: handle_context_qa_prediction(question, context, model_name, client))
 
-def handle_context_qa_prediction(question, context, model):
-    return get_answer_from_local_ollama_context(model, question, context)
+        elif benchmark_type == "Arzuman":
+            question = row[question_col]
+            options = row[options_col]
+            rows.append([question, row[answer_col]])
+            jobs.append(lambda client, question=question, options=options: handle_multiple_choice_prediction(question, options, model_name, client))
 
-def handle_multiple_choice_prediction(question, options, model):
-    return get_model_answer_multiple_options(question, options=options, model=model, dstype='mc')
+        elif benchmark_type == "Reshad":
+            question = row[question_col]
+            options = row[options_col]
+            rows.append([question, row[answer_col]])
+            jobs.append(lambda client, question=question, options=options: handle_topic_classification_prediction(question, options, model_name, client))
+
+        elif benchmark_type == "ARC":
+            question = row[question_col]
+            options = row[ARC_OPTIONS_COLUMN]
+            rows.append([question, row[answer_col]])
+            jobs.append(lambda client, question=question, options=options: handle_arc_prediction(question, options, model_name, client))
 
-def handle_topic_classification_prediction(question, options, model):
-    return get_model_answer_multiple_options(question=question, model=model, options=options, dstype='tc')
+    return row_ids, rows, jobs
 
-def handle_arc_prediction(question, options, model):
-    return get_model_answer_multiple_options(question, options=options, model=model, dstype='arc')
 
 # Store Predictions Function with Error Handling
-def store_predictions(df, benchmark_type, model_name):
-    predictions = []
+# Every finished row is committed to the prediction store (keyed by dataset row id); rows already stored are skipped
+# With repair_states (e.g. ['error']), only the stored rows in those states are regenerated
+def store_predictions(df, benchmark_type, model_name, generation_concurrency=None, export_excel=EXPORT_EXCEL, repair_states=None):
+    store = get_prediction_store()
     try:
-        start_index = 0
+        if benchmark_type not in PREDICTION_COLUMNS:
+            raise ValueError("Unknown benchmark type.")
+        columns = PREDICTION_COLUMNS[benchmark_type]
         output_filename = f"{benchmark_type}_{model_name}_predictions.xlsx"
 
-        # Check if the file exists and read existing data
-        if os.path.exists(output_filename):
-            existing_df = pd.read_excel(output_filename)
-            
-            # Define columns based on benchmark type for existing data
-            if benchmark_type == "QA":
-                columns_to_keep = ['Question', 'Correct Answer', 'Predicted Answer']
-            elif benchmark_type == "ContextQA":
-                columns_to_keep = ['Question', 'Context', 'Correct Answer', 'Predicted Answer']
-            elif benchmark_type == "Arzuman":
-                columns_to_keep = ['Question', 'Correct Answer', 'Predicted Option']
-            elif benchmark_type == "Reshad":
-                columns_to_keep = ['Question', 'Correct Answer', 'Predicted Topic']
-            elif benchmark_type == "ARC":
-                columns_to_keep = ['Question', 'Correct Answer', 'Predicted Option']
-            else:
-                raise ValueError("Unknown benchmark type.")
-
-            # Filter the existing DataFrame to keep only relevant columns
-            existing_df = existing_df[columns_to_keep]            
-            
-            if existing_df[existing_df.columns[-1]][~existing_df[existing_df.columns[-1]].isin(['Error', 'Long answer'])].nunique(dropna=True) > 0:
-                start_index = len(existing_df)  # Start from the next index (default case) # 
-
-            # Iterate through the DataFrame to find the start index (when happened error at the point) #
-            for i in range(1, len(existing_df)):
-                if existing_df.loc[i, existing_df.columns[-1]].lower() == 'error':
-                    if existing_df.loc[i - 1, existing_df.columns[-1]].lower() != 'error':
-                        start_index = i
-                        break
-
-            # Manually define starting index # v3
-            # start_index = 2
-
-            print("Start index:", start_index)
-
-            predictions = existing_df.iloc[:start_index].values.tolist()  # Keep existing predictions
+        done_row_ids = store.row_ids(benchmark_type, model_name)
+        if not done_row_ids and os.path.exists(output_filename):
+            import_legacy_predictions(store, output_filename, benchmark_type, model_name)
+            done_row_ids = store.row_ids(benchmark_type, model_name)
+
+        if repair_states:
+            repair_row_ids = store.status_row_ids(benchmark_type, model_name, repair_states)
+            print(f"Rows to repair ({', '.join(repair_states)}): {len(repair_row_ids)}")
+            skip_row_ids = set(df.index) - repair_row_ids
         else:
-            start_index = 0  # Start from the beginning if the file doesn't exist
+            print(f"Rows already stored: {len(done_row_ids)}")
+            failed_row_ids = store.status_row_ids(benchmark_type, model_name, [ERROR, LONG])
+            if failed_row_ids:
+                print(f"{len(failed_row_ids)} stored rows are error/long answers, regenerate them with --repair")
+            skip_row_ids = done_row_ids
 
-        # Define columns based on benchmark type
-        if benchmark_type == "QA":
-            question_col = 'Sual' if 'Sual' in df.columns else df.columns[0]
-            answer_col = 'Cavab' if 'Cavab' in df.columns else df.columns[1]
-            columns = ['Question', 'Correct Answer', 'Predicted Answer']
+        row_ids, rows, jobs = build_prediction_jobs(df, benchmark_type, model_name, skip_row_ids=skip_row_ids)
+        store.mark_pending(benchmark_type, model_name, row_ids)
 
-        elif benchmark_type == "ContextQA":
-            question_col = 'question' if 'question' in df.columns else df.columns[0]
-            context_col = 'context' if 'context' in df.columns else df.columns[1]
-            answer_col = 'answer' if 'answer' in df.columns else df.columns[2]
-            columns = ['Question', 'Context', 'Correct Answer', 'Predicted Answer']
+        # Commit each row (with its request telemetry and status) to the store as soon as it is generated
+        def on_result(position, result):
+            predicted_value, telemetry = result
+            store.put_result(benchmark_type, model_name, row_ids[position], columns, rows[position] + [predicted_value], telemetry)
 
-        elif benchmark_type == "Arzuman":
-            question_col = 'text' if 'text' in df.columns else df.columns[0]
-            options_col = 'options' if 'options' in df.columns else df.columns[1]
-            answer_col = 'answer' if 'answer' in df.columns else df.columns[2]
-            columns = ['Question', 'Correct Answer', 'Predicted Option']
+        with store.flush_on_exit():
+            run_generation_jobs(jobs, concurrency=generation_concurrency, on_result=on_result)
+        print(f"Predictions stored in {store.path} ({len(jobs)} {'repaired' if repair_states else 'new'} rows)")
 
-        elif benchmark_type == "Reshad":
-            question_col = 'text' if 'text' in df.columns else df.columns[0]
-            options_col = 'options' if 'options' in df.columns else df.columns[1]
-            answer_col = 'answer' if 'answer' in df.columns else df.columns[2]
-            columns = ['Question', 'Correct Answer', 'Predicted Topic']
-
-        elif benchmark_type == "ARC":
-            question_col = 'Azerbaijani_q' if 'Azerbaijani_q' in df.columns else df.columns[0]
-            choices_col = 'choices' if 'choices' in df.columns else df.columns[1]
-            answer_col = 'answerKey' if 'answerKey' in df.columns else df.columns[2]
-            columns = ['Question', 'Correct Answer', 'Predicted Option']
-
-        # Process predictions, skipping already processed rows
-        for index, row in df.iterrows():
-            if index < start_index:  # Skip already processed rows
-                continue
-            
-            if benchmark_type == "QA":
-                question = row[question_col]
-                predicted_answer = handle_qa_prediction(question, model_name)
-                predictions.append([question, row[answer_col], predicted_answer])
-
-            elif benchmark_type == "ContextQA":
-                question = row[question_col]
-                context = row[context_col]
-                predicted_answer = handle_context_qa_prediction(question, context, model_name)
-                predictions.append([question, context, row[answer_col], predicted_answer])
-
-            elif benchmark_type == "Arzuman":
-                question = row[question_col]
-                options = row[options_col]
-                predicted_option = handle_multiple_choice_prediction(question, options, model_name)
-                predictions.append([question, row[answer_col], predicted_option])
-
-            elif benchmark_type == "Reshad":
-                question = row[question_col]
-                options = row[options_col]
-                predicted_topic = handle_topic_classification_prediction(question, options, model_name)
-                predictions.append([question, row[answer_col], predicted_topic])
-
-            elif benchmark_type == "ARC":
-                question = row[question_col]
-                options_txt = row[choices_col]
-                array = pd.array
-                options_dict = eval(options_txt)
-                options = options_dict['az_choices'].tolist()
-                predicted_option = handle_arc_prediction(question, options, model_name)
-                predictions.append([question, row[answer_col], predicted_option])
-
-        # Convert predictions to DataFrame and save to Excel
-        output_df = pd.DataFrame(predictions, columns=columns)
-        # output_df.to_excel(output_filename, header=start_index == 0)  # Add headers only for the first write # v1
-        output_df.to_excel(output_filename)  # Add headers for all cases # v2
-        print(f"Predictions saved to {output_filename}")
+        # Optional Excel export of all stored rows
+        if export_excel and (jobs or not repair_states):
+            export_predictions(store, benchmark_type, model_name)
 
     except Exception as e:
         print(f"Error occurred while storing predictions: {str(e)}")
         traceback.print_exc() 
-        # Save partial results if any errors occur
-        if predictions:
-            output_df = pd.DataFrame(predictions, columns=columns)
-            output_filename_partial = f"{benchmark_type}_{model_name}_predictions_partial.xlsx"
-            output_df.to_excel(output_filename_partial)  # Save partial results with index
-            print(f"Partial predictions saved to {output_filename_partial} due to error.")
+        # Finished rows are already committed, a rerun continues with the missing rows
+        store.flush()
+        print(f"Partial predictions kept in {store.path} due to error.")
+
+
+# Write all stored rows of (benchmark, model) to {benchmark}_{model}_predictions.xlsx
+def export_predictions(store, benchmark_type, model_name):
+    output_filename = f"{benchmark_type}_{model_name}_predictions.xlsx"
+    output_df = store.to_frame(benchmark_type, model_name)
+    output_df.to_excel(output_filename)  # Add headers for all cases # v2
+    print(f"Predictions saved to {output_filename}")
 
 # Main function to run benchmarks and store predictions with error handling
-def run_benchmark_store_answers(model_name, benchmark_type, df):
+def run_benchmark_store_answers(model_name, benchmark_type, df, repair_states=None):
     try:
         print('store prediction started')
-        store_predictions(df, benchmark_type, model_name)
+        store_predictions(df, benchmark_type, model_name, repair_states=repair_states)
     except Exception as e:
         print(f"Error while running benchmark for {benchmark_type} with model {model_name}: {str(e)}")
         traceback.print_exc()
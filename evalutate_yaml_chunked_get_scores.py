@@ -6,11 +6,23 @@ import yaml
 import pandas as pd
 import traceback 
 
-from multiple_choice import compare_answers, compare_answers_and_save
+from multiple_choice import compare_answers, compare_answers_and_save, ScoreFileWriter
 
-from rag import get_evaluation_score_context
+from rag import get_evaluation_score_context, JUDGE_PROMPT_VERSION as CONTEXT_JUDGE_PROMPT_VERSION
 
-from qa_quality import get_evaluation_score, calculate_rouge_score, calculate_bleu_score, calculate_levenshtein_score
+from qa_quality import get_evaluation_score, JUDGE_PROMPT_VERSION as QA_JUDGE_PROMPT_VERSION
+
+from batch_judge import judge_in_batches, cached_judge_scores
+
+from tiered_scoring import assign_tier, tier_stats, TIER_JUDGE, TIER_RULE
+
+from lexical_metrics import calculate_lexical_scores
+
+from prediction_store import load_predictions, get_prediction_store
+
+from sequential_eval import SequentialEstimate, sequential_order, sequential_results, SEQUENTIAL_ENABLED, SEQUENTIAL_CHUNK_SIZE
+
+from tiny_benchmark import dataset_rows, tiny_score, RUN_MODE, TINY
 
 
 with open('config.yaml', 'r') as file:
@@ -21,74 +33,200 @@ dataset_files = config['dataset_files']
 results_file = config['output']['results_file']
 
 
+# Judge score as a number, None if it is missing or not a number (the "Error" fallback of the single-item judge)
+def judge_score_value(judge_score):
+    try:
+        return float(judge_score)
+    except (TypeError, ValueError):
+        return None
+
+
 # Score handlers
-def handle_qa_score(question, actual_answer, predicted_answer):
-    if predicted_answer.lower() == 'long answer' or 'error' in predicted_answer.lower():
-        return 0
-    
-    score = (0.25 * int(float(get_evaluation_score(question, actual_answer, predicted_answer)))) \
-            + calculate_bleu_score(actual_answer, predicted_answer) \
-            + calculate_rouge_score(actual_answer, predicted_answer) \
-            + calculate_levenshtein_score(actual_answer, predicted_answer)
-    return score
-
-def handle_context_qa_score(question, context, actual_answer, predicted_answer):
-    if predicted_answer.lower() == 'long answer' or 'error' in predicted_answer.lower():
-        return 0
-
-    score = (0.25 * int(float(get_evaluation_score_context(question, actual_answer, predicted_answer)))) \
-            + calculate_bleu_score(actual_answer, predicted_answer) \
-            + calculate_rouge_score(actual_answer, predicted_answer) \
-            + calculate_levenshtein_score(actual_answer, predicted_answer)
-    return score
-
-def handle_multiple_choice_score(actual_answer, predicted_answer, benchmark_type, model_name):
+def handle_multiple_choice_score(actual_answer, predicted_answer, benchmark_type, model_name, writer=None):
     # return compare_answers(actual_answer=actual_answer, predicted_answer=predicted_answer)
-    return compare_answers_and_save(actual_answer=actual_answer, predicted_answer=predicted_answer, benchmark_type=benchmark_type, model_name=model_name)
+    return compare_answers_and_save(actual_answer=actual_answer, predicted_answer=predicted_answer, benchmark_type=benchmark_type, model_name=model_name, writer=writer)
 
-def handle_topic_classification_score(correct_topic, predicted_topic, benchmark_type, model_name):
+def handle_topic_classification_score(correct_topic, predicted_topic, benchmark_type, model_name, writer=None):
     # return compare_answers(actual_answer=correct_topic, predicted_answer=predicted_topic)
-    return compare_answers_and_save(actual_answer=correct_topic, predicted_answer=predicted_topic, benchmark_type=benchmark_type, model_name=model_name)
+    return compare_answers_and_save(actual_answer=correct_topic, predicted_answer=predicted_topic, benchmark_type=benchmark_type, model_name=model_name, writer=writer)
 
-def handle_arc_score(correct_answer, predicted_option, benchmark_type, model_name):
+def handle_arc_score(correct_answer, predicted_option, benchmark_type, model_name, writer=None):
     # return compare_answers(actual_answer=correct_answer, predicted_answer=predicted_option)
-    return compare_answers_and_save(actual_answer=correct_answer, predicted_answer=predicted_option, benchmark_type=benchmark_type, model_name=model_name)
+    return compare_answers_and_save(actual_answer=correct_answer, predicted_answer=predicted_option, benchmark_type=benchmark_type, model_name=model_name, writer=writer)
+
+
+# QA/ContextQA scores of every row: (score, judge telemetry) in row order
+# Rows are split into tiers first (tiered_scoring.py), only the judge tier is sent to the LLM judge,
+# in batches of judge.batch_size (batch_judge.py). The tier of every row is written to {benchmark}_{model}_judge_scores.csv,
+# or appended to the details list if one is given (rows scored in several chunks)
+# cache_only: judge scores come from the judge cache only, judge-tier rows without one score None (no judge request)
+# Judge-tier rows whose judge score is not a number (e.g. "Error") score None as well, they are left out of the averages
+def score_qa_rows(predictions_df, lexical_scores, single_judge, benchmark_type, model_name, details=None, cache_only=False):
+    tiers = []
+    judge_scores = []
+    positions = []
+    items = []
+    for position, (index, row) in enumerate(predictions_df.iterrows()):
+        tier, judge_score = assign_tier(row['Predicted Answer'], lexical_scores[position], row['Correct Answer'])
+        tiers.append(tier)
+        judge_scores.append(judge_score)
+        if tier == TIER_JUDGE:
+            positions.append(position)
+            items.append((index, row['Question'], row['Correct Answer'], row['Predicted Answer']))
+
+    if cache_only:
+        judge_results = [(judge_score, None) for judge_score in cached_judge_scores(items, JUDGE_PROMPT_VERSIONS[benchmark_type])]
+    else:
+        judge_results = judge_in_batches(items, single_judge)
+    telemetries = [None] * len(predictions_df)
+    for position, (judge_score, telemetry) in zip(positions, judge_results):
+        judge_scores[position] = judge_score
+        telemetries[position] = telemetry
+
+    judge_values = [judge_score_value(judge_score) for judge_score in judge_scores]
+    invalid = sum(judge_score is not None and value is None for judge_score, value in zip(judge_scores, judge_values))
+    if invalid:
+        print(f"{benchmark_type}/{model_name}: {invalid} judge scores are not numbers (e.g. \"Error\"), rows left out")
+    scores = [0 if tier == TIER_RULE else None if value is None else (0.25 * int(value)) + lexical_score
+              for tier, value, lexical_score in zip(tiers, judge_values, lexical_scores)]
+
+    rows_details = pd.DataFrame({'Actual Answer': predictions_df['Correct Answer'], 'Predicted Answer': predictions_df['Predicted Answer'],
+                                 'Lexical': lexical_scores, 'Judge Score': judge_scores, 'Score': scores, 'Tier': tiers},
+                                index=predictions_df.index)
+    if details is None:
+        write_qa_details(rows_details, benchmark_type, model_name)
+    else:
+        details.append(rows_details)
+    return list(zip(scores, telemetries))
+
+
+# Tier counts and {benchmark}_{model}_judge_scores.csv of the scored QA/ContextQA rows
+def write_qa_details(details_df, benchmark_type, model_name):
+    tier_stats.add(model_name, benchmark_type, list(details_df['Tier']))
+    details_df.to_csv(f"{benchmark_type}_{model_name}_judge_scores.csv", encoding='utf-8-sig')
+
+
+# QA/ContextQA scores of the rows, in chunks of sequential.chunk_size when an estimate is given
+# (the lexical metrics and judge batches run per chunk, scoring stops once the estimate's interval is narrow enough)
+def score_qa_benchmark(predictions_df, single_judge, benchmark_type, model_name, estimate=None):
+    scores = []
+    details = []
+    chunk_size = SEQUENTIAL_CHUNK_SIZE if estimate is not None else max(1, len(predictions_df))
+    for start in range(0, len(predictions_df), chunk_size):
+        chunk = predictions_df.iloc[start:start + chunk_size]
+        lexical = calculate_lexical_scores(chunk['Correct Answer'], chunk['Predicted Answer'])
+        results = score_qa_rows(chunk, list(lexical['lexical']), single_judge, benchmark_type, model_name, details=details)
+        chunk_scores = store_judge_telemetry(results, chunk.index, benchmark_type, model_name)
+        scores.extend(chunk_scores)
+        if estimate is not None:
+            estimate.add(chunk_scores)
+            if estimate.done():
+                break
+    if details:
+        write_qa_details(pd.concat(details), benchmark_type, model_name)
+    return scores
+
+
+# Single-item judge prompt version per benchmark type (part of the judge cache key)
+JUDGE_PROMPT_VERSIONS = {"QA": QA_JUDGE_PROMPT_VERSION, "ContextQA": CONTEXT_JUDGE_PROMPT_VERSION}
+
+
+# Column of the predicted value per benchmark type
+PREDICTED_COLUMNS = {"QA": 'Predicted Answer', "ContextQA": 'Predicted Answer', "Arzuman": 'Predicted Option',
+                     "Reshad": 'Predicted Topic', "ARC": 'Predicted Option'}
+
+
+# Scores of stored prediction rows without writing score files (step 1 sequential estimate, anchor selection)
+# QA/ContextQA judge scores land in the judge cache, step 2 reuses them; with cache_only no judge request is sent
+# and the rows without a cached judge score get None
+def estimate_row_scores(predictions_df, benchmark_type, model_name, cache_only=False):
+    if predictions_df.empty:
+        return []
+    if benchmark_type in ("QA", "ContextQA"):
+        single_judge = get_evaluation_score if benchmark_type == "QA" else get_evaluation_score_context
+        lexical = calculate_lexical_scores(predictions_df['Correct Answer'], predictions_df['Predicted Answer'])
+        results = score_qa_rows(predictions_df, list(lexical['lexical']), single_judge, benchmark_type, model_name,
+                                details=[], cache_only=cache_only)
+        return [score for score, telemetry in results]
+    predicted_column = PREDICTED_COLUMNS[benchmark_type]
+    return [compare_answers(actual_answer=row['Correct Answer'], predicted_answer=row[predicted_column])
+            for index, row in predictions_df.iterrows()]
+
+
+# Keep the judge telemetry next to the predictions of each row, returns the scores
+def store_judge_telemetry(results, row_ids, benchmark_type, model_name):
+    store = get_prediction_store()
+    for row_id, (score, telemetry) in zip(row_ids, results):
+        store.put_telemetry(benchmark_type, model_name, row_id, 'judge', telemetry)
+    store.flush()
+    return [score for score, telemetry in results]
 
 
 # Calculate Scores Function with Error Handling
-def calculate_scores(predictions_file, benchmark_type, model_name):
+# sequential: rows in the seeded order, stop once the confidence interval of the mean is narrow enough (sequential_eval.py)
+# mode tiny: only the anchor rows are scored, returns the estimated full-dataset score (tiny_benchmark.py)
+def calculate_scores(predictions_file, benchmark_type, model_name, sequential=SEQUENTIAL_ENABLED, mode=RUN_MODE):
     scores = []
+    writer = None
+    estimate = None
     try:
-        predictions_df = pd.read_excel(predictions_file)
+        predictions_df = load_predictions(predictions_file, benchmark_type, model_name)
+        if mode == TINY:
+            predictions_df = dataset_rows(predictions_df, benchmark_type, mode)
+        elif sequential:
+            predictions_df = sequential_order(predictions_df)
+            estimate = SequentialEstimate(benchmark_type)
+
+        def enough(score):
+            if estimate is None:
+                return False
+            estimate.add([score])
+            return estimate.done()
 
+        # QA and ContextQA: lexical metrics in one batch, tiered scoring, batched judge calls in parallel (results in row order)
         if benchmark_type == "QA":
-            for index, row in predictions_df.iterrows():
-                score = handle_qa_score(row['Question'], row['Correct Answer'], row['Predicted Answer'])
-                scores.append(score)
+            scores = score_qa_benchmark(predictions_df, get_evaluation_score, benchmark_type, model_name, estimate)
 
         elif benchmark_type == "ContextQA":
-            for index, row in predictions_df.iterrows():
-                score = handle_context_qa_score(row['Question'], row['Context'], row['Correct Answer'], row['Predicted Answer'])
-                scores.append(score)
+            scores = score_qa_benchmark(predictions_df, get_evaluation_score_context, benchmark_type, model_name, estimate)
 
         elif benchmark_type == "Arzuman":
+            writer = ScoreFileWriter(benchmark_type, model_name)
             for index, row in predictions_df.iterrows():
-                score = handle_multiple_choice_score(row['Correct Answer'], row['Predicted Option'], benchmark_type, model_name)
+                score = handle_multiple_choice_score(row['Correct Answer'], row['Predicted Option'], benchmark_type, model_name, writer)
                 scores.append(score)
+                if enough(score):
+                    break
 
         elif benchmark_type == "Reshad":
+            writer = ScoreFileWriter(benchmark_type, model_name)
             for index, row in predictions_df.iterrows():
-                score = handle_topic_classification_score(row['Correct Answer'], row['Predicted Topic'], benchmark_type, model_name)
+                score = handle_topic_classification_score(row['Correct Answer'], row['Predicted Topic'], benchmark_type, model_name, writer)
                 scores.append(score)
+                if enough(score):
+                    break
 
         elif benchmark_type == "ARC":
+            writer = ScoreFileWriter(benchmark_type, model_name)
             for index, row in predictions_df.iterrows():
-                score = handle_arc_score(row['Correct Answer'], row['Predicted Option'], benchmark_type, model_name)
+                score = handle_arc_score(row['Correct Answer'], row['Predicted Option'], benchmark_type, model_name, writer)
                 scores.append(score)
+                if enough(score):
+                    break
 
-        # Calculate and return average score
-        if scores:
-            return sum(scores) / len(scores)
+        if estimate is not None:
+            sequential_results.record(model_name, benchmark_type, estimate, len(predictions_df))
+            print(f"Sequential {model_name}/{benchmark_type}: {estimate.describe()} of {len(predictions_df)} rows")
+
+        # Calculate and return average score (rows are scored in predictions_df order)
+        # QA/ContextQA rows without a judge score (None) are left out
+        scored = [score for score in scores if score is not None]
+        if len(scored) < len(scores):
+            print(f"{model_name}/{benchmark_type}: {len(scores) - len(scored)} of {len(scores)} rows have no score, left out of the average")
+        if scores and mode == TINY:
+            return tiny_score(model_name, benchmark_type, predictions_df.index[:len(scores)], scores)
+        elif scored:
+            return sum(scored) / len(scored)
         else:
             return 0
 
@@ -96,15 +234,20 @@ def calculate_scores(predictions_file, benchmark_type, model_name):
         print(f"Error occurred while calculating scores: {str(e)}")
         traceback.print_exc() 
 
+    finally:
+        # Write the buffered per-row match records of the MC/TC/ARC benchmarks
+        if writer is not None:
+            writer.close()
+
 
 # Main function to get scores based on stored answers with error handling
-def run_benchmark_get_scores(model_name, benchmark_type):
+def run_benchmark_get_scores(model_name, benchmark_type, sequential=SEQUENTIAL_ENABLED, mode=RUN_MODE):
     try:
         print('run benchmark get scores started')
         predictions_file = f"{benchmark_type}_{model_name}_predictions.xlsx"
 
         # average_score = calculate_scores(predictions_file, benchmark_type)
-        average_score = calculate_scores(predictions_file, benchmark_type, model_name) # v2
+        average_score = calculate_scores(predictions_file, benchmark_type, model_name, sequential=sequential, mode=mode) # v2
 
         if average_score is not None:
             print(f"Average Score for {model_name} on {benchmark_type}: {average_score}")
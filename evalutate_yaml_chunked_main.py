@@ -1,6 +1,7 @@
 # import random
 # import os
 import yaml
+import argparse
 
 # from typing import List
 import pandas as pd
@@ -15,13 +16,30 @@ import traceback
 # from qa_quality import get_answer_from_local_ollama
 # from qa_quality import get_evaluation_score, calculate_rouge_score, calculate_bleu_score, calculate_levenshtein_score
 
-from evalutate_yaml_chunked_get_answers import run_benchmark_store_answers
-from evalutate_yaml_chunked_get_scores import run_benchmark_get_scores
+from evalutate_yaml_chunked_get_answers import run_benchmark_store_answers, store_predictions, export_predictions
+from evalutate_yaml_chunked_get_scores import run_benchmark_get_scores, estimate_row_scores
+
+from result_cache import judge_cache
+
+from dataset_loader import load_datasets
+from run_planner import run_model_major
+from prediction_store import get_prediction_store, ROW_STATES, ERROR, LONG, EXPORT_EXCEL
+from telemetry import summarize_telemetry
+from resilience import endpoint_stats
+from tiered_scoring import tier_stats
+from judge_cascade import cascade_stats
+from sequential_eval import (SequentialEstimate, sequential_order, sequential_results, SEQUENTIAL_ENABLED,
+                             SEQUENTIAL_CHUNK_SIZE)
+from tiny_benchmark import dataset_rows, tiny_results, RUN_MODE, RUN_MODES, TINY
 
 
 
 """
     This code serves as the main file for chunked execution, obtaining answers separately and evaluating scores separately, as well as for storing answers, scores, and etc.
+        python evalutate_yaml_chunked_main.py [--step 1|2|both] [--sequential]   --sequential: stop each model/benchmark once its confidence interval is narrow enough
+        python evalutate_yaml_chunked_main.py --mode tiny                        anchor rows only (python anchor_selection.py), estimated full-dataset scores
+        python evalutate_yaml_chunked_main.py --repair [--model M] [--benchmark B] [--states error long]   regenerate failed rows only
+        python evalutate_yaml_chunked_main.py --status                                                     row status index per model/benchmark
 """
 
 
@@ -46,28 +64,81 @@ def get_benchmark_from_filename(filename, metadata):
 
 
 # Call this function to run Step 1: Get answers (predictions) and store them in Excel
-def run_step_1_store_answers():
-    print("Running Step 1: Store Answers")
-
-    for file in dataset_files:
+# models/benchmarks restrict the run; with repair_states only the stored rows in those states are regenerated
+# sequential: rows are generated in the seeded order, chunk by chunk, until the confidence interval is narrow enough
+# mode: full (every row, up to run.limit_rows) or tiny (only the anchor rows of tiny_benchmark.anchors_path)
+def run_step_1_store_answers(models=None, benchmarks=None, repair_states=None, sequential=SEQUENTIAL_ENABLED, mode=RUN_MODE):
+    print("Running Step 1: Store Answers" + (f" (repair: {', '.join(repair_states)})" if repair_states else ""))
+
+    models = [model for model in metadata['supported_models'] if not models or model in models]
+    files = [file for file in dataset_files if not benchmarks or get_benchmark_from_filename(file, metadata) in benchmarks]
+    if repair_states:
+        # Only load the models that have rows to repair
+        store = get_prediction_store()
+        models = [model for model in models
+                  if any(store.status_row_ids(get_benchmark_from_filename(file, metadata), model, repair_states) for file in files)]
+        if not models:
+            print("Nothing to repair")
+            return
+
+    # Parsed once, then served from the Arrow dataset cache
+    datasets = load_datasets(files, {file: get_benchmark_from_filename(file, metadata) for file in files})
+
+    def store_answers(model_name, file):
         benchmark_type = get_benchmark_from_filename(file, metadata)
-        df = pd.read_excel(file)
 
-        # Limit for testing (Optional)
-        df = df[:2]
-
-        for model_name in metadata['supported_models']:
-            print(f"Storing answers for {benchmark_type} benchmark with model {model_name}")
-            try:
-                run_benchmark_store_answers(model_name, benchmark_type, df)
-            except Exception as e:
-                print(f"Error during answer storage: {str(e)}")
-                traceback.print_exc()
+        print(f"Storing answers for {benchmark_type} benchmark with model {model_name}")
+        try:
+            df = dataset_rows(datasets[file], benchmark_type, mode)
+            if sequential and not repair_states and mode != TINY:
+                store_answers_sequential(model_name, benchmark_type, df)
+            else:
+                run_benchmark_store_answers(model_name, benchmark_type, df, repair_states=repair_states)
+        except Exception as e:
+            print(f"Error during answer storage: {str(e)}")
+            traceback.print_exc()
+
+    # Model-major: each model is loaded once and answers every dataset before the next one
+    run_model_major(models, files, store_answers)
+    print_endpoint_stats()
+
+
+# Step 1 in sequential mode: generate the rows of the seeded order in chunks of sequential.chunk_size, score each chunk
+# (QA judge scores are cached for step 2) and stop once the confidence interval of the mean is narrow enough
+def store_answers_sequential(model_name, benchmark_type, df):
+    store = get_prediction_store()
+    estimate = SequentialEstimate(benchmark_type)
+    ordered = sequential_order(df)
+    for start in range(0, len(ordered), SEQUENTIAL_CHUNK_SIZE):
+        chunk = ordered.iloc[start:start + SEQUENTIAL_CHUNK_SIZE]
+        store_predictions(chunk, benchmark_type, model_name, export_excel=False)
+        stored_df = store.to_frame(benchmark_type, model_name)
+        estimate.add(estimate_row_scores(stored_df.loc[stored_df.index.intersection(chunk.index)], benchmark_type, model_name))
+        print(f"Sequential {model_name}/{benchmark_type}: {estimate.describe()}")
+        if estimate.done():
+            break
+    print(f"Sequential {model_name}/{benchmark_type}: stopped after {estimate.n} of {len(df)} rows")
+    if EXPORT_EXCEL:
+        export_predictions(store, benchmark_type, model_name)
+
+
+# Row counts per status (and retries) of every model/benchmark in the prediction store
+def print_row_status():
+    status_df = get_prediction_store().status_frame()
+    if status_df.empty:
+        print("The status index is empty")
+        return
+    counts = status_df.pivot_table(index=['model', 'benchmark'], columns='status', values='row_id', aggfunc='count', fill_value=0)
+    counts = counts.reindex(columns=list(ROW_STATES), fill_value=0)
+    counts['retries'] = status_df.groupby(['model', 'benchmark'])['retries'].sum()
+    print(counts)
 
 
 # Call this function to run Step 2: Calculate scores from the stored Excel files
-def run_step_2_calculate_scores():
-    print("Running Step 2: Calculate Scores")
+# sequential: score each model/benchmark in the seeded row order until its confidence interval is narrow enough
+# mode tiny: score the anchor rows only and report estimated full-dataset scores with error bars
+def run_step_2_calculate_scores(sequential=SEQUENTIAL_ENABLED, mode=RUN_MODE):
+    print("Running Step 2: Calculate Scores" + (" (sequential)" if sequential and mode != TINY else "") + (" (tiny)" if mode == TINY else ""))
 
     results = pd.DataFrame(columns=metadata['benchmark_types'].keys(), index=metadata['supported_models'])
 
@@ -75,17 +146,52 @@ def run_step_2_calculate_scores():
         for benchmark_type in metadata['benchmark_types'].keys():
             try:
                 print(f"Running Calculate Scores for model: {model_name}, benchmark: {benchmark_type} ")
-                average_score = run_benchmark_get_scores(model_name, benchmark_type)
+                average_score = run_benchmark_get_scores(model_name, benchmark_type, sequential=sequential, mode=mode)
                 results.loc[model_name, benchmark_type] = average_score
             except Exception as e:
                 print(f"Error during score calculation: {str(e)}")
                 traceback.print_exc()
 
-    # Save the results after calculating all scores
+    # Save the results after calculating all scores, with the p50/p95 request telemetry per model/benchmark
     print("\nAverage Scores:\n", results)
-    results.to_excel(results_file)
+    telemetry_summary = summarize_telemetry(get_prediction_store().telemetry_frame())
+    tier_summary = tier_stats.summary()
+    cascade_summary = cascade_stats.summary()
+    sequential_summary = sequential_results.summary()
+    tiny_summary = tiny_results.summary()
+    with pd.ExcelWriter(results_file) as excel_writer:
+        results.to_excel(excel_writer, sheet_name='Sheet1')
+        if not telemetry_summary.empty:
+            telemetry_summary.to_excel(excel_writer, sheet_name='Telemetry')
+        if not tier_summary.empty:
+            tier_summary.to_excel(excel_writer, sheet_name='Scoring tiers')
+        if not cascade_summary.empty:
+            cascade_summary.to_excel(excel_writer, sheet_name='Judge cascade')
+        if not sequential_summary.empty:
+            sequential_summary.to_excel(excel_writer, sheet_name='Sequential')
+        if not tiny_summary.empty:
+            tiny_summary.to_excel(excel_writer, sheet_name='Tiny estimates')
     print(f"Results saved to {results_file}")
 
+    # Judge cache effectiveness (every hit is a 405B call saved)
+    print(f"Judge cache: {judge_cache.hits} hits, {judge_cache.misses} misses")
+    if not tier_summary.empty:
+        print(f"\nScoring tiers (judge calls saved by the lexical tiers):\n{tier_summary}")
+    if not cascade_summary.empty:
+        print(f"\nJudge cascade (8B decisions and 8B/405B agreement):\n{cascade_summary}")
+    if not sequential_summary.empty:
+        print(f"\nSequential evaluation (rows used and confidence interval):\n{sequential_summary}")
+    if not tiny_summary.empty:
+        print(f"\nTiny benchmark (estimated full-dataset scores from the anchor rows):\n{tiny_summary}")
+    print_endpoint_stats()
+
+
+# Retries, circuit breaker state and concurrency limit of every remote endpoint used by this run
+def print_endpoint_stats():
+    stats = endpoint_stats()
+    if stats:
+        print("\nEndpoints:\n", pd.DataFrame(stats).to_string(index=False))
+
 
 # Combine both steps in one function call
 def run_both_steps():
@@ -100,4 +206,24 @@ def run_both_steps():
 
 # Main function to trigger both steps
 if __name__ == '__main__':
-    run_both_steps()
+    parser = argparse.ArgumentParser(description="Chunked evaluation: step 1 stores answers, step 2 calculates scores")
+    parser.add_argument('--step', choices=['1', '2', 'both'], default='both')
+    parser.add_argument('--repair', action='store_true', help="step 1 regenerates only the stored rows in --states")
+    parser.add_argument('--states', nargs='+', choices=[ERROR, LONG], default=[ERROR], help="row states to repair")
+    parser.add_argument('--model', action='append', help="only this model (repeatable)")
+    parser.add_argument('--benchmark', action='append', help="only this benchmark type (repeatable)")
+    parser.add_argument('--status', action='store_true', help="print the row status index and exit")
+    parser.add_argument('--sequential', action='store_true', default=SEQUENTIAL_ENABLED,
+                        help="seeded row order, stop once the confidence interval is narrower than the target width")
+    parser.add_argument('--mode', choices=RUN_MODES, default=RUN_MODE,
+                        help="full: every row (up to run.limit_rows); tiny: anchor rows only, estimated full-dataset scores")
+    args = parser.parse_args()
+
+    if args.status:
+        print_row_status()
+    else:
+        if args.step in ('1', 'both'):
+            run_step_1_store_answers(args.model, args.benchmark, repair_states=args.states if args.repair else None,
+                                     sequential=args.sequential, mode=args.mode)
+        if args.step in ('2', 'both'):
+            run_step_2_calculate_scores(sequential=args.sequential, mode=args.mode)
@@ -0,0 +1,317 @@
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from base import CONFIG
+
+
+"""
+    Local stand-in for Ollama and the OpenAI-compatible judge endpoint, for load-testing the pipelines without a GPU,
+    the Azerbaijani models or an NVIDIA key. One HTTP server (stdlib only) serves:
+        POST /api/chat              Ollama chat, NDJSON streaming or not, model load/unload simulated through keep_alive
+        GET  /api/tags              Ollama model list (with digests, used by the generation cache)
+        GET  /api/ps                Ollama loaded models (used by the pool health checks)
+        POST /v1/chat/completions   OpenAI chat completions (judge scores)
+    Latency distribution, tokens/sec, error rates and canned answers come from the fake_servers section of config.yaml.
+    Point the clients at it with endpoints.ollama_host / endpoints.judge_base_url, then run:
+        python fake_servers.py
+"""
+
+
+FAKE_SERVER_CONFIG = CONFIG.get('fake_servers') or {}
+
+DEFAULT_SETTINGS = {
+    'host': "127.0.0.1",
+    'port': 11500,
+    'models': None,  # None = every model is accepted, /api/tags lists metadata.supported_models
+    'parallel': 4,  # Ollama requests processed at once (OLLAMA_NUM_PARALLEL), the others queue
+    'load_ms': 2000,  # cold model load, paid by the first request after a model is unloaded
+    'tokens_per_sec': 25,
+    'latency': {'distribution': 'lognormal', 'median_ms': 150, 'sigma': 0.5},  # time to first token / judge latency
+    'error_rate': 0.0,  # fraction of requests answered with HTTP 500
+    'rate_limit_rate': 0.0,  # fraction of judge requests answered with HTTP 429 + Retry-After
+    'retry_after_s': 1,
+    'seed': None,
+    'answers': {
+        'qa': ["Bu sualın cavabı kontekstdə verilmiş məlumata əsaslanır."],
+        'option': ["A", "B", "C", "D"],
+        'judge': ["65", "80", "95"],
+    },
+}
+
+
+def _settings(overrides: dict = None) -> dict:
+    settings = dict(DEFAULT_SETTINGS)
+    for source in (FAKE_SERVER_CONFIG, overrides or {}):
+        for key, value in source.items():
+            if value is not None:
+                settings[key] = {**settings[key], **value} if isinstance(settings.get(key), dict) else value
+    if not settings['models']:
+        settings['models'] = list((CONFIG.get('metadata') or {}).get('supported_models') or [])
+    return settings
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _digest(model: str) -> str:
+    # Stable, and never equal to a real model digest (keeps fake answers out of real cache entries)
+    return hashlib.sha256(f"fake:{model}".encode()).hexdigest()
+
+
+class FakeBackend:
+    """
+    Simulated server state: resident models, the Ollama request slots and the random answer/latency source.
+    """
+
+    def __init__(self, settings: dict):
+        self.settings = settings
+        self.rng = random.Random(settings['seed'])
+        self.slots = threading.Semaphore(max(1, int(settings['parallel'])))
+        self.resident = set()
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def latency(self) -> float:
+        """
+        One draw of the configured latency distribution, in seconds.
+        fixed: median_ms; uniform: min_ms..max_ms; lognormal: median_ms, sigma; exponential: mean_ms.
+        """
+        latency = self.settings['latency']
+        distribution = latency.get('distribution', 'fixed')
+        if distribution == 'uniform':
+            value = self.rng.uniform(latency.get('min_ms', 0), latency.get('max_ms', 0))
+        elif distribution == 'lognormal':
+            value = self.rng.lognormvariate(0, latency.get('sigma', 0.5)) * latency.get('median_ms', 0)
+        elif distribution == 'exponential':
+            value = self.rng.expovariate(1 / latency['mean_ms']) if latency.get('mean_ms') else 0
+        else:
+            value = latency.get('median_ms', 0)
+        return max(0.0, value) / 1000
+
+    def fails(self, rate_key: str) -> bool:
+        return self.rng.random() < float(self.settings.get(rate_key) or 0)
+
+    def load(self, model: str, keep_alive) -> float:
+        """
+        Make the model resident (or unload it for keep_alive=0). Returns the simulated load time in seconds.
+        """
+        with self.lock:
+            self.requests += 1
+            if keep_alive in (0, "0", "0s", "0m"):
+                self.resident.discard(model)
+                return 0.0
+            if model in self.resident:
+                return 0.0
+            self.resident.add(model)
+        load_seconds = self.settings['load_ms'] / 1000
+        time.sleep(load_seconds)
+        return load_seconds
+
+    def chat_answer(self, messages: list, response_format) -> str:
+        """
+        Canned reply: an option letter for multiple-choice prompts (JSON for constrained ones), a QA answer otherwise.
+        """
+        answers = self.settings['answers']
+        if isinstance(response_format, dict):
+            letters = (((response_format.get('properties') or {}).get('answer') or {}).get('enum')) or ["A"]
+            option = self.rng.choice(answers['option'])
+            return json.dumps({'answer': option if option in letters else letters[0]})
+        prompt = messages[-1].get('content', '') if messages else ''
+        if re.search(r'(^|\n)\s*B\)', prompt):
+            return self.rng.choice(answers['option'])
+        return self.rng.choice(answers['qa'])
+
+    def judge_answer(self, messages: list) -> str:
+        """
+        Canned score, or a JSON array of scores for a batched judge prompt (one per "### Item <id>" block).
+        """
+        prompt = messages[-1].get('content', '') if messages else ''
+        item_ids = [item_id for item_id in re.findall(r'^### Item (\S+)$', prompt, re.MULTILINE) if item_id != 'example']
+        if item_ids:
+            return json.dumps([{'id': item_id, 'score': int(self.rng.choice(self.settings['answers']['judge']))}
+                               for item_id in item_ids])
+        return self.rng.choice(self.settings['answers']['judge'])
+
+
+def _tokens(text: str) -> list:
+    # Words with their trailing spaces, roughly one Ollama token each
+    return re.findall(r'\S+\s*|\s+', text) or ['']
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    backend = None  # set by make_server
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, str(value))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/api/tags':
+            models = [{'name': model, 'model': model, 'digest': _digest(model), 'size': 0, 'modified_at': _now()}
+                      for model in self.backend.settings['models']]
+            return self._send_json(200, {'models': models})
+        if self.path.rstrip('/') == '/api/ps':
+            with self.backend.lock:
+                resident = sorted(self.backend.resident)
+            models = [{'name': model, 'model': model, 'digest': _digest(model), 'size': 0, 'expires_at': _now()}
+                      for model in resident]
+            return self._send_json(200, {'models': models})
+        if self.path.rstrip('/') in ('', '/api/version'):
+            return self._send_json(200, {'version': "fake"})
+        self._send_json(404, {'error': f"unknown path {self.path}"})
+
+    def do_POST(self):
+        try:
+            body = self._read_json()
+        except ValueError:
+            return self._send_json(400, {'error': "invalid JSON body"})
+        if self.path.rstrip('/') == '/api/chat':
+            return self._ollama_chat(body)
+        if self.path.rstrip('/') == '/v1/chat/completions':
+            return self._openai_chat(body)
+        self._send_json(404, {'error': f"unknown path {self.path}"})
+
+    def _ollama_chat(self, body: dict):
+        backend = self.backend
+        model = body.get('model', '')
+        models = backend.settings['models']
+        if models and model not in models and model.split(':')[0] not in models:
+            return self._send_json(404, {'error': f"model \"{model}\" not found, try pulling it first"})
+
+        with backend.slots:
+            started_at = time.perf_counter()
+            load_seconds = backend.load(model, body.get('keep_alive'))
+            messages = body.get('messages') or []
+            if not messages:
+                # Preload / unload request
+                done_reason = 'unload' if body.get('keep_alive') in (0, "0", "0s", "0m") else 'load'
+                return self._send_json(200, {'model': model, 'created_at': _now(), 'done': True, 'done_reason': done_reason,
+                                             'message': {'role': 'assistant', 'content': ''}})
+            if backend.fails('error_rate'):
+                return self._send_json(500, {'error': "simulated server error"})
+
+            prompt_seconds = backend.latency()
+            time.sleep(prompt_seconds)
+            tokens = _tokens(backend.chat_answer(messages, body.get('format')))
+            num_predict = (body.get('options') or {}).get('num_predict')
+            if num_predict:
+                tokens = tokens[:num_predict]
+            token_seconds = 1 / max(float(backend.settings['tokens_per_sec']), 1e-6)
+            prompt_eval_count = sum(len(message.get('content', '')) for message in messages) // 4
+
+            def final_chunk(content):
+                eval_seconds = token_seconds * len(tokens)
+                return {
+                    'model': model, 'created_at': _now(), 'message': {'role': 'assistant', 'content': content},
+                    'done': True, 'done_reason': 'stop',
+                    'total_duration': int((time.perf_counter() - started_at) * 1e9),
+                    'load_duration': int(load_seconds * 1e9),
+                    'prompt_eval_count': prompt_eval_count, 'prompt_eval_duration': int(prompt_seconds * 1e9),
+                    'eval_count': len(tokens), 'eval_duration': int(eval_seconds * 1e9),
+                }
+
+            if body.get('stream', True) is False:
+                time.sleep(token_seconds * len(tokens))
+                return self._send_json(200, final_chunk(''.join(tokens)))
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            try:
+                for token in tokens:
+                    self._write_chunk({'model': model, 'created_at': _now(), 'done': False,
+                                       'message': {'role': 'assistant', 'content': token}})
+                    time.sleep(token_seconds)
+                self._write_chunk(final_chunk(''))
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # The client stopped reading (early abort of the stream)
+                self.close_connection = True
+
+    def _write_chunk(self, chunk: dict):
+        data = json.dumps(chunk, ensure_ascii=False).encode() + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _openai_chat(self, body: dict):
+        backend = self.backend
+        with backend.lock:
+            backend.requests += 1
+        if backend.fails('rate_limit_rate'):
+            return self._send_json(429, {'error': {'message': "simulated rate limit", 'type': 'rate_limit_exceeded'}},
+                                   headers={'Retry-After': backend.settings['retry_after_s']})
+        if backend.fails('error_rate'):
+            return self._send_json(500, {'error': {'message': "simulated server error", 'type': 'server_error'}})
+
+        time.sleep(backend.latency())
+        content = backend.judge_answer(body.get('messages') or [])
+        prompt_tokens = sum(len(message.get('content', '')) for message in body.get('messages') or []) // 4
+        completion_tokens = len(_tokens(content))
+        self._send_json(200, {
+            'id': f"chatcmpl-fake-{backend.requests}", 'object': 'chat.completion', 'created': int(time.time()),
+            'model': body.get('model', ''),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens},
+        })
+
+
+def make_server(overrides: dict = None) -> ThreadingHTTPServer:
+    """
+    Create (not start) the fake server; `overrides` replace fake_servers settings of config.yaml.
+    """
+    settings = _settings(overrides)
+    handler = type('ConfiguredFakeHandler', (FakeHandler,), {'backend': FakeBackend(settings)})
+    server = ThreadingHTTPServer((settings['host'], int(settings['port'])), handler)
+    server.daemon_threads = True
+    server.url = f"http://{settings['host']}:{server.server_address[1]}"
+    return server
+
+
+def start_fake_server(overrides: dict = None) -> ThreadingHTTPServer:
+    """
+    Start the fake server in a background thread (port 0 picks a free port, see server.url). Stop it with shutdown().
+    """
+    server = make_server(overrides)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in Ollama / OpenAI-compatible server")
+    parser.add_argument('--host', help="bind address (default fake_servers.host)")
+    parser.add_argument('--port', type=int, help="port (default fake_servers.port)")
+    parser.add_argument('--seed', type=int, help="random seed of answers, latencies and errors")
+    args = parser.parse_args()
+
+    server = make_server({'host': args.host, 'port': args.port, 'seed': args.seed})
+    print(f"Fake Ollama at {server.url} (/api/chat, /api/tags), fake judge at {server.url}/v1 (/chat/completions)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
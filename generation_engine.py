@@ -0,0 +1,135 @@
+import asyncio
+import logging
+
+from base import GENERATION_CONCURRENCY
+from residency import residency
+from resilience import ollama_retries
+from result_cache import generation_cache, generation_cache_key, get_model_digest
+from telemetry import generation_telemetry, cached_telemetry, error_telemetry
+from decoding import StreamCollector, consume_stream, consume_stream_async
+
+
+"""
+    Asyncio generation engine: keeps a fixed number of Ollama requests in flight for one model
+    and returns the predictions in dataset order.
+    generate / generate_async run one streamed chat request of a generation handler (generation cache,
+    retries, telemetry); the sync and async handlers only differ in the client they pass.
+"""
+
+
+def _chat_arguments(model: str, messages: list, options, response_format) -> dict:
+    arguments = {'model': model, 'messages': messages, 'options': options, 'keep_alive': residency.keep_alive,
+                 'stream': True}
+    if response_format is not None:
+        arguments['format'] = response_format
+    return arguments
+
+
+def _store(cache_key, answer, parse):
+    # A new answer is parsed (e.g. a constrained JSON reply) before it is cached
+    if answer and parse is not None:
+        answer = parse(answer)
+    if answer:
+        generation_cache.put(cache_key, answer)
+    return answer
+
+
+def generate(client, model: str, messages: list, options: dict = None, response_format=None, stop_when=None,
+             parse=None):
+    """
+    One streamed chat request, served from the generation cache when possible.
+
+    Args:
+        client: ollama.Client interface (residency.client).
+        model (str): The Ollama model name.
+        messages (list): The chat messages.
+        options (dict): Ollama options (decoding profile).
+        response_format: Ollama `format` (constrained decoding), not sent if None.
+        stop_when (callable): Early stream abort condition (see decoding.StreamCollector).
+        parse (callable): Applied to a new answer before it is cached.
+
+    Returns:
+        tuple: (answer, telemetry); the answer is None if the request failed.
+    """
+    cache_key = generation_cache_key(model, messages, options, response_format)
+    cached_answer = generation_cache.get(cache_key)
+    if cached_answer is not None:
+        return cached_answer, cached_telemetry()
+
+    # Failed requests are retried from scratch, each attempt under the breaker of the host it is sent to
+    def request():
+        collector = StreamCollector(stop_when=stop_when)
+        stream = client.chat(**_chat_arguments(model, messages, options, response_format))
+        return consume_stream(stream, collector), collector
+
+    try:
+        answer, collector = ollama_retries().call(request)
+    except Exception as e:
+        logging.error(f"Request to local Ollama failed: {e}")
+        return None, error_telemetry(e)
+    return _store(cache_key, answer, parse), generation_telemetry(collector)
+
+
+async def generate_async(client, model: str, messages: list, options: dict = None, response_format=None,
+                         stop_when=None, parse=None):
+    """
+    Async variant of generate (client: ollama.AsyncClient interface), used by the generation engine.
+    """
+    # The model digest was resolved before the event loop started, no blocking lookup here
+    cache_key = generation_cache_key(model, messages, options, response_format, lookup_digest=False)
+    cached_answer = generation_cache.get(cache_key)
+    if cached_answer is not None:
+        return cached_answer, cached_telemetry()
+
+    async def request():
+        collector = StreamCollector(stop_when=stop_when)
+        stream = await client.chat(**_chat_arguments(model, messages, options, response_format))
+        return await consume_stream_async(stream, collector), collector
+
+    try:
+        answer, collector = await ollama_retries().call_async(request)
+    except Exception as e:
+        logging.error(f"Request to local Ollama failed: {e}")
+        return None, error_telemetry(e)
+    return _store(cache_key, answer, parse), generation_telemetry(collector)
+
+
+async def _run_jobs(jobs: list, concurrency: int, on_result) -> list:
+    # One async client per run, its connection pools are bound to the running event loop;
+    # it talks to the host(s) where the residency manager keeps the batch model loaded
+    client = residency.async_client()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_job(position, job):
+        async with semaphore:
+            result = await job(client)
+        if on_result is not None:
+            on_result(position, result)
+        return result
+
+    # gather keeps the results in the order of the jobs
+    return await asyncio.gather(*(run_job(position, job) for position, job in enumerate(jobs)))
+
+
+def run_generation_jobs(jobs: list, concurrency: int = None, on_result=None) -> list:
+    """
+    Run generation jobs concurrently and return their results in the order of `jobs`.
+
+    Args:
+        jobs (list): Callables that take an ollama.AsyncClient and return a coroutine (one per dataset row).
+        concurrency (int): Maximum number of requests in flight
+            (default: generation.concurrency per host serving the batch).
+        on_result (callable): Optional on_result(position, result), called as soon as each job finishes
+            (e.g. to persist the row before the whole batch is done).
+
+    Returns:
+        list: The job results, in the same order as `jobs`.
+    """
+    if not jobs:
+        return []
+    if concurrency is None:
+        concurrency = GENERATION_CONCURRENCY * residency.parallel_hosts
+    # The generation cache key needs the model digest: resolve it before the event loop (a blocking HTTP call)
+    if residency.active_model:
+        get_model_digest(residency.active_model)
+    return asyncio.run(_run_jobs(jobs, max(1, concurrency), on_result))
@@ -0,0 +1,149 @@
+import time
+import bisect
+import hashlib
+import threading
+import pandas as pd
+
+from base import JUDGE_CONFIG, MODEL_LLAMA_3_1_405B, MODEL_LLAMA_3_1_8B
+from judge_executor import request_judge, judge_payload, parse_score
+from telemetry import judge_telemetry
+
+
+"""
+    Cascade judge (judge.mode: cascade). The 8B model scores every item first, once per
+    configured temperature; the item is escalated to the 405B only when the 8B scores disagree, land near a rubric
+    band boundary or cannot be parsed. A small deterministic share of the accepted items is also scored by the 405B,
+    and the 8B/405B agreement of every compared item is reported to tune the escalation thresholds.
+"""
+
+
+JUDGE_MODE = JUDGE_CONFIG.get('mode', 'single')
+CASCADE_CONFIG = JUDGE_CONFIG.get('cascade') or {}
+CASCADE_SMALL_MODEL = CASCADE_CONFIG.get('small_model') or MODEL_LLAMA_3_1_8B
+CASCADE_TEMPERATURES = CASCADE_CONFIG.get('temperatures') or [0.0, 0.7]
+CASCADE_MAX_DISAGREEMENT = float(CASCADE_CONFIG.get('max_disagreement', 10))
+CASCADE_BOUNDARY_MARGIN = float(CASCADE_CONFIG.get('boundary_margin', 3))
+CASCADE_AUDIT_RATE = float(CASCADE_CONFIG.get('audit_rate', 0.05))
+
+# Upper edges of the rubric bands 0-10, 11-30, 31-50, 51-70, 71-90, 91-100
+BAND_EDGES = [10.5, 30.5, 50.5, 70.5, 90.5]
+
+# Cascade decisions
+ACCEPTED, UNSTABLE, BOUNDARY, UNPARSED = 'accepted', 'escalated: unstable', 'escalated: boundary', 'escalated: unparsed'
+DECISIONS = (ACCEPTED, UNSTABLE, BOUNDARY, UNPARSED)
+
+TOKEN_FIELDS = ('prompt_tokens', 'completion_tokens', 'total_tokens')
+
+
+def judge_model_key() -> str:
+    """
+    Judge identity used in the judge cache key (cascade scores are cached apart from 405B scores).
+    """
+    if JUDGE_MODE == 'cascade':
+        return f"cascade:{CASCADE_SMALL_MODEL}>{MODEL_LLAMA_3_1_405B}"
+    return MODEL_LLAMA_3_1_405B
+
+
+def band(score: float) -> int:
+    return bisect.bisect_left(BAND_EDGES, score)
+
+
+def near_boundary(score: float, margin: float = CASCADE_BOUNDARY_MARGIN) -> bool:
+    return any(abs(score - edge) <= margin for edge in BAND_EDGES)
+
+
+def is_audited(prompt: str, rate: float = CASCADE_AUDIT_RATE) -> bool:
+    # Deterministic per item, so reruns audit the same items
+    return int(hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:8], 16) / 0xFFFFFFFF < rate
+
+
+class CascadeStats:
+    """
+    Cascade decisions and 8B/405B agreement of the items scored by both models.
+    """
+
+    def __init__(self):
+        self.decisions = {decision: 0 for decision in DECISIONS}
+        self.comparisons = {decision: [] for decision in DECISIONS}  # (8B score, 405B score)
+        self._lock = threading.Lock()
+
+    def record(self, decision: str, small_score=None, large_score=None):
+        with self._lock:
+            self.decisions[decision] += 1
+            if small_score is not None and large_score is not None:
+                self.comparisons[decision].append((small_score, large_score))
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Per decision: items, items compared with the 405B, mean |8B - 405B|, same rubric band (%)
+        and within max_disagreement (%).
+        """
+        with self._lock:
+            if not any(self.decisions.values()):
+                return pd.DataFrame()
+            rows = {}
+            for decision in DECISIONS:
+                pairs = self.comparisons[decision]
+                differences = [abs(small - large) for small, large in pairs]
+                rows[decision] = {
+                    'items': self.decisions[decision],
+                    'compared with 405B': len(pairs),
+                    'mean |8B - 405B|': sum(differences) / len(pairs) if pairs else None,
+                    'same band (%)': 100 * sum(band(small) == band(large) for small, large in pairs) / len(pairs) if pairs else None,
+                    'within max_disagreement (%)': 100 * sum(d <= CASCADE_MAX_DISAGREEMENT for d in differences) / len(pairs) if pairs else None,
+                }
+        return pd.DataFrame.from_dict(rows, orient='index')
+
+
+cascade_stats = CascadeStats()
+
+
+def _combined_telemetry(started_at: float, telemetries: list, decision: str) -> dict:
+    telemetry = judge_telemetry(started_at)
+    telemetry['attempts'] = sum(part['attempts'] for part in telemetries)
+    for field in TOKEN_FIELDS:
+        values = [part[field] for part in telemetries if part[field] is not None]
+        telemetry[field] = sum(values) if values else None
+    telemetry['judge_calls'] = len(telemetries)
+    telemetry['cascade'] = decision
+    return telemetry
+
+
+def cascade_score(prompt: str, max_tokens: int = 50):
+    """
+    Score a single-item judge prompt with the cascade. Returns (score string, telemetry); the score is None if
+    no model gave a valid score.
+    """
+    started_at = time.perf_counter()
+    telemetries = []
+    small_scores = []
+    for temperature in CASCADE_TEMPERATURES:
+        content, telemetry = request_judge(judge_payload(CASCADE_SMALL_MODEL, prompt, temperature, max_tokens))
+        telemetries.append(telemetry)
+        small_scores.append(parse_score(content))
+
+    small_score = None
+    if None in small_scores:
+        decision = UNPARSED
+    else:
+        small_score = sum(small_scores) / len(small_scores)
+        if max(small_scores) - min(small_scores) > CASCADE_MAX_DISAGREEMENT:
+            decision = UNSTABLE
+        elif any(near_boundary(score) for score in small_scores) or len({band(score) for score in small_scores}) > 1:
+            decision = BOUNDARY
+        else:
+            decision = ACCEPTED
+
+    large_score = None
+    if decision != ACCEPTED or is_audited(prompt):
+        content, telemetry = request_judge(judge_payload(MODEL_LLAMA_3_1_405B, prompt, 0.0, max_tokens))
+        telemetries.append(telemetry)
+        large_score = parse_score(content)
+    cascade_stats.record(decision, small_score, large_score)
+
+    if decision == ACCEPTED:
+        score = small_score
+    else:
+        score = large_score if large_score is not None else small_score  # 405B failed: keep the 8B score if any
+    telemetry = _combined_telemetry(started_at, telemetries, decision)
+    return (f"{round(score):d}" if score is not None else None), telemetry
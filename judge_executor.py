@@ -0,0 +1,116 @@
+import re
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from base import client_openai, judge_rate_limiter, JUDGE_WORKERS, MODEL_LLAMA_3_1_405B
+from rate_limiter import estimate_tokens
+from resilience import judge_endpoint, RetryableError
+from result_cache import judge_cache, judge_cache_key
+from telemetry import judge_telemetry, cached_telemetry
+
+
+"""
+    Judge requests and the parallel executor for LLM-judge scoring. Workers share base.judge_rate_limiter,
+    so the throughput is bounded by the provider's quota instead of the serial latency.
+"""
+
+
+def run_judge_jobs(jobs: list, workers: int = JUDGE_WORKERS) -> list:
+    """
+    Run scoring jobs on a thread pool and return their results in row order.
+
+    Args:
+        jobs (list): Zero-argument callables, one per row (e.g. a single-item judge call).
+        workers (int): Number of worker threads.
+
+    Returns:
+        list: The job results, in the same order as `jobs`.
+    """
+    if not jobs:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(lambda job: job(), jobs))
+
+
+def request_judge(payload: dict):
+    """
+    Send one judge request (rate limited, retried by resilience.py).
+    Returns (content, telemetry); content is None if the request failed.
+    """
+    estimated_tokens = estimate_tokens(payload)
+    started_at = time.perf_counter()
+    completion = None
+    attempts = 0
+
+    # Transient failures and empty replies are retried with backoff
+    def request():
+        nonlocal completion, attempts
+        attempts += 1
+        judge_rate_limiter.acquire(estimated_tokens)
+        completion = client_openai.chat.completions.create(**payload)
+        if completion.usage:
+            judge_rate_limiter.settle(estimated_tokens, completion.usage.total_tokens)
+        if not completion.choices:
+            raise RetryableError(f"Unexpected response format: {completion}")
+        content = completion.choices[0].message.content
+        if not content:
+            raise RetryableError("Content in response is None.")
+        return content.strip()
+
+    try:
+        content = judge_endpoint().call(request)
+    except Exception as e:
+        logging.error(f"Request failed: {e}")
+        content = None
+    return content, judge_telemetry(started_at, completion, attempts)
+
+
+def judge_payload(model: str, prompt: str, temperature: float = 0.0, max_tokens: int = 50) -> dict:
+    return {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": temperature,
+        "max_tokens": max_tokens
+    }
+
+
+def parse_score(content):
+    """
+    First number of a judge reply if it is a valid 0-100 score, else None.
+    """
+    match = re.search(r'\d+(?:\.\d+)?', content or '')
+    if not match or not 0 <= float(match.group(0)) <= 100:
+        return None
+    return float(match.group(0))
+
+
+def judge_score(prompt: str, prompt_version: str, question: str, actual_answer: str, predicted_answer: str,
+                max_tokens: int = 50):
+    """
+    Single-item judge score of a (question, actual, predicted) triple, scored only once (judge cache):
+    405B only, or the 8B -> 405B cascade (judge.mode).
+    Returns (score, telemetry); the score is a 0-100 number as a string, "Error" if the reply is not one.
+    """
+    # judge_cascade sends its requests through this module
+    from judge_cascade import cascade_score, judge_model_key, JUDGE_MODE
+
+    cache_key = judge_cache_key(judge_model_key(), prompt_version, question, actual_answer, predicted_answer)
+    cached_score = judge_cache.get(cache_key)
+    if cached_score is not None:
+        return cached_score, cached_telemetry()
+
+    if JUDGE_MODE == 'cascade':
+        content, telemetry = cascade_score(prompt, max_tokens)
+    else:
+        content, telemetry = request_judge(judge_payload(MODEL_LLAMA_3_1_405B, prompt, max_tokens=max_tokens))
+
+    # Only a valid 0-100 number is cached and returned (a reply like "Score: 85" would break int(float(score)))
+    parsed_score = parse_score(content)
+    if parsed_score is None:
+        logging.error(f"Invalid judge reply: {content!r}")
+        return "Error", telemetry
+
+    score = f"{parsed_score:g}"
+    judge_cache.put(cache_key, score)
+    return score, telemetry
@@ -0,0 +1,63 @@
+import os
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from base import CONFIG
+from qa_quality import calculate_bleu_score, calculate_rouge_score, calculate_levenshtein_score
+
+
+"""
+    Batch API for the lexical metrics (BLEU, ROUGE, Levenshtein): scores whole columns of
+    references and predictions at once, spreading large batches across a process pool.
+"""
+
+
+LEXICAL_CONFIG = CONFIG.get('lexical_metrics') or {}
+LEXICAL_PROCESSES = LEXICAL_CONFIG.get('processes') or os.cpu_count() or 1
+LEXICAL_PARALLEL_THRESHOLD = int(LEXICAL_CONFIG.get('parallel_threshold', 2000))
+LEXICAL_COLUMNS = ['bleu', 'rouge', 'levenshtein']
+
+
+def _as_text(value) -> str:
+    return value if isinstance(value, str) else ('' if pd.isna(value) else str(value))
+
+
+def _score_pairs(pairs: list) -> list:
+    # Runs in the worker processes, the ROUGE scorer is built once per process (qa_quality.ROUGE_SCORER)
+    return [
+        (calculate_bleu_score(actual, predicted),
+         calculate_rouge_score(actual, predicted),
+         calculate_levenshtein_score(actual, predicted))
+        for actual, predicted in pairs
+    ]
+
+
+def calculate_lexical_scores(actual_answers, predicted_answers, processes: int = LEXICAL_PROCESSES,
+                             parallel_threshold: int = LEXICAL_PARALLEL_THRESHOLD) -> pd.DataFrame:
+    """
+    Calculate BLEU, ROUGE and Levenshtein scores for whole columns of answers.
+
+    Args:
+        actual_answers (list | pd.Series): Reference answers.
+        predicted_answers (list | pd.Series): Predicted answers (same length).
+        processes (int): Worker processes for batches larger than `parallel_threshold`.
+        parallel_threshold (int): Batches up to this size are scored in the current process.
+
+    Returns:
+        pd.DataFrame: Columns 'bleu', 'rouge', 'levenshtein' (each 0-25, as the per-row functions)
+        and their sum 'lexical', indexed like `actual_answers` if it is a Series.
+    """
+    index = actual_answers.index if isinstance(actual_answers, pd.Series) else None
+    pairs = [(_as_text(actual), _as_text(predicted)) for actual, predicted in zip(actual_answers, predicted_answers)]
+
+    if processes > 1 and len(pairs) > parallel_threshold:
+        chunk_size = -(-len(pairs) // (processes * 4))
+        chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            rows = [row for chunk in executor.map(_score_pairs, chunks) for row in chunk]
+    else:
+        rows = _score_pairs(pairs)
+
+    scores = pd.DataFrame(rows, columns=LEXICAL_COLUMNS, index=index)
+    scores['lexical'] = scores[LEXICAL_COLUMNS].sum(axis=1)
+    return scores
@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import pandas as pd
+
+from qa_quality import create_combined_prompt, calculate_bleu_score, calculate_rouge_score, calculate_levenshtein_score
+from rag import create_combined_prompt_context
+from multiple_choice import create_multiple_options_messages, compare_answers
+from arc_ingest import parse_arc_choices
+
+
+"""
+    Microbenchmarks of the harness's own CPU-side hot paths (no model or judge calls):
+    lexical metrics, answer comparison, prompt construction, ARC choices parsing and Excel/CSV I/O,
+    on rows taken from the input workbooks. Results are written to a JSON baseline and compared across commits:
+
+        python microbenchmarks.py --save benchmarks/baseline.json
+        python microbenchmarks.py --compare benchmarks/baseline.json
+"""
+
+
+INPUT_DIR = "datasets/input_datasets"
+DEFAULT_ROWS = 1000
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 1.2
+
+
+def load_corpus(rows: int) -> dict:
+    """
+    Benchmark inputs from the input workbooks, repeated (in a fixed shuffled order) up to `rows` rows.
+    """
+    rng = random.Random(0)
+
+    def sample(values):
+        values = [value for value in values if isinstance(value, str)]
+        order = list(range(len(values)))
+        rng.shuffle(order)
+        return [values[order[i % len(values)]] for i in range(rows)]
+
+    qa = pd.read_excel(os.path.join(INPUT_DIR, "LLM_BENCH_qa.xlsx"))
+    cqa = pd.read_excel(os.path.join(INPUT_DIR, "Quad_benchmark_cqa.xlsx"))
+    tc = pd.read_excel(os.path.join(INPUT_DIR, "LLM-Benchmark-reshad_tc.xlsx"))
+    arc = pd.read_excel(os.path.join(INPUT_DIR, "arc_translated_mmlu_arc.xlsx"))
+
+    answers = sample(qa['Cavab'])
+    return {
+        'questions': sample(qa['Sual']),
+        'actual': answers,
+        # Another answer of the dataset as the prediction: realistic lengths and partial overlap
+        'predicted': answers[1:] + answers[:1],
+        'contexts': sample(cqa['context']),
+        'cqa_questions': sample(cqa['question']),
+        'tc_texts': sample(tc['text']),
+        'tc_options': sample(tc['options']),
+        'arc_choices': sample(arc['choices']),
+        'letters': [rng.choice("ABCD") for _ in range(rows)],
+        'replies': [rng.choice(["B", "B) ...", " answer: C", "Cavab: D) ...", "Error"]) for _ in range(rows)],
+    }
+
+
+def io_frame(corpus: dict) -> pd.DataFrame:
+    # Shaped like a QA predictions export
+    return pd.DataFrame({'Question': corpus['questions'], 'Correct Answer': corpus['actual'], 'Predicted Answer': corpus['predicted']})
+
+
+def excel_roundtrip(frame: pd.DataFrame, directory: str):
+    path = os.path.join(directory, "bench.xlsx")
+    frame.to_excel(path)
+    pd.read_excel(path, index_col=0)
+
+
+def csv_roundtrip(frame: pd.DataFrame, directory: str):
+    path = os.path.join(directory, "bench.csv")
+    frame.to_csv(path, index=False)
+    pd.read_csv(path)
+
+
+def get_benchmarks(corpus: dict, directory: str) -> dict:
+    """
+    name -> zero-argument callable, each processes every corpus row once.
+    """
+    rows = list(zip(corpus['actual'], corpus['predicted']))
+    frame = io_frame(corpus)
+    return {
+        'calculate_bleu_score': lambda: [calculate_bleu_score(a, p) for a, p in rows],
+        'calculate_rouge_score': lambda: [calculate_rouge_score(a, p) for a, p in rows],
+        'calculate_levenshtein_score': lambda: [calculate_levenshtein_score(a, p) for a, p in rows],
+        'compare_answers': lambda: [compare_answers(a, p) for a, p in zip(corpus['letters'], corpus['replies'])],
+        'create_combined_prompt': lambda: [create_combined_prompt(q) for q in corpus['questions']],
+        'create_combined_prompt_context': lambda: [create_combined_prompt_context(c, q) for c, q in zip(corpus['contexts'], corpus['cqa_questions'])],
+        'create_multiple_options_messages': lambda: [create_multiple_options_messages(t, o, 'tc') for t, o in zip(corpus['tc_texts'], corpus['tc_options'])],
+        'parse_arc_choices': lambda: [parse_arc_choices(c) for c in corpus['arc_choices']],
+        'excel_roundtrip': lambda: excel_roundtrip(frame, directory),
+        'csv_roundtrip': lambda: csv_roundtrip(frame, directory),
+    }
+
+
+def run_benchmarks(rows: int = DEFAULT_ROWS, repeat: int = DEFAULT_REPEAT, only: list = None) -> dict:
+    """
+    Time every benchmark `repeat` times (after one warm-up run).
+
+    Returns:
+        dict: Baseline document: environment plus name -> {median_s, min_s, per_row_us}.
+    """
+    corpus = load_corpus(rows)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, benchmark in get_benchmarks(corpus, directory).items():
+            if only and name not in only:
+                continue
+            benchmark()
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                benchmark()
+                timings.append(time.perf_counter() - start)
+            median = statistics.median(timings)
+            results[name] = {'median_s': median, 'min_s': min(timings), 'per_row_us': median / rows * 1e6}
+            print(f"{name:34} median {median * 1000:9.2f} ms   min {min(timings) * 1000:9.2f} ms   {median / rows * 1e6:8.2f} us/row")
+
+    return {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'rows': rows,
+        'repeat': repeat,
+        'benchmarks': results,
+    }
+
+
+def compare_to_baseline(current: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """
+    Print current vs baseline medians and return the names of the benchmarks slower than threshold x baseline.
+    """
+    if current['rows'] != baseline.get('rows'):
+        print(f"Warning: baseline was recorded with {baseline.get('rows')} rows, this run used {current['rows']}")
+    regressions = []
+    for name, result in current['benchmarks'].items():
+        reference = baseline.get('benchmarks', {}).get(name)
+        if reference is None:
+            print(f"{name:34} (not in baseline)")
+            continue
+        ratio = result['median_s'] / reference['median_s'] if reference['median_s'] else float('inf')
+        flag = "REGRESSION" if ratio > threshold else ""
+        print(f"{name:34} {reference['median_s'] * 1000:9.2f} ms -> {result['median_s'] * 1000:9.2f} ms   x{ratio:5.2f} {flag}")
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the harness's CPU-side hot paths")
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help="rows processed per benchmark run")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="timed runs per benchmark")
+    parser.add_argument('--only', nargs='*', help="run only these benchmarks")
+    parser.add_argument('--save', help="write the results to this JSON baseline file")
+    parser.add_argument('--compare', help="compare against this JSON baseline file")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    current = run_benchmarks(args.rows, args.repeat, args.only)
+
+    if args.save:
+        directory = os.path.dirname(args.save)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.save, 'w') as file:
+            json.dump(current, file, indent=2)
+        print(f"Baseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+        print(f"\nCompared to {args.compare} ({baseline.get('created_at')}):")
+        regressions = compare_to_baseline(current, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmarks slower than x{args.threshold}: {', '.join(regressions)}")
+            sys.exit(1)
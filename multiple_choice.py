@@ -1,29 +1,28 @@
 
 
 from base import *
+from residency import residency
+from generation_engine import generate, generate_async
+from decoding import get_decoding_options, option_letter_parsed
+from decoding import is_constrained, json_answer_parsed
 
 
 # logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-def get_model_answer_multiple_options(question, options, model, dstype) -> str:
+def create_multiple_options_messages(question, options, dstype) -> list:
     """
-    Sends a query to the model and retrieves the response.
+    Builds the few-shot chat messages for a multiple-choice question.
 
     Args:
-        client: The Ollama client instance.
         question (str): The question to be categorized.
-        options (str): The options for categorization.
-        existing_answer (str): The existing answer.
+        options (str | list): The options ('mc', 'tc': comma separated string, 'arc': list of choices).
+        dstype (str): Dataset type ('mc', 'tc' or 'arc').
 
     Returns:
-        str: The model's response.
+        list: The chat messages to send to the model.
     """
 
-    # client = ollama.Client()
-
-
-
     if dstype == 'tc':
         try:
             formatted_options = options.replace(", ", ",\n")
@@ -385,32 +384,96 @@ def get_model_answer_multiple_options(question, options, model, dstype) -> str:
 
     else:
         raise("Invalid dstype")
-    
-    answer = ''
-    try:
-        stream = client_ollama.chat(
-            model=model,  
-            messages=messages,
-            stream=True
-        )
-    except Exception as e:
-        print(f"Error during streaming: {e}")
-        return "Error"
-
-    try:
-        for chunk in stream:
-            if 'message' in chunk and 'content' in chunk['message']:
-                answer += chunk['message']['content']
-            else:
-                print(f"Unexpected chunk format: {chunk}")
-    except Exception as e:
-        print(f"Error processing stream: {e}")
-        return "Error"
-    
-    return answer
 
+    return messages
+
+
+def get_option_letters(options, dstype) -> list:
+    """
+    Letters of the options presented for one row ('arc': one per list item, 'mc'/'tc': the "X)" labels).
+    """
+    if dstype == 'arc':
+        return [chr(65 + i) for i in range(len(options))]
+    letters = re.findall(r'(?:^|,)\s*([A-Z])\)', options) if isinstance(options, str) else []
+    return sorted(set(letters)) or ['A', 'B', 'C', 'D']
+
+
+def get_generation_settings(options, dstype):
+    """
+    Ollama options, response format and stream stop condition of a multiple-choice request.
+    In constrained mode the reply is limited by a JSON schema to one of the row's option letters.
+    """
+    decoding_options = get_decoding_options(dstype)
+    if not is_constrained(dstype):
+        return decoding_options, '', option_letter_parsed
+
+    response_format = {
+        "type": "object",
+        "properties": {"answer": {"type": "string", "enum": get_option_letters(options, dstype)}},
+        "required": ["answer"]
+    }
+    if decoding_options:
+        # The JSON reply may contain newlines, stop sequences would cut it
+        decoding_options = {key: value for key, value in decoding_options.items() if key != 'stop'} or None
+    return decoding_options, response_format, json_answer_parsed
+
+
+def parse_constrained_answer(answer: str) -> str:
+    """
+    Option letter of a constrained {"answer": "X"} reply (the raw reply if it does not parse).
+    """
+    matched = re.search(r'"answer"\s*:\s*"([A-Z])"', answer)
+    return matched.group(1) if matched else answer
+
+
+def multiple_options_request(question, options, dstype) -> dict:
+    """
+    Messages, decoding options, response format, stream stop condition and reply parser of a multiple-choice
+    request (see generation_engine.generate).
+    """
+    decoding_options, response_format, stop_when = get_generation_settings(options, dstype)
+    # Stop reading as soon as the option letter is known
+    return {'messages': create_multiple_options_messages(question, options, dstype), 'options': decoding_options,
+            'response_format': response_format, 'stop_when': stop_when,
+            'parse': parse_constrained_answer if response_format else None}
 
 
+def get_model_answer_multiple_options(question, options, model, dstype, with_telemetry=False):
+    """
+    Sends a query to the model and retrieves the response.
+
+    Args:
+        question (str): The question to be categorized.
+        options (str | list): The options for categorization.
+        model (str): The Ollama model name.
+        dstype (str): Dataset type ('mc', 'tc' or 'arc').
+        with_telemetry (bool): Also return the request telemetry (see telemetry.generation_telemetry).
+
+    Returns:
+        str: The model's response ((response, telemetry) with with_telemetry=True).
+    """
+
+    # client = ollama.Client()
+
+    answer, telemetry = generate(residency.client, model, **multiple_options_request(question, options, dstype))
+    answer = "Error" if answer is None else answer
+    return (answer, telemetry) if with_telemetry else answer
+
+
+async def get_model_answer_multiple_options_async(question, options, model, dstype, client: ollama.AsyncClient, with_telemetry=False):
+    """
+    Async variant of get_model_answer_multiple_options, used by the generation engine.
+    """
+    answer, telemetry = await generate_async(client, model, **multiple_options_request(question, options, dstype))
+    answer = "Error" if answer is None else answer
+    return (answer, telemetry) if with_telemetry else answer
+
+
+
+
+def is_option_letter(predicted_answer) -> bool:
+    return isinstance(predicted_answer, str) and len(predicted_answer) == 1 and 'A' <= predicted_answer <= 'Z'
+
 
 """
     Version 1: Compare answers"
@@ -430,6 +493,10 @@ def compare_answers(actual_answer: str, predicted_answer: str) -> int:
     
     # print("actual_answer:", actual_answer)
     # print("predicted_answer:", predicted_answer)
+
+    # Constrained decoding returns the bare option letter: direct lookup
+    if is_option_letter(predicted_answer):
+        return 1 if actual_answer.lower() == predicted_answer.lower() else 0
     
     if pd.notna(predicted_answer) and isinstance(predicted_answer, str) and predicted_answer.strip():
         matched_predicted = re.match(r'[^A-Z]*([A-Z])', predicted_answer) # v2
@@ -452,7 +519,7 @@ def compare_answers(actual_answer: str, predicted_answer: str) -> int:
 """
     Version 2: Compare answers and write the result to a file."
 """
-def compare_answers_and_save(actual_answer: str, predicted_answer: str, benchmark_type: str, model_name: str) -> int:
+def compare_answers_and_save(actual_answer: str, predicted_answer: str, benchmark_type: str, model_name: str, writer=None) -> int:
     """
     Compare the actual answer with the predicted answer and log results to a file.
     
@@ -461,6 +528,7 @@ def compare_answers_and_save(actual_answer: str, predicted_answer: str, benchmar
     - predicted_answer (str): The answer predicted by the model.
     - benchmark_type (str): Type of benchmark.
     - model_name (str): Name of the model.
+    - writer (ScoreFileWriter): Optional buffered writer; without it every row is appended to the CSV file directly.
     
     Returns:
     - int: 1 if the answers match, otherwise 0.
@@ -470,6 +538,13 @@ def compare_answers_and_save(actual_answer: str, predicted_answer: str, benchmar
     # print("actual_answer:", actual_answer)
     # print("predicted_answer:", predicted_answer)
 
+    # Constrained decoding returns the bare option letter: direct lookup
+    if is_option_letter(predicted_answer):
+        result = 1 if actual_answer.lower() == predicted_answer.lower() else 0
+        results.append([actual_answer, predicted_answer, predicted_answer.lower(), result])
+        save_results(benchmark_type, model_name, results, writer)
+        return result
+
     if pd.notna(predicted_answer) and isinstance(predicted_answer, str) and predicted_answer.strip():
         matched_predicted = re.match(r'[^A-Z]*([A-Z])', predicted_answer)
     else:
@@ -487,16 +562,81 @@ def compare_answers_and_save(actual_answer: str, predicted_answer: str, benchmar
         
         result = 1 if actual_answer.lower() == matched_predicted_value else 0
         results.append([actual_answer, predicted_answer, matched_predicted_value, result])
-        save_to_file(benchmark_type, model_name, results)
+        save_results(benchmark_type, model_name, results, writer)
         return result
     else:
         results.append([actual_answer, predicted_answer, None, 0])
-        save_to_file(benchmark_type, model_name, results)
+        save_results(benchmark_type, model_name, results, writer)
         return 0
 
 
+def save_results(benchmark_type: str, model_name: str, results: list, writer=None):
+    if writer is not None:
+        writer.add(results)
+    else:
+        save_to_file(benchmark_type, model_name, results)
+
+
 def save_to_file(benchmark_type: str, model_name: str, results: list):
 
     df = pd.DataFrame(results, columns=["Actual Answer", "Predicted Answer", "Matched Predicted", "Result"])
     filename_csv = f"{benchmark_type}_{model_name}_scores_2.csv"
     df.to_csv(filename_csv, mode="a", header=not os.path.exists(filename_csv), index=False, encoding='utf-8-sig')
+
+
+SCORE_LOG_CONFIG = CONFIG.get('score_logs') or {}
+
+
+class ScoreFileWriter:
+    """
+    Buffered sink for the per-row match records of compare_answers_and_save.
+
+    Records are kept in memory and appended to {benchmark}_{model}_scores_2.csv in bulk
+    (same columns as save_to_file), every `flush_every` rows and on close().
+    With `columnar=True` they are also written to {benchmark}_{model}_scores_2.parquet (needs pyarrow).
+    """
+
+    COLUMNS = ["Actual Answer", "Predicted Answer", "Matched Predicted", "Result"]
+
+    def __init__(self, benchmark_type: str, model_name: str,
+                 flush_every: int = SCORE_LOG_CONFIG.get('flush_every', 1000),
+                 columnar: bool = SCORE_LOG_CONFIG.get('columnar', False)):
+        self.filename_csv = f"{benchmark_type}_{model_name}_scores_2.csv"
+        self.filename_parquet = f"{benchmark_type}_{model_name}_scores_2.parquet"
+        self.flush_every = max(1, flush_every)
+        self.columnar = columnar
+        self._buffer = []
+        self._parquet_writer = None
+
+    def add(self, results: list):
+        self._buffer.extend(results)
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        df = pd.DataFrame(self._buffer, columns=self.COLUMNS)
+        df.to_csv(self.filename_csv, mode="a", header=not os.path.exists(self.filename_csv), index=False, encoding='utf-8-sig')
+        if self.columnar:
+            self._write_parquet(df)
+        self._buffer = []
+
+    def _write_parquet(self, df: pd.DataFrame):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            logging.warning("pyarrow is not installed, skipping the columnar score log.")
+            self.columnar = False
+            return
+        table = pa.Table.from_pandas(df.astype({"Actual Answer": str, "Predicted Answer": str, "Matched Predicted": str}), preserve_index=False)
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(self.filename_parquet, table.schema)
+        self._parquet_writer.write_table(table)
+
+    def close(self):
+        self.flush()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
@@ -0,0 +1,257 @@
+import time
+import logging
+import threading
+import ollama
+from contextlib import contextmanager, asynccontextmanager
+
+from base import CONFIG, client_ollama, OLLAMA_HOST
+from resilience import ollama_endpoint
+
+
+"""
+    Pool of Ollama servers. Each request goes to the healthy host with the least in-flight work,
+    preferring hosts that already have the model loaded (model affinity). Hosts that keep failing are ejected
+    and come back once a background health check (/api/ps) succeeds again.
+    Every host has its own resilience Endpoint (circuit breaker and AIMD limit): chat requests run under the
+    Endpoint of the host they were sent to, and hosts with an open breaker are skipped while others are available.
+    The pool clients mirror ollama.Client / ollama.AsyncClient, so the generation handlers use it unchanged.
+"""
+
+
+POOL_CONFIG = CONFIG.get('ollama_pool') or {}
+POOL_HOSTS = POOL_CONFIG.get('hosts') or [OLLAMA_HOST]
+POOL_AFFINITY_WEIGHT = float(POOL_CONFIG.get('affinity_weight', 4))
+POOL_MAX_FAILURES = int(POOL_CONFIG.get('max_failures', 3))
+POOL_HEALTH_INTERVAL = float(POOL_CONFIG.get('health_interval_s', 15))
+POOL_HEALTH_TIMEOUT = float(POOL_CONFIG.get('health_timeout_s', 5))
+
+
+def _is_unload(kwargs: dict) -> bool:
+    return kwargs.get('keep_alive') in (0, "0", "0s", "0m")
+
+
+def _counts_as_failure(error: Exception) -> bool:
+    # Client errors (e.g. unknown model) say nothing about the health of the host
+    return not (isinstance(error, ollama.ResponseError) and 0 < error.status_code < 500)
+
+
+class OllamaHost:
+    """
+    One pool member: its clients, resilience Endpoint, in-flight request count, loaded models and health.
+    """
+
+    def __init__(self, url: str, client: ollama.Client = None):
+        self.url = url
+        self.client = client or ollama.Client(host=url)
+        self.health_client = ollama.Client(host=url, timeout=POOL_HEALTH_TIMEOUT)
+        self.endpoint = ollama_endpoint(self.name)
+        self.in_flight = 0
+        self.models = set()
+        self.healthy = True
+        self.failures = 0
+        self.requests = 0
+
+    @property
+    def name(self) -> str:
+        return self.url or "default"
+
+
+class OllamaPool:
+    """
+    Least in-flight routing with model affinity over several Ollama hosts.
+
+    Args:
+        hosts (list): Ollama base URLs (None = the ollama library default).
+        affinity_weight (float): In-flight requests a host with the model loaded may carry
+            before a host without it is preferred.
+        max_failures (int): Consecutive failed requests before a host is ejected.
+        health_interval (float): Seconds between health checks (0 disables the background checker).
+    """
+
+    def __init__(self, hosts: list = POOL_HOSTS, affinity_weight: float = POOL_AFFINITY_WEIGHT,
+                 max_failures: int = POOL_MAX_FAILURES, health_interval: float = POOL_HEALTH_INTERVAL):
+        # The base client is reused for its own host
+        self.hosts = [OllamaHost(url, client_ollama if url == OLLAMA_HOST else None) for url in hosts]
+        self.affinity_weight = affinity_weight
+        self.max_failures = max(1, max_failures)
+        self.health_interval = health_interval
+        self._lock = threading.Lock()
+        self._health_thread = None
+
+    def __len__(self):
+        return len(self.hosts)
+
+    def healthy_hosts(self) -> list:
+        with self._lock:
+            return [host for host in self.hosts if host.healthy]
+
+    def _pick(self, model: str) -> OllamaHost:
+        # Called with the lock held; hosts whose breaker is open are only used when no other host is left
+        healthy = [host for host in self.hosts if host.healthy]
+        candidates = [host for host in healthy if not host.endpoint.breaker.is_open()] or healthy or self.hosts
+        return min(candidates, key=lambda host: host.in_flight + (0 if model in host.models else self.affinity_weight))
+
+    @contextmanager
+    def slot(self, model: str):
+        """
+        Reserve the best host for one request to `model` for the duration of the block.
+        """
+        self._start_health_checks()
+        with self._lock:
+            host = self._pick(model)
+            host.in_flight += 1
+            host.requests += 1
+        try:
+            yield host
+        except GeneratorExit:
+            # A stream closed early by its reader
+            self._report(host, model, None)
+            raise
+        except Exception as e:
+            self._report(host, model, e)
+            raise
+        else:
+            self._report(host, model, None)
+        finally:
+            with self._lock:
+                host.in_flight -= 1
+
+    def _report(self, host: OllamaHost, model: str, error):
+        with self._lock:
+            if error is None:
+                if not host.healthy:
+                    logging.info(f"Ollama host {host.name} is healthy again")
+                host.healthy = True  # it served a request (ejected hosts are still tried when all are ejected)
+                host.failures = 0
+                host.models.add(model)
+            elif _counts_as_failure(error):
+                host.failures += 1
+                # A single host has nowhere to fail over to and no health checker to readmit it
+                if host.failures >= self.max_failures and host.healthy and len(self.hosts) > 1:
+                    host.healthy = False
+                    logging.warning(f"Ollama host {host.name} ejected after {host.failures} failed requests: {error}")
+
+    def check_health(self):
+        """
+        Ping every host (/api/ps): refreshes its loaded models, ejects unreachable hosts and readmits recovered ones.
+        """
+        for host in self.hosts:
+            try:
+                loaded = host.health_client.ps().get('models', [])
+                with self._lock:
+                    if not host.healthy:
+                        logging.info(f"Ollama host {host.name} is healthy again")
+                    host.healthy = True
+                    host.failures = 0
+                    host.models = {entry.get('name') for entry in loaded} | {entry.get('model') for entry in loaded}
+                    # Loaded models are reported with their tag
+                    host.models |= {name.split(':')[0] for name in host.models if name and name.endswith(':latest')}
+            except Exception as e:
+                with self._lock:
+                    if host.healthy:
+                        logging.warning(f"Ollama host {host.name} failed its health check, ejected: {e}")
+                    host.healthy = False
+
+    def _start_health_checks(self):
+        if self._health_thread is not None or self.health_interval <= 0 or len(self.hosts) < 2:
+            return
+        with self._lock:
+            if self._health_thread is not None:
+                return
+
+            def run():
+                while True:
+                    time.sleep(self.health_interval)
+                    self.check_health()
+
+            self._health_thread = threading.Thread(target=run, daemon=True)
+            self._health_thread.start()
+
+    def stats(self) -> list:
+        """
+        Per host: requests served, in-flight requests, health and loaded models.
+        """
+        with self._lock:
+            return [{'Host': host.name, 'Requests': host.requests, 'In flight': host.in_flight,
+                     'Healthy': host.healthy, 'Models': sorted(model for model in host.models if model)}
+                    for host in self.hosts]
+
+
+class PoolClient:
+    """
+    Sync ollama.Client stand-in that spreads requests over the pool.
+    Load/unload requests (chat without messages) go to every healthy host, since the whole pool serves the batch model.
+    """
+
+    def __init__(self, pool: OllamaPool):
+        self.pool = pool
+
+    def chat(self, model: str = '', messages=None, stream: bool = False, **kwargs):
+        if not messages:
+            return self._broadcast(model, messages, stream, kwargs)
+        if stream:
+            return self._stream(model, messages, kwargs)
+        with self.pool.slot(model) as host, host.endpoint.guard():
+            return host.client.chat(model=model, messages=messages, stream=False, **kwargs)
+
+    def _stream(self, model, messages, kwargs):
+        # The host stays reserved until the stream is read to the end or closed
+        with self.pool.slot(model) as host, host.endpoint.guard():
+            yield from host.client.chat(model=model, messages=messages, stream=True, **kwargs)
+
+    def _broadcast(self, model, messages, stream, kwargs):
+        response = None
+        errors = []
+        for host in self.pool.healthy_hosts() or self.pool.hosts:
+            try:
+                response = host.client.chat(model=model, messages=messages or [], stream=stream, **kwargs)
+                with self.pool._lock:
+                    if _is_unload(kwargs):
+                        host.models.discard(model)
+                    else:
+                        host.models.add(model)
+            except Exception as e:
+                errors.append(e)
+                logging.error(f"Ollama host {host.name}: {model} load/unload failed: {e}")
+        if response is None and errors:
+            raise errors[0]
+        return response
+
+    def list(self):
+        with self.pool.slot('') as host:
+            return host.client.list()
+
+
+class AsyncPoolClient:
+    """
+    ollama.AsyncClient stand-in over the pool. Create one per event loop (per generation run).
+    """
+
+    def __init__(self, pool: OllamaPool):
+        self.pool = pool
+        self._clients = {}
+
+    def _client(self, host: OllamaHost) -> ollama.AsyncClient:
+        if host.url not in self._clients:
+            self._clients[host.url] = ollama.AsyncClient(host=host.url)
+        return self._clients[host.url]
+
+    @asynccontextmanager
+    async def _slot(self, model: str):
+        # Same bookkeeping as OllamaPool.slot; the lock is only held for the counters, never across an await
+        with self.pool.slot(model) as host:
+            yield host
+
+    async def chat(self, model: str = '', messages=None, stream: bool = False, **kwargs):
+        if stream:
+            return self._stream(model, messages, kwargs)
+        async with self._slot(model) as host, host.endpoint.guard_async():
+            return await self._client(host).chat(model=model, messages=messages, stream=False, **kwargs)
+
+    async def _stream(self, model, messages, kwargs):
+        async with self._slot(model) as host, host.endpoint.guard_async():
+            async for chunk in await self._client(host).chat(model=model, messages=messages, stream=True, **kwargs):
+                yield chunk
+
+
+ollama_pool = OllamaPool()
@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import signal
+import sqlite3
+import logging
+import threading
+import pandas as pd
+from contextlib import contextmanager
+
+from base import CONFIG
+
+
+"""
+    Append-only, crash-safe prediction store (SQLite in WAL mode).
+    Every finished row is written as soon as it is generated, keyed by (benchmark, model, dataset row id),
+    so a crash or Ctrl-C only loses the last uncommitted batch. Excel export is an optional final step.
+    A row status index (pending/ok/error/long, retry count, last error) tells which rows still need work,
+    so failed rows anywhere in a dataset can be regenerated on their own (--repair).
+"""
+
+
+PREDICTIONS_CONFIG = CONFIG.get('predictions') or {}
+PREDICTION_STORE_PATH = PREDICTIONS_CONFIG.get('store', "datasets/output_datasets/predictions.sqlite3")
+PREDICTION_SYNC_EVERY = int(PREDICTIONS_CONFIG.get('sync_every', 20))
+EXPORT_EXCEL = PREDICTIONS_CONFIG.get('export_excel', True)
+
+# Row states of the status index
+PENDING, OK, ERROR, LONG = 'pending', 'ok', 'error', 'long'
+ROW_STATES = (PENDING, OK, ERROR, LONG)
+
+
+def _json_default(value):
+    # numpy scalars coming from pandas rows; pd.NA comes from the Arrow-backed dataset columns
+    if value is pd.NA:
+        return None
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+def prediction_status(value) -> str:
+    """
+    Status of a predicted value: error ('Error' or no answer), long ('Long answer') or ok.
+    """
+    if not isinstance(value, str) or not value.strip() or value.strip().lower() == 'error':
+        return ERROR
+    if value.strip().lower() == 'long answer':
+        return LONG
+    return OK
+
+
+class PredictionStore:
+    """
+    Per-row prediction store.
+
+    Args:
+        path (str): SQLite file of the store.
+        sync_every (int): Rows are committed in batches of this size (and on flush()).
+    """
+
+    def __init__(self, path: str = PREDICTION_STORE_PATH, sync_every: int = PREDICTION_SYNC_EVERY):
+        self.path = path
+        self.sync_every = max(1, sync_every)
+        self._pending = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "benchmark TEXT NOT NULL, model TEXT NOT NULL, row_id INTEGER NOT NULL, "
+            "columns TEXT NOT NULL, row_values TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (benchmark, model, row_id))"
+        )
+        # Request telemetry per row, kind = 'generation' (Ollama) or 'judge' (client_openai)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS telemetry ("
+            "benchmark TEXT NOT NULL, model TEXT NOT NULL, row_id INTEGER NOT NULL, kind TEXT NOT NULL, "
+            "telemetry TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (benchmark, model, row_id, kind))"
+        )
+        # Status index: one row per scheduled dataset row, retries counts regenerations after the first attempt
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS row_status ("
+            "benchmark TEXT NOT NULL, model TEXT NOT NULL, row_id INTEGER NOT NULL, status TEXT NOT NULL, "
+            "retries INTEGER NOT NULL DEFAULT 0, last_error TEXT, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (benchmark, model, row_id))"
+        )
+        self._index_existing_rows()
+        self._connection.commit()
+
+    def _index_existing_rows(self):
+        # Predictions stored before the status index existed get their status from the predicted value
+        rows = self._connection.execute(
+            "SELECT p.benchmark, p.model, p.row_id, p.row_values FROM predictions p "
+            "LEFT JOIN row_status s ON s.benchmark = p.benchmark AND s.model = p.model AND s.row_id = p.row_id "
+            "WHERE s.row_id IS NULL"
+        ).fetchall()
+        now = time.time()
+        self._connection.executemany(
+            "INSERT INTO row_status (benchmark, model, row_id, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+            [(benchmark, model, row_id, prediction_status((json.loads(values) or [None])[-1]), now)
+             for benchmark, model, row_id, values in rows]
+        )
+
+    def _written(self):
+        # Called with the lock held
+        self._pending += 1
+        if self._pending >= self.sync_every:
+            self._connection.commit()
+            self._pending = 0
+
+    def put(self, benchmark: str, model: str, row_id: int, columns: list, values: list):
+        """
+        Write (or overwrite) the prediction row `row_id`. Committed every `sync_every` rows.
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO predictions (benchmark, model, row_id, columns, row_values, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (benchmark, model, int(row_id), json.dumps(columns),
+                 json.dumps(values, ensure_ascii=False, default=_json_default), time.time())
+            )
+            self._written()
+
+    def put_telemetry(self, benchmark: str, model: str, row_id: int, kind: str, telemetry: dict):
+        """
+        Write (or overwrite) the request telemetry of row `row_id`. Committed with the prediction rows.
+        """
+        if not telemetry:
+            return
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO telemetry (benchmark, model, row_id, kind, telemetry, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (benchmark, model, int(row_id), kind, json.dumps(telemetry, default=_json_default), time.time())
+            )
+            self._written()
+
+    def put_result(self, benchmark: str, model: str, row_id: int, columns: list, values: list, telemetry: dict = None):
+        """
+        Store a generated row: prediction (last value), generation telemetry and status.
+        """
+        self.put(benchmark, model, row_id, columns, values)
+        self.put_telemetry(benchmark, model, row_id, 'generation', telemetry)
+        status = prediction_status(values[-1])
+        error = None
+        if status == ERROR:
+            error = (telemetry or {}).get('error') or "no answer"
+        elif status == LONG:
+            error = "answer longer than 400 characters"
+        self.set_status(benchmark, model, row_id, status, error)
+
+    def mark_pending(self, benchmark: str, model: str, row_ids):
+        """
+        Add rows about to be generated to the status index (rows already indexed keep their status).
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO row_status (benchmark, model, row_id, status, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(benchmark, model, int(row_id), PENDING, now) for row_id in row_ids]
+            )
+            self._connection.commit()
+
+    def set_status(self, benchmark: str, model: str, row_id: int, status: str, error: str = None):
+        """
+        Record the outcome of a generation attempt. Every attempt after the first one counts as a retry.
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO row_status (benchmark, model, row_id, status, retries, last_error, updated_at) "
+                "VALUES (?, ?, ?, ?, 0, ?, ?) "
+                "ON CONFLICT (benchmark, model, row_id) DO UPDATE SET "
+                "retries = row_status.retries + (row_status.status != ?), status = excluded.status, "
+                "last_error = excluded.last_error, updated_at = excluded.updated_at",
+                (benchmark, model, int(row_id), status, str(error)[:1000] if error else None, time.time(), PENDING)
+            )
+            self._written()
+
+    def flush(self):
+        """
+        Commit the rows written since the last commit.
+        """
+        with self._lock:
+            self._connection.commit()
+            self._pending = 0
+
+    def row_ids(self, benchmark: str, model: str) -> set:
+        """
+        Dataset row ids already stored for (benchmark, model).
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT row_id FROM predictions WHERE benchmark = ? AND model = ?", (benchmark, model)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def status_row_ids(self, benchmark: str, model: str, states) -> set:
+        """
+        Dataset row ids of (benchmark, model) whose status is one of `states`.
+        """
+        states = list(states)
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT row_id FROM row_status WHERE benchmark = ? AND model = ? "
+                f"AND status IN ({', '.join('?' * len(states))})",
+                (benchmark, model, *states)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def status_frame(self) -> pd.DataFrame:
+        """
+        The status index: benchmark, model, row_id, status, retries and last_error of every indexed row.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT benchmark, model, row_id, status, retries, last_error FROM row_status ORDER BY benchmark, model, row_id"
+            ).fetchall()
+        return pd.DataFrame(rows, columns=['benchmark', 'model', 'row_id', 'status', 'retries', 'last_error'])
+
+    def to_frame(self, benchmark: str, model: str) -> pd.DataFrame:
+        """
+        Stored predictions of (benchmark, model) as a DataFrame indexed by dataset row id.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT row_id, columns, row_values FROM predictions WHERE benchmark = ? AND model = ? ORDER BY row_id",
+                (benchmark, model)
+            ).fetchall()
+        if not rows:
+            return pd.DataFrame()
+        columns = json.loads(rows[-1][1])
+        return pd.DataFrame([json.loads(row[2]) for row in rows], columns=columns, index=[row[0] for row in rows])
+
+    def telemetry_frame(self) -> pd.DataFrame:
+        """
+        All stored telemetry rows (benchmark, model, row_id, kind and the telemetry fields).
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT benchmark, model, row_id, kind, telemetry FROM telemetry ORDER BY benchmark, model, kind, row_id"
+            ).fetchall()
+        return pd.DataFrame([{'benchmark': row[0], 'model': row[1], 'row_id': row[2], 'kind': row[3], **json.loads(row[4])}
+                             for row in rows])
+
+    @contextmanager
+    def flush_on_exit(self):
+        """
+        Flush the store when the block exits, including on Ctrl-C (SIGINT) and SIGTERM.
+        """
+        previous_handler = None
+        in_main_thread = threading.current_thread() is threading.main_thread()
+        if in_main_thread:
+            def handle_sigterm(signum, frame):
+                raise SystemExit(128 + signum)
+            previous_handler = signal.signal(signal.SIGTERM, handle_sigterm)
+        try:
+            yield self
+        finally:
+            self.flush()
+            if in_main_thread:
+                signal.signal(signal.SIGTERM, previous_handler)
+
+
+_store = None
+
+
+def get_prediction_store() -> PredictionStore:
+    """
+    Process-wide prediction store (opened on first use).
+    """
+    global _store
+    if _store is None:
+        _store = PredictionStore()
+    return _store
+
+
+def load_predictions(predictions_file: str, benchmark_type: str, model_name: str) -> pd.DataFrame:
+    """
+    Predictions of (benchmark, model) from the prediction store, or from the Excel export if the store has none.
+    """
+    predictions_df = get_prediction_store().to_frame(benchmark_type, model_name)
+    if predictions_df.empty:
+        logging.info(f"No stored predictions for {benchmark_type}/{model_name}, reading {predictions_file}")
+        predictions_df = pd.read_excel(predictions_file, index_col=0)
+    return predictions_df
@@ -1,7 +1,14 @@
 
 from base import *
+from residency import residency
+from generation_engine import generate, generate_async
+from judge_executor import judge_score
+from decoding import get_decoding_options, answer_too_long, format_answer
 
 from datetime import datetime, timedelta
+
+# Bump when the judge prompt of this module changes (part of the judge cache key)
+JUDGE_PROMPT_VERSION = "qa-v2"
 # import threading
 
 
@@ -10,6 +17,10 @@ from datetime import datetime, timedelta
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Lexical metric objects are built once per process and reused by every call
+ROUGE_SCORER = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
+BLEU_SMOOTHING = SmoothingFunction().method1
+
 
 
 
@@ -47,34 +58,33 @@ def create_combined_prompt(question: str) -> str:
 
 
 
-def get_answer_from_local_ollama(model: str, question: str) -> str:
+def qa_generation_request(question: str) -> dict:
     """
-    Send a prompt to the local Ollama model and retrieve the answer using the ollama library.
+    Messages, decoding options and stream stop condition of a QA request (see generation_engine.generate).
     """
-
     prompt = create_combined_prompt(question)
-    
-    try:
-        stream = ollama.chat(
-            model=model,
-            messages=[{'role': 'user', 'content': prompt}],
-            stream=True
-        )
-        
-        answer = ''
+    # Stop reading once the answer is past the 400-char limit
+    return {'messages': [{'role': 'user', 'content': prompt}], 'options': get_decoding_options('qa'),
+            'stop_when': answer_too_long}
 
-        for chunk in stream:
-            answer += chunk['message']['content']
 
-    
-    except Exception as e:
-        logging.error(f"Request to local Ollama failed: {e}")
-        # answer = "Error"
-    
+def get_answer_from_local_ollama(model: str, question: str, with_telemetry: bool = False):
+    """
+    Send a prompt to the local Ollama model and retrieve the answer using the ollama library.
+    With with_telemetry=True, returns (answer, telemetry) (see telemetry.generation_telemetry).
+    """
+    answer, telemetry = generate(residency.client, model, **qa_generation_request(question))
+    answer = format_answer(answer)
+    return (answer, telemetry) if with_telemetry else answer
 
-    if len(answer) > 400:
-        return 'Long answer'
-    return answer.strip() if answer else "Error"
+
+async def get_answer_from_local_ollama_async(model: str, question: str, client: ollama.AsyncClient, with_telemetry: bool = False):
+    """
+    Async variant of get_answer_from_local_ollama, used by the generation engine.
+    """
+    answer, telemetry = await generate_async(client, model, **qa_generation_request(question))
+    answer = format_answer(answer)
+    return (answer, telemetry) if with_telemetry else answer
 
 
 
@@ -82,9 +92,10 @@ def get_answer_from_local_ollama(model: str, question: str) -> str:
 
 
 
-def get_evaluation_score(question: str, actual_answer: str, predicted_answer: str) -> str:
+def get_evaluation_score(question: str, actual_answer: str, predicted_answer: str, with_telemetry: bool = False):
     """
     Generate an evaluation score between 0 and 100 by comparing the actual and predicted answers.
+    With with_telemetry=True, returns (score, telemetry) (latency and token usage of the judge call).
     """
 
     # httpx_client = httpx.Client(http2=True, verify=False)
@@ -124,26 +135,8 @@ def get_evaluation_score(question: str, actual_answer: str, predicted_answer: st
             """
 
 
-    payload = {
-        "model": MODEL_LLAMA_3_1_405B,
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.0,
-        "max_tokens": 50
-    }
-
-    for attempt in range(NUM_RETRIES):
-        try:
-            completion = client_openai.chat.completions.create(**payload)
-            if completion.choices:
-                content = completion.choices[0].message.content
-                if content:
-                    return content.strip()
-                logging.error("Content in response is None.")
-            else:
-                logging.error(f"Unexpected response format: {completion}")
-        except Exception as e:
-            logging.error(f"Request failed: {e}")
-    return "Error"
+    score, telemetry = judge_score(prompt, JUDGE_PROMPT_VERSION, question, actual_answer, predicted_answer)
+    return (score, telemetry) if with_telemetry else score
 
 
 
@@ -153,7 +146,7 @@ def calculate_bleu_score(actual_answer: str, predicted_answer: str) -> float:
     """
     reference = actual_answer.split()
     candidate = predicted_answer.split()
-    bleu_score = sentence_bleu([reference], candidate, smoothing_function=SmoothingFunction().method1)
+    bleu_score = sentence_bleu([reference], candidate, smoothing_function=BLEU_SMOOTHING)
     # print('bleu:', 25 * bleu_score)
     return 25 * bleu_score
 
@@ -161,8 +154,7 @@ def calculate_rouge_score(actual_answer: str, predicted_answer: str) -> dict:
     """
     Calculate ROUGE score for the given actual and predicted answers.
     """
-    scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
-    scores = scorer.score(actual_answer, predicted_answer)
+    scores = ROUGE_SCORER.score(actual_answer, predicted_answer)
 
     normalized_scores = {
         'rouge1': scores['rouge1'].fmeasure,
@@ -198,7 +190,7 @@ def get_answer_from_local_ollama_v2(model: str, question: str) -> str:
     prompt = create_combined_prompt(question)
     
     try:
-        response = ollama.chat(
+        response = residency.client.chat(
             model=model,
             messages=[{'role': 'user', 'content': prompt}],
         )
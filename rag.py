@@ -4,9 +4,16 @@
 
 
 from base import *
+from residency import residency
+from generation_engine import generate, generate_async
+from judge_executor import judge_score
+from decoding import get_decoding_options, answer_too_long, format_answer
 
 from datetime import datetime, timedelta
 
+# Bump when the judge prompt of this module changes (part of the judge cache key)
+JUDGE_PROMPT_VERSION = "context-v1"
+
 
 def create_combined_prompt_context(context: str, question: str) -> str:
     """
@@ -95,11 +102,10 @@ def create_combined_prompt_context(context: str, question: str) -> str:
 
 
 
-def get_answer_from_local_ollama_context(model: str, question: str, context: str) -> str:
+def context_generation_request(question: str, context: str) -> dict:
     """
-    Send a prompt to the local Ollama model and retrieve the answer using the ollama library.
+    Messages, decoding options and stream stop condition of a ContextQA request (see generation_engine.generate).
     """
-
     prompt = create_combined_prompt_context(context, question)
 
     # Prepare messages for v2
@@ -109,29 +115,32 @@ def get_answer_from_local_ollama_context(model: str, question: str, context: str
         {'role': 'user', 'content': prompt}  # The user's prompt # v1, v2
     ]
 
-    stream = ollama.chat(
-        model=model,
-        messages=[{'role': 'user', 'content': prompt}], # v1
-        # messages=messages, # v2
-        stream=True
-    )
-    
-    answer = ''
-    try:
-        for chunk in stream:
-            answer += chunk['message']['content']
+    # Stop reading once the answer is past the 400-char limit
+    return {'messages': messages, 'options': get_decoding_options('cqa'), 'stop_when': answer_too_long}
+
 
+def get_answer_from_local_ollama_context(model: str, question: str, context: str, with_telemetry: bool = False):
+    """
+    Send a prompt to the local Ollama model and retrieve the answer using the ollama library.
+    With with_telemetry=True, returns (answer, telemetry) (see telemetry.generation_telemetry).
+    """
+    answer, telemetry = generate(residency.client, model, **context_generation_request(question, context))
+    answer = format_answer(answer)
+    return (answer, telemetry) if with_telemetry else answer
 
-    except Exception as e:
-        logging.error(f"Request to local Ollama failed: {e}")
 
-    if len(answer) > 400:
-        return 'Long answer'
-    return answer.strip() if answer else "Error"
+async def get_answer_from_local_ollama_context_async(model: str, question: str, context: str, client: ollama.AsyncClient, with_telemetry: bool = False):
+    """
+    Async variant of get_answer_from_local_ollama_context, used by the generation engine.
+    """
+    answer, telemetry = await generate_async(client, model, **context_generation_request(question, context))
+    answer = format_answer(answer)
+    return (answer, telemetry) if with_telemetry else answer
 
-def get_evaluation_score_context(question: str, actual_answer: str, predicted_answer: str) -> str:
+def get_evaluation_score_context(question: str, actual_answer: str, predicted_answer: str, with_telemetry: bool = False):
     """
     Generate an evaluation score between 0 and 100 by comparing the actual and predicted answers.
+    With with_telemetry=True, returns (score, telemetry) (latency and token usage of the judge call).
     """
     # httpx_client = httpx.Client(http2=True, verify=False)
 
@@ -169,30 +178,5 @@ def get_evaluation_score_context(question: str, actual_answer: str, predicted_an
             """
 
 
-    payload = {
-        "model": MODEL_LLAMA_3_1_405B,
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.0,
-        "max_tokens": 50
-    }
-
-    for attempt in range(NUM_RETRIES):
-        try:
-            completion = client_openai.chat.completions.create(**payload)
-            if completion.choices:
-                content = completion.choices[0].message.content
-                if content:
-                    return content.strip()
-                logging.error("Content in response is None.")
-            else:
-                logging.error(f"Unexpected response format: {completion}")
-        except Exception as e:
-            logging.error(f"Request failed: {e}")
-            # if attempt < NUM_RETRIES - 1:
-            #     sleep_time = BASE_SLEEP_TIME * (2 ** attempt)
-            #     logging.info(f"Retrying in {sleep_time} seconds...")
-            #     time.sleep(sleep_time)
-            # else:
-            #     return "No score received"
-    return "Error"
-
+    score, telemetry = judge_score(prompt, JUDGE_PROMPT_VERSION, question, actual_answer, predicted_answer)
+    return (score, telemetry) if with_telemetry else score
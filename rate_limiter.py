@@ -0,0 +1,75 @@
+import time
+import threading
+
+
+"""
+    Token bucket limiter for the judge endpoint: requests-per-minute and tokens-per-minute,
+    shared by all scoring workers (thread-safe).
+"""
+
+
+class TokenBucket:
+    """
+    Requests-per-minute / tokens-per-minute token bucket.
+
+    Args:
+        requests_per_minute (float): Request quota per minute (None or 0 disables the request limit).
+        tokens_per_minute (float): Token quota per minute (None or 0 disables the token limit).
+    """
+
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None):
+        self.requests_per_minute = requests_per_minute or 0
+        self.tokens_per_minute = tokens_per_minute or 0
+        self._requests = float(self.requests_per_minute)
+        self._tokens = float(self.tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens: int = 0):
+        """
+        Block until one request and `tokens` tokens are available, then take them.
+        """
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)  # a single oversized request must still pass
+
+        while True:
+            with self._lock:
+                self._refill()
+                wait = 0.0
+                if self.requests_per_minute and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+                if self.tokens_per_minute and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+                if wait == 0.0:
+                    if self.requests_per_minute:
+                        self._requests -= 1
+                    if self.tokens_per_minute:
+                        self._tokens -= tokens
+                    return
+            time.sleep(wait)
+
+    def settle(self, estimated_tokens: int, actual_tokens: int):
+        """
+        Correct the token bucket once the real usage of a request is known.
+        """
+        if not self.tokens_per_minute or actual_tokens is None:
+            return
+        with self._lock:
+            self._tokens = min(self.tokens_per_minute, self._tokens + estimated_tokens - actual_tokens)
+
+
+def estimate_tokens(payload: dict) -> int:
+    """
+    Rough token estimate of a chat completion payload (prompt characters / 4 plus max_tokens).
+    """
+    prompt_chars = sum(len(message['content']) for message in payload['messages'])
+    return prompt_chars // 4 + payload.get('max_tokens', 0)
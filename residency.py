@@ -0,0 +1,156 @@
+import os
+import time
+import logging
+import threading
+import pandas as pd
+from contextlib import contextmanager
+
+from base import CONFIG, OLLAMA_KEEP_ALIVE
+from ollama_pool import ollama_pool, OllamaPool, PoolClient, AsyncPoolClient
+from result_cache import get_model_digest
+
+
+"""
+    Ollama residency manager: preloads the model of a batch with an empty request before it starts,
+    keeps it resident with keep_alive (sent by every generation call site) and unloads it when the batch ends.
+    Batches run on the Ollama pool (ollama_pool.py). With a prefetch host configured, the next planned model
+    is preloaded there while the current one runs, and the next batch runs on that host.
+"""
+
+
+PREFETCH_HOST = (CONFIG.get('generation') or {}).get('prefetch_host') or os.getenv('OLLAMA_PREFETCH_HOST')
+
+
+class ResidencyManager:
+    """
+    Tracks which model is resident on which host and records the load/inference time of every batch.
+
+    Args:
+        keep_alive: How long Ollama keeps the batch model loaded after each request (e.g. "30m", -1 = forever).
+        prefetch_host (str): Optional second Ollama host used to preload the next planned model.
+    """
+
+    def __init__(self, keep_alive=OLLAMA_KEEP_ALIVE, prefetch_host: str = PREFETCH_HOST):
+        self.keep_alive = keep_alive
+        # Index 0 is the pool (one or more hosts), index 1 the optional prefetch host (a pool of its own host, so
+        # its requests run under its own resilience endpoint too)
+        self.pools = [ollama_pool] + ([OllamaPool([prefetch_host], health_interval=0)] if prefetch_host else [])
+        self.hosts = [','.join(host.name for host in pool.hosts) for pool in self.pools]
+        self.clients = [PoolClient(pool) for pool in self.pools]
+        self.active = 0
+        self.active_model = None
+        self.timings = []
+        self._prefetch = None  # (model, host index, thread, result)
+
+    @property
+    def host(self) -> str:
+        """
+        Host(s) of the running batch.
+        """
+        return self.hosts[self.active]
+
+    @property
+    def client(self):
+        """
+        Sync client of the running batch (ollama.Client interface).
+        """
+        return self.clients[self.active]
+
+    def async_client(self):
+        """
+        New async client for the running batch (ollama.AsyncClient interface), one per event loop.
+        """
+        return AsyncPoolClient(self.pools[self.active])
+
+    @property
+    def parallel_hosts(self) -> int:
+        """
+        Number of hosts serving the running batch (healthy pool hosts, or the prefetch host).
+        """
+        return max(1, len(self.pools[self.active].healthy_hosts()))
+
+    def preload(self, model: str, index: int = None) -> float:
+        """
+        Load the model with an empty chat request and keep it for keep_alive. Returns the load time in seconds.
+        """
+        client = self.clients[self.active if index is None else index]
+        start = time.perf_counter()
+        client.chat(model=model, messages=[], keep_alive=self.keep_alive)
+        return time.perf_counter() - start
+
+    def release(self, model: str, index: int = None):
+        """
+        Unload the model now (keep_alive=0).
+        """
+        client = self.clients[self.active if index is None else index]
+        try:
+            client.chat(model=model, messages=[], keep_alive=0)
+        except Exception as e:
+            logging.error(f"Could not unload {model}: {e}")
+
+    def _start_prefetch(self, model: str):
+        if model is None or len(self.clients) < 2:
+            return
+        index = (self.active + 1) % len(self.clients)
+        result = {}
+
+        def run():
+            try:
+                result['seconds'] = self.preload(model, index)
+            except Exception as e:
+                logging.warning(f"Could not preload {model} on {self.hosts[index]}: {e}")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self._prefetch = (model, index, thread, result)
+
+    def _load(self, model: str):
+        # Returns (seconds spent waiting for the model, whether it was prefetched on the other host)
+        if self._prefetch is not None and self._prefetch[0] == model:
+            _, index, thread, result = self._prefetch
+            self._prefetch = None
+            start = time.perf_counter()
+            thread.join()
+            if 'seconds' in result:
+                self.active = index
+                return time.perf_counter() - start, True
+        self._prefetch = None
+        try:
+            return self.preload(model), False
+        except Exception as e:
+            logging.error(f"Could not preload {model}: {e}")
+            return None, False
+
+    @contextmanager
+    def batch(self, model: str, next_model: str = None):
+        """
+        Keep `model` resident for the duration of the block, then unload it.
+
+        Args:
+            model (str): Model of the batch.
+            next_model (str): Next planned model, preloaded on the prefetch host (if any) while this batch runs.
+        """
+        load_seconds, prefetched = self._load(model)
+        self.active_model = model
+        # Resolved here, so the async generation path never makes the blocking digest lookup on its event loop
+        get_model_digest(model)
+        self._start_prefetch(next_model)
+
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            inference_seconds = time.perf_counter() - start
+            self.release(model)
+            self.active_model = None
+            self.timings.append({'Model': model, 'Host': self.host, 'Prefetched': prefetched,
+                                 'Load (s)': load_seconds, 'Inference (s)': inference_seconds})
+
+    def report(self) -> pd.DataFrame:
+        """
+        Load vs inference time of every batch so far.
+        """
+        return pd.DataFrame(self.timings, columns=['Model', 'Host', 'Prefetched', 'Load (s)', 'Inference (s)'])
+
+
+residency = ResidencyManager()
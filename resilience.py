@@ -0,0 +1,442 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+import email.utils
+from contextlib import contextmanager, asynccontextmanager
+
+import httpx
+import openai
+import ollama
+
+from base import CONFIG, NUM_RETRIES, BASE_SLEEP_TIME, BASE_URL_LLM, JUDGE_WORKERS, GENERATION_CONCURRENCY
+
+
+"""
+    Shared resilience layer for remote calls (client_openai judge requests and Ollama generation requests).
+    Transient errors (connection errors, timeouts, HTTP 429 and 5xx) are retried with exponential backoff and full
+    jitter, honoring Retry-After on 429. Each endpoint has a circuit breaker (after repeated failures calls wait for
+    a single probe instead of hammering it) and an AIMD concurrency limit (halved on sustained errors, grown back
+    by one per window of successes). Every Ollama pool host is an endpoint of its own: generation requests are
+    retried by ollama_retries() and each attempt runs under the endpoint of the host the pool picked.
+"""
+
+
+RESILIENCE_CONFIG = CONFIG.get('resilience') or {}
+MAX_ATTEMPTS = int(RESILIENCE_CONFIG.get('max_attempts', NUM_RETRIES))
+BASE_DELAY = float(RESILIENCE_CONFIG.get('base_delay_s', BASE_SLEEP_TIME))
+MAX_DELAY = float(RESILIENCE_CONFIG.get('max_delay_s', 30))
+MAX_RETRY_AFTER = float(RESILIENCE_CONFIG.get('max_retry_after_s', 120))
+BREAKER_FAILURES = int(RESILIENCE_CONFIG.get('breaker_failures', 5))
+BREAKER_RESET = float(RESILIENCE_CONFIG.get('breaker_reset_s', 30))
+BREAKER_MAX_WAIT = float(RESILIENCE_CONFIG.get('breaker_max_wait_s', 120))
+AIMD_DECREASE = float(RESILIENCE_CONFIG.get('aimd_decrease', 0.5))
+AIMD_COOLDOWN = float(RESILIENCE_CONFIG.get('aimd_cooldown_s', 2))
+AIMD_MIN = float(RESILIENCE_CONFIG.get('aimd_min', 1))
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+TRANSPORT_ERRORS = (httpx.TransportError, openai.APIConnectionError, ConnectionError, TimeoutError)
+
+# Circuit breaker states
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+
+class RetryableError(Exception):
+    """
+    Raised by a wrapped call to ask for a retry (e.g. an empty judge response).
+    """
+
+
+class CircuitOpenError(Exception):
+    """
+    The endpoint's circuit breaker stayed open longer than breaker_max_wait_s.
+    """
+
+
+def status_code(error: Exception):
+    """
+    HTTP status of an openai / ollama / httpx error (None if it has none).
+    """
+    code = getattr(error, 'status_code', None)
+    if code is None:
+        code = getattr(getattr(error, 'response', None), 'status_code', None)
+    return code
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    True for transient errors: connection errors, timeouts, 429 and 5xx (and Ollama stream errors without a status).
+    """
+    if isinstance(error, (RetryableError,) + TRANSPORT_ERRORS):
+        return True
+    code = status_code(error)
+    if isinstance(error, ollama.ResponseError) and code == -1:
+        return True  # error reported inside the stream
+    return code in RETRYABLE_STATUS or (code is not None and code >= 500)
+
+
+def retry_after_seconds(error: Exception):
+    """
+    Delay asked by a Retry-After header (seconds or HTTP date), None if there is none.
+    """
+    response = getattr(error, 'response', None)
+    value = getattr(response, 'headers', {}).get('retry-after') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float = BASE_DELAY, cap: float = MAX_DELAY) -> float:
+    """
+    Exponential backoff with full jitter: uniform in [0, min(cap, base * 2^attempt)].
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures; after `reset_timeout` one probe call is let
+    through (half-open), which closes the breaker on success or opens it again on failure.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURES, reset_timeout: float = BREAKER_RESET):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def wait_time(self) -> float:
+        """
+        0 if a call may go ahead now, otherwise the seconds to wait before asking again.
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return 0.0
+            if self.state == OPEN:
+                remaining = self.opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    return remaining
+                self.state = HALF_OPEN
+            if not self._probing:
+                self._probing = True
+                return 0.0
+            return min(1.0, self.reset_timeout)  # a probe is in flight
+
+    def is_open(self) -> bool:
+        """
+        True while the breaker is open and its reset timeout has not passed (no call would be let through).
+        """
+        with self._lock:
+            return self.state == OPEN and time.monotonic() < self.opened_at + self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logging.info(f"Circuit breaker {self.name} closed")
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                logging.warning(f"Circuit breaker {self.name} open for {self.reset_timeout}s after {self.failures} failures")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class AdaptiveLimit:
+    """
+    AIMD concurrency limit: +1 per `limit` successes, multiplied by `decrease` on an error
+    (at most once per `cooldown` seconds, so one burst of failures counts once).
+    """
+
+    def __init__(self, max_limit: float, min_limit: float = AIMD_MIN, decrease: float = AIMD_DECREASE,
+                 cooldown: float = AIMD_COOLDOWN):
+        self.max_limit = max(1.0, float(max_limit))
+        self.min_limit = max(1.0, min(min_limit, self.max_limit))
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.limit = self.max_limit
+        self.in_flight = 0
+        self._decreased_at = 0.0
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+
+    def _try_enter(self) -> bool:
+        with self._lock:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def _leave(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._released.notify()
+
+    @contextmanager
+    def slot(self):
+        with self._lock:
+            while self.in_flight >= int(self.limit):
+                self._released.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            self._leave()
+
+    @asynccontextmanager
+    async def async_slot(self):
+        # Never blocks the event loop: polls until a slot is free
+        while not self._try_enter():
+            await asyncio.sleep(0.05)
+        try:
+            yield
+        finally:
+            self._leave()
+
+    def on_success(self):
+        with self._lock:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._released.notify()
+
+    def on_error(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._decreased_at < self.cooldown:
+                return
+            self._decreased_at = now
+            previous = self.limit
+            self.limit = max(self.min_limit, self.limit * self.decrease)
+            if int(self.limit) < int(previous):
+                logging.warning(f"Concurrency lowered from {int(previous)} to {int(self.limit)} after errors")
+
+
+class RetryPolicy:
+    """
+    Retries of one kind of remote call: exponential backoff with full jitter, Retry-After honored on 429.
+    Used on its own when the endpoint is only known per attempt (Ollama pool: each attempt picks a host, whose
+    Endpoint.guard keeps the breaker and AIMD limit of that host).
+
+    Args:
+        name (str): Name used in logs.
+        max_attempts (int): Tries per call.
+    """
+
+    def __init__(self, name: str, max_attempts: int = MAX_ATTEMPTS):
+        self.name = name
+        self.max_attempts = max(1, max_attempts)
+        self.retries = 0
+
+    def _next_delay(self, error: Exception, attempt: int):
+        # Delay before the next attempt, or None to give up
+        if not is_retryable(error) or attempt + 1 >= self.max_attempts:
+            return None
+        retry_after = retry_after_seconds(error) if status_code(error) == 429 else None
+        delay = min(retry_after, MAX_RETRY_AFTER) if retry_after is not None else backoff_delay(attempt)
+        self.retries += 1
+        logging.warning(f"{self.name}: {error} (attempt {attempt + 1}/{self.max_attempts}), retrying in {delay:.1f}s")
+        return delay
+
+    def call(self, request):
+        """
+        Run request() (no arguments) with retries, returning its result or raising its last error.
+        """
+        attempt = 0
+        while True:
+            try:
+                return request()
+            except Exception as e:
+                delay = self._next_delay(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+
+    async def call_async(self, request):
+        """
+        Async variant of call: request() returns a coroutine.
+        """
+        attempt = 0
+        while True:
+            try:
+                return await request()
+            except Exception as e:
+                delay = self._next_delay(e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        return {'Endpoint': self.name, 'Breaker': None, 'Concurrency limit': None, 'Retries': self.retries}
+
+
+class Endpoint(RetryPolicy):
+    """
+    Retry policy, circuit breaker and AIMD limit of one remote endpoint.
+
+    Args:
+        name (str): Endpoint name (URL) used in logs.
+        max_concurrency (int): Upper bound of the AIMD limit (the callers' own concurrency).
+        max_attempts (int): Tries per call.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_attempts: int = MAX_ATTEMPTS):
+        super().__init__(name, max_attempts)
+        self.breaker = CircuitBreaker(name)
+        self.limit = AdaptiveLimit(max_concurrency)
+
+    def _record_error(self, error: Exception):
+        if not is_retryable(error):
+            self.breaker.record_success()  # the endpoint answered, the request itself is wrong
+        elif isinstance(error, RetryableError):
+            pass  # the endpoint answered (e.g. an empty judge reply): retried, not counted as an endpoint failure
+        elif status_code(error) == 429:
+            self.limit.on_error()  # over quota, the endpoint itself is fine
+        else:
+            self.breaker.record_failure()
+            self.limit.on_error()
+
+    def _breaker_delay(self, waited: float) -> float:
+        wait = self.breaker.wait_time()
+        if wait and waited + wait > BREAKER_MAX_WAIT:
+            raise CircuitOpenError(f"Circuit breaker of {self.name} is open")
+        return wait
+
+    def _succeeded(self):
+        self.breaker.record_success()
+        self.limit.on_success()
+
+    @contextmanager
+    def guard(self):
+        """
+        One attempt, no retry: waits while the breaker is open, holds a slot of the AIMD limit for the block
+        and records its outcome (a stream closed early by its reader counts as a success).
+        """
+        waited = 0.0
+        while True:
+            wait = self._breaker_delay(waited)
+            if not wait:
+                break
+            waited += wait
+            time.sleep(wait)
+        with self.limit.slot():
+            try:
+                yield
+            except GeneratorExit:
+                self._succeeded()
+                raise
+            except Exception as e:
+                self._record_error(e)
+                raise
+            self._succeeded()
+
+    @asynccontextmanager
+    async def guard_async(self):
+        """
+        Async variant of guard.
+        """
+        waited = 0.0
+        while True:
+            wait = self._breaker_delay(waited)
+            if not wait:
+                break
+            waited += wait
+            await asyncio.sleep(wait)
+        async with self.limit.async_slot():
+            try:
+                yield
+            except GeneratorExit:
+                self._succeeded()
+                raise
+            except Exception as e:
+                self._record_error(e)
+                raise
+            self._succeeded()
+
+    def call(self, request):
+        """
+        Run request() (no arguments) with retries, returning its result or raising its last error.
+        """
+        def attempt():
+            with self.guard():
+                return request()
+
+        return super().call(attempt)
+
+    async def call_async(self, request):
+        """
+        Async variant of call: request() returns a coroutine.
+        """
+        async def attempt():
+            async with self.guard_async():
+                return await request()
+
+        return await super().call_async(attempt)
+
+    def stats(self) -> dict:
+        return {'Endpoint': self.name, 'Breaker': self.breaker.state, 'Concurrency limit': int(self.limit.limit),
+                'Retries': self.retries}
+
+
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+
+
+def get_endpoint(name: str, max_concurrency: int) -> Endpoint:
+    """
+    Process-wide Endpoint of `name` (created on first use with `max_concurrency` as its AIMD upper bound).
+    """
+    with _endpoints_lock:
+        if name not in _endpoints:
+            _endpoints[name] = Endpoint(name, max_concurrency)
+        return _endpoints[name]
+
+
+def endpoint_stats() -> list:
+    """
+    Breaker state, current AIMD limit and retry count of every endpoint (and retry policy) used so far.
+    """
+    with _endpoints_lock:
+        return [endpoint.stats() for endpoint in _endpoints.values()]
+
+
+def judge_endpoint() -> Endpoint:
+    """
+    Endpoint of the client_openai judge calls, bounded by the judge workers.
+    """
+    return get_endpoint(BASE_URL_LLM, JUDGE_WORKERS)
+
+
+def ollama_endpoint(host: str) -> Endpoint:
+    """
+    Endpoint of one Ollama host (breaker and AIMD limit per host, bounded by generation.concurrency).
+    """
+    return get_endpoint(f"ollama {host}", GENERATION_CONCURRENCY)
+
+
+def ollama_retries() -> RetryPolicy:
+    """
+    Retries of the Ollama generation requests. Each attempt runs under the Endpoint of the host it is sent to
+    (ollama_pool.PoolClient), so one failing host does not hold back the others.
+    """
+    with _endpoints_lock:
+        if 'ollama' not in _endpoints:
+            _endpoints['ollama'] = RetryPolicy("ollama")
+        return _endpoints['ollama']
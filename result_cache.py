@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import hashlib
+import unicodedata
+import sqlite3
+import logging
+import threading
+
+from base import CONFIG
+from ollama_pool import ollama_pool, PoolClient
+
+
+"""
+    Persistent content-addressed caches (SQLite) for model generations and judge scores.
+    Entries are keyed by a hash of everything that determines the output of a request,
+    and evicted by age and by number of entries.
+"""
+
+
+class ResultCache:
+    """
+    Key/value cache stored in a SQLite file.
+
+    Args:
+        path (str): SQLite file of the cache.
+        enabled (bool): False turns every lookup into a miss and every store into a no-op.
+        max_entries (int): Oldest entries are evicted above this count (None = unlimited).
+        max_age_days (float): Entries older than this are evicted (None = never).
+    """
+
+    EVICT_EVERY = 500  # run eviction after this many stores
+
+    def __init__(self, path: str, enabled: bool = True, max_entries: int = None, max_age_days: float = None):
+        self.path = path
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS cache_created_at ON cache (created_at)")
+            self._evict()
+        return self._connection
+
+    def get(self, key: str):
+        """
+        Return the cached value for `key`, or None on a miss (or when the cache is disabled).
+        """
+        if not self.enabled or key is None:
+            return None
+        try:
+            with self._lock:
+                row = self._connect().execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                self.hits += 1
+                return json.loads(row[0])
+        except Exception as e:
+            logging.error(f"Cache lookup failed ({self.path}): {e}")
+            return None
+
+    def put(self, key: str, value):
+        """
+        Store a JSON-serializable value under `key`.
+        """
+        if not self.enabled or key is None:
+            return
+        try:
+            with self._lock:
+                connection = self._connect()
+                connection.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), time.time())
+                )
+                connection.commit()
+                self._puts += 1
+                if self._puts % self.EVICT_EVERY == 0:
+                    self._evict()
+        except Exception as e:
+            logging.error(f"Cache store failed ({self.path}): {e}")
+
+    def _evict(self):
+        connection = self._connection
+        if self.max_age_days:
+            connection.execute("DELETE FROM cache WHERE created_at < ?", (time.time() - self.max_age_days * 86400,))
+        if self.max_entries:
+            connection.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+        connection.commit()
+
+
+def make_cache_key(**parts) -> str:
+    """
+    Stable sha256 hash of the given request parts.
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cache_from_config(name: str, default_path: str) -> ResultCache:
+    """
+    Build a ResultCache from the `cache.<name>` section of config.yaml.
+    The env variable NO_<NAME>_CACHE=1 disables it for a single run.
+    """
+    settings = (CONFIG.get('cache') or {}).get(name) or {}
+    enabled = settings.get('enabled', True) and os.getenv(f"NO_{name.upper()}_CACHE", '0') != '1'
+    return ResultCache(
+        path=settings.get('path', default_path),
+        enabled=enabled,
+        max_entries=settings.get('max_entries'),
+        max_age_days=settings.get('max_age_days'),
+    )
+
+
+generation_cache = cache_from_config('generation', "datasets/cache/generation_cache.sqlite3")
+judge_cache = cache_from_config('judge', "datasets/cache/judge_cache.sqlite3")
+
+_model_digests = {}
+_digest_lock = threading.Lock()
+
+
+def get_model_digest(model: str, lookup: bool = True):
+    """
+    Digest of the model as reported by Ollama (None if the model or the server is not available).
+    With lookup=False only an already resolved digest is returned (no blocking HTTP call, for the event loop).
+    """
+    if not lookup:
+        return _model_digests.get(model)
+    with _digest_lock:
+        if model not in _model_digests:
+            digest = None
+            try:
+                names = {model, f"{model}:latest"}
+                for entry in PoolClient(ollama_pool).list().get('models', []):
+                    if entry.get('name') in names or entry.get('model') in names:
+                        digest = entry.get('digest')
+                        break
+            except Exception as e:
+                logging.error(f"Could not read the digest of {model}: {e}")
+                return None  # not memoized, retried on the next request
+            _model_digests[model] = digest
+        return _model_digests[model]
+
+
+def generation_cache_key(model: str, messages: list, options: dict = None, response_format=None, lookup_digest: bool = True):
+    """
+    Cache key of a generation request: model name, model digest, rendered messages, decoding options
+    and response format (constrained decoding). Returns None (no caching) if the cache is disabled
+    or the model digest is unknown. The async generation path passes lookup_digest=False: the digest is resolved
+    before the event loop starts (ResidencyManager.batch, run_generation_jobs,
+    sharded_runner.process_shard).
+    """
+    if not generation_cache.enabled:
+        return None
+    digest = get_model_digest(model, lookup=lookup_digest)
+    if digest is None:
+        return None
+    return make_cache_key(model=model, digest=digest, messages=messages, options=options, response_format=response_format)
+
+
+def normalize_text(text) -> str:
+    """
+    Unicode (NFC) and whitespace normalization of a judge input.
+    """
+    return ' '.join(unicodedata.normalize('NFC', str(text)).split())
+
+
+def judge_cache_key(judge_model: str, prompt_version: str, question: str, actual_answer: str, predicted_answer: str):
+    """
+    Cache key of a judge request: judge model, prompt template version and the normalized
+    (question, actual answer, predicted answer) triple. Returns None if the cache is disabled.
+    """
+    if not judge_cache.enabled:
+        return None
+    return make_cache_key(
+        judge_model=judge_model,
+        prompt_version=prompt_version,
+        question=normalize_text(question),
+        actual_answer=normalize_text(actual_answer),
+        predicted_answer=normalize_text(predicted_answer),
+    )
@@ -0,0 +1,45 @@
+import traceback
+import pandas as pd
+
+from residency import residency
+
+
+"""
+    Model-major run planner: every dataset runs for one model before the next model is loaded,
+    so Ollama loads each model once per run instead of once per dataset file.
+    Residency (preload, keep_alive, unload, prefetch of the next model) is handled by residency.py.
+"""
+
+
+def plan_model_major(dataset_files: list, models: list) -> list:
+    """
+    Reorder the (dataset, model) work into model-major batches.
+
+    Returns:
+        list: (model, [dataset files]) pairs, in the order of `models`.
+    """
+    return [(model, list(dataset_files)) for model in models]
+
+
+def run_model_major(models: list, dataset_files: list, run_dataset) -> pd.DataFrame:
+    """
+    Run run_dataset(model, dataset_file) for every pair, model by model.
+
+    Returns:
+        pd.DataFrame: Per model batch: model load time and inference time (seconds), reported separately.
+    """
+    plan = plan_model_major(dataset_files, models)
+    for position, (model, files) in enumerate(plan):
+        next_model = plan[position + 1][0] if position + 1 < len(plan) else None
+        print(f"Loading model {model}")
+        with residency.batch(model, next_model=next_model):
+            for file in files:
+                try:
+                    run_dataset(model, file)
+                except Exception as e:
+                    print(f"Error while running {file} with model {model}: {str(e)}")
+                    traceback.print_exc()
+
+    timings_df = residency.report().tail(len(plan))
+    print("\nModel load vs inference time:\n", timings_df)
+    return timings_df
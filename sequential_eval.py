@@ -0,0 +1,188 @@
+import math
+import hashlib
+import threading
+import statistics
+import numpy as np
+import pandas as pd
+
+from base import CONFIG
+
+
+"""
+    Sequential evaluation (sequential.enabled, opt-in): rows are scored in a seeded random order and a running mean
+    with a confidence interval is kept per (model, benchmark); scoring stops as soon as the interval is narrower than
+    the target width, so a model can be triaged on a fraction of the rows.
+        MC / TC / ARC   0/1 scores, Wilson score interval, target_width_binary in proportion units
+        QA / ContextQA  0-100 scores, Student t (or percentile bootstrap) interval, target_width_score in score points
+    The order of a row depends only on the seed and its row id, so step 1 and step 2 (and reruns) see the rows in the
+    same order, whichever subset of them is present.
+"""
+
+
+SEQUENTIAL_CONFIG = CONFIG.get('sequential') or {}
+SEQUENTIAL_ENABLED = SEQUENTIAL_CONFIG.get('enabled', False)
+SEQUENTIAL_SEED = SEQUENTIAL_CONFIG.get('seed', 42)
+SEQUENTIAL_CONFIDENCE = float(SEQUENTIAL_CONFIG.get('confidence', 0.95))
+TARGET_WIDTH_BINARY = float(SEQUENTIAL_CONFIG.get('target_width_binary', 0.1))
+TARGET_WIDTH_SCORE = float(SEQUENTIAL_CONFIG.get('target_width_score', 10))
+SEQUENTIAL_MIN_ITEMS = int(SEQUENTIAL_CONFIG.get('min_items', 30))
+SEQUENTIAL_CHUNK_SIZE = max(1, int(SEQUENTIAL_CONFIG.get('chunk_size', 20)))
+SCORE_INTERVAL = SEQUENTIAL_CONFIG.get('score_interval', 't')
+BOOTSTRAP_SAMPLES = int(SEQUENTIAL_CONFIG.get('bootstrap_samples', 2000))
+
+# Benchmarks scored 0/1 per row
+BINARY_BENCHMARKS = {'Arzuman', 'Reshad', 'ARC'}
+
+
+def sequential_order(df: pd.DataFrame, seed=SEQUENTIAL_SEED) -> pd.DataFrame:
+    """
+    Rows of df in the seeded random order (sorted by a hash of seed and row id).
+    """
+    keys = [hashlib.sha1(f"{seed}:{row_id}".encode('utf-8')).hexdigest() for row_id in df.index]
+    return df.iloc[np.argsort(keys, kind='stable')]
+
+
+def normal_quantile(confidence: float) -> float:
+    return statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def t_quantile(confidence: float, dof: int) -> float:
+    """
+    Two-sided Student t quantile (Cornish-Fisher expansion around the normal quantile, Abramowitz & Stegun 26.7.5;
+    within 1e-3 of the exact value from 5 degrees of freedom on).
+    """
+    z = normal_quantile(confidence)
+    if dof <= 0:
+        return math.inf
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+    return z + g1 / dof + g2 / dof ** 2 + g3 / dof ** 3 + g4 / dof ** 4
+
+
+def wilson_interval(successes: float, n: int, confidence: float = SEQUENTIAL_CONFIDENCE):
+    """
+    Wilson score interval (low, high) of a proportion.
+    """
+    if n == 0:
+        return 0.0, 1.0
+    z = normal_quantile(confidence)
+    p = successes / n
+    denominator = 1 + z ** 2 / n
+    center = (p + z ** 2 / (2 * n)) / denominator
+    half_width = z / denominator * math.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2))
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+def t_interval(scores: list, confidence: float = SEQUENTIAL_CONFIDENCE):
+    """
+    Student t interval (low, high) of the mean.
+    """
+    if len(scores) < 2:
+        return -math.inf, math.inf
+    mean = statistics.fmean(scores)
+    half_width = t_quantile(confidence, len(scores) - 1) * statistics.stdev(scores) / math.sqrt(len(scores))
+    return mean - half_width, mean + half_width
+
+
+def bootstrap_interval(scores: list, confidence: float = SEQUENTIAL_CONFIDENCE, samples: int = BOOTSTRAP_SAMPLES,
+                       seed=SEQUENTIAL_SEED):
+    """
+    Percentile bootstrap interval (low, high) of the mean (seeded, so reruns give the same interval).
+    """
+    if len(scores) < 2:
+        return -math.inf, math.inf
+    values = np.asarray(scores, dtype=float)
+    rng = np.random.default_rng(seed)
+    means = values[rng.integers(0, len(values), size=(samples, len(values)))].mean(axis=1)
+    low, high = np.quantile(means, [0.5 - confidence / 2, 0.5 + confidence / 2])
+    return float(low), float(high)
+
+
+class SequentialEstimate:
+    """
+    Running mean and confidence interval of the row scores of one (model, benchmark).
+
+    Args:
+        benchmark_type (str): Picks the interval (Wilson for 0/1 benchmarks) and the default target width.
+        target_width (float): Stop once high - low is at or below this.
+        min_items (int): Never stop before this many rows.
+    """
+
+    def __init__(self, benchmark_type: str, target_width: float = None, min_items: int = SEQUENTIAL_MIN_ITEMS,
+                 confidence: float = SEQUENTIAL_CONFIDENCE):
+        self.benchmark_type = benchmark_type
+        self.binary = benchmark_type in BINARY_BENCHMARKS
+        if target_width is None:
+            target_width = TARGET_WIDTH_BINARY if self.binary else TARGET_WIDTH_SCORE
+        self.target_width = target_width
+        self.min_items = min_items
+        self.confidence = confidence
+        self.scores = []
+
+    def add(self, scores):
+        # Rows without a score (None, e.g. no valid judge reply) are left out
+        self.scores.extend(float(score) for score in scores if score is not None)
+
+    @property
+    def n(self) -> int:
+        return len(self.scores)
+
+    def mean(self):
+        return statistics.fmean(self.scores) if self.scores else None
+
+    def interval(self):
+        if self.binary:
+            return wilson_interval(sum(self.scores), self.n, self.confidence)
+        if SCORE_INTERVAL == 'bootstrap':
+            return bootstrap_interval(self.scores, self.confidence)
+        return t_interval(self.scores, self.confidence)
+
+    def width(self) -> float:
+        low, high = self.interval()
+        return high - low
+
+    def done(self) -> bool:
+        return self.n >= self.min_items and self.width() <= self.target_width
+
+    def describe(self) -> str:
+        if not self.n:
+            return "n=0"
+        low, high = self.interval()
+        return f"n={self.n}, mean={self.mean():.4g}, {self.confidence:.0%} CI [{low:.4g}, {high:.4g}]"
+
+
+class SequentialResults:
+    """
+    Rows used and final interval of every (model, benchmark) scored sequentially.
+    """
+
+    def __init__(self):
+        self.records = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_name: str, benchmark_type: str, estimate: SequentialEstimate, total_rows: int):
+        low, high = estimate.interval() if estimate.n else (None, None)
+        with self._lock:
+            self.records[(model_name, benchmark_type)] = {
+                'items used': estimate.n,
+                'rows': total_rows,
+                'mean': estimate.mean(),
+                'ci low': low,
+                'ci high': high,
+                'width': high - low if estimate.n else None,
+                'target width': estimate.target_width,
+                'stopped early': estimate.n < total_rows,
+            }
+
+    def summary(self) -> pd.DataFrame:
+        with self._lock:
+            if not self.records:
+                return pd.DataFrame()
+            summary = pd.DataFrame.from_dict(self.records, orient='index')
+        summary.index.names = ['model', 'benchmark']
+        return summary
+
+
+sequential_results = SequentialResults()
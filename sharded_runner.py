@@ -0,0 +1,191 @@
+import os
+import time
+import socket
+import logging
+import argparse
+import threading
+import traceback
+import multiprocessing
+from contextlib import contextmanager
+
+from work_queue import WorkQueue, WORK_QUEUE_CONFIG, WORK_QUEUE_PATH, SHARD_SIZE
+from dataset_loader import load_dataset
+from generation_engine import run_generation_jobs
+from residency import residency
+from result_cache import get_model_digest
+from prediction_store import get_prediction_store, EXPORT_EXCEL
+from evalutate_yaml_chunked_get_answers import (build_prediction_jobs, export_predictions, get_benchmark_from_filename,
+                                                PREDICTION_COLUMNS, metadata, dataset_files)
+
+
+"""
+    Sharded runner for step 1 (answer generation) across processes and machines:
+        python sharded_runner.py enqueue [--shard-size 50] [--limit N]   split every (dataset, model) pair into row shards
+        python sharded_runner.py worker [--processes 4]                  claim shards under a lease and generate them
+        python sharded_runner.py merge [--no-scores]                     shards -> prediction store, Excel and results_file
+        python sharded_runner.py status
+    Workers on other machines need the same checkout, config.yaml and input datasets, with work_queue.path on a shared volume.
+"""
+
+
+POLL_SECONDS = float(WORK_QUEUE_CONFIG.get('poll_s', 5))
+
+
+@contextmanager
+def keep_lease(queue: WorkQueue, shard: dict):
+    # Renew the lease in the background while the shard is being generated
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(queue.lease_seconds / 3):
+            if not queue.heartbeat(shard):
+                logging.warning(f"Lease of shard {shard['shard_id']} was lost, its results will be discarded")
+                return
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def process_shard(queue: WorkQueue, shard: dict, df) -> bool:
+    """
+    Generate the rows of one shard and complete it. Returns False if the lease was lost before completion.
+    """
+    benchmark_type, model_name = shard['benchmark'], shard['model']
+    shard_df = df.iloc[shard['start_row']:shard['end_row']]
+    row_ids, rows, jobs = build_prediction_jobs(shard_df, benchmark_type, model_name)
+    # Workers do not run their shards inside residency.batch: the digest of the generation cache key is resolved
+    # here, before the event loop (memoized, retried on the next shard if the lookup failed)
+    get_model_digest(model_name)
+    with keep_lease(queue, shard):
+        results = run_generation_jobs(jobs)
+    return queue.complete(shard, PREDICTION_COLUMNS[benchmark_type],
+                          [(row_id, row + [predicted_value], telemetry)
+                           for row_id, row, (predicted_value, telemetry) in zip(row_ids, rows, results)])
+
+
+def run_worker(queue_path: str = WORK_QUEUE_PATH, worker_id: str = None, max_shards: int = None):
+    """
+    Claim and process shards until the queue has no open shard left. The worker preloads the model of its shard
+    and prefers shards of the model it has loaded. Models are not unloaded explicitly, other workers may share
+    the host: Ollama evicts them after keep_alive or when memory is needed.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    queue = WorkQueue(queue_path)
+    datasets = {}
+    current_model = None
+    processed = 0
+    while max_shards is None or processed < max_shards:
+        shard = queue.claim(worker_id, preferred_model=current_model)
+        if shard is None:
+            if not queue.has_open_shards():
+                break
+            time.sleep(POLL_SECONDS)  # leased by other workers, wait in case a lease expires
+            continue
+
+        print(f"[{worker_id}] shard {shard['shard_id']}: {shard['benchmark']} / {shard['model']} "
+              f"rows {shard['start_row']}-{shard['end_row']} (attempt {shard['attempts']})")
+        try:
+            if shard['model'] != current_model:
+                residency.preload(shard['model'])
+                current_model = shard['model']
+            if shard['dataset'] not in datasets:
+                datasets[shard['dataset']] = load_dataset(shard['dataset'], benchmark_type=shard['benchmark'])
+            if not process_shard(queue, shard, datasets[shard['dataset']]):
+                print(f"[{worker_id}] shard {shard['shard_id']} discarded (lease lost)")
+            processed += 1
+        except Exception as e:
+            print(f"[{worker_id}] shard {shard['shard_id']} failed: {str(e)}")
+            traceback.print_exc()
+            queue.fail(shard, e)
+    print(f"[{worker_id}] done, {processed} shards processed")
+
+
+def enqueue_all(queue: WorkQueue, shard_size: int = SHARD_SIZE, limit: int = None):
+    """
+    Queue the shards of every dataset file x supported model (config.yaml).
+    """
+    for file in dataset_files:
+        benchmark_type = get_benchmark_from_filename(file, metadata)
+        num_rows = len(load_dataset(file, benchmark_type=benchmark_type))
+        if limit is not None:
+            num_rows = min(num_rows, limit)
+        for model_name in metadata['supported_models']:
+            added = queue.enqueue(file, benchmark_type, model_name, num_rows, shard_size)
+            print(f"{benchmark_type} / {model_name}: {num_rows} rows, {added} new shards")
+
+
+def merge(queue: WorkQueue, partial: bool = False, export_excel: bool = EXPORT_EXCEL, scores: bool = True):
+    """
+    Copy the rows of done shards into the prediction store (and the Excel exports), then run step 2 (results_file).
+    Pairs with unfinished shards are skipped unless `partial`.
+    """
+    store = get_prediction_store()
+    for benchmark_type, model_name, total, done in queue.pairs():
+        if done < total and not partial:
+            print(f"{benchmark_type} / {model_name}: {done}/{total} shards done, not merged")
+            continue
+        merged = 0
+        with store.flush_on_exit():
+            for row_id, columns, values, telemetry in queue.results(benchmark_type, model_name):
+                store.put_result(benchmark_type, model_name, row_id, columns, values, telemetry)
+                merged += 1
+        print(f"{benchmark_type} / {model_name}: {merged} rows merged ({done}/{total} shards)")
+        if export_excel and merged:
+            export_predictions(store, benchmark_type, model_name)
+
+    if scores:
+        from evalutate_yaml_chunked_main import run_step_2_calculate_scores
+        run_step_2_calculate_scores()
+
+
+def print_status(queue: WorkQueue):
+    for benchmark_type, model_name, state, shards, rows in queue.status():
+        print(f"{benchmark_type:10} {model_name:28} {state:8} {shards:6} shards {rows:8} rows")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sharded answer generation over a shared work queue")
+    parser.add_argument('--queue', default=WORK_QUEUE_PATH, help="work queue file (work_queue.path)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = commands.add_parser('enqueue', help="queue the shards of every dataset x model")
+    enqueue_parser.add_argument('--shard-size', type=int, default=SHARD_SIZE)
+    enqueue_parser.add_argument('--limit', type=int, help="only the first N rows of each dataset")
+    enqueue_parser.add_argument('--retry-failed', action='store_true', help="make failed shards claimable again")
+
+    worker_parser = commands.add_parser('worker', help="process shards until the queue is drained")
+    worker_parser.add_argument('--processes', type=int, default=1, help="worker processes on this machine")
+    worker_parser.add_argument('--worker-id', help="default: hostname-pid")
+    worker_parser.add_argument('--max-shards', type=int, help="stop after this many shards")
+
+    merge_parser = commands.add_parser('merge', help="merge finished shards into the usual outputs")
+    merge_parser.add_argument('--partial', action='store_true', help="also merge pairs with unfinished shards")
+    merge_parser.add_argument('--no-scores', action='store_true', help="do not run step 2 (scores) after merging")
+
+    commands.add_parser('status', help="shard counts per benchmark, model and state")
+    args = parser.parse_args()
+
+    if args.command == 'enqueue':
+        queue = WorkQueue(args.queue)
+        if args.retry_failed:
+            print(f"{queue.reset_failed()} failed shards queued again")
+        enqueue_all(queue, args.shard_size, args.limit)
+    elif args.command == 'worker':
+        if args.processes > 1:
+            workers = [multiprocessing.Process(target=run_worker, args=(args.queue, None, args.max_shards))
+                       for _ in range(args.processes)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        else:
+            run_worker(args.queue, args.worker_id, args.max_shards)
+    elif args.command == 'merge':
+        merge(WorkQueue(args.queue), partial=args.partial, scores=not args.no_scores)
+    elif args.command == 'status':
+        print_status(WorkQueue(args.queue))
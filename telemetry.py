@@ -0,0 +1,91 @@
+import time
+import pandas as pd
+
+
+"""
+    Per-request inference telemetry: Ollama generation stats (from the final stream chunk, plus time-to-first-token
+    measured client side) and judge latency/token usage. Rows are stored next to the predictions in the prediction
+    store and summarized per model/benchmark (p50/p95) in the results workbook.
+"""
+
+
+# Ollama final-chunk fields; durations are reported in nanoseconds and stored in seconds
+OLLAMA_COUNT_FIELDS = ('eval_count', 'prompt_eval_count')
+OLLAMA_DURATION_FIELDS = ('eval_duration', 'prompt_eval_duration', 'load_duration', 'total_duration')
+
+SUMMARY_METRICS = ('ttft_s', 'latency_s', 'tokens_per_sec', 'prompt_tokens_per_sec', 'load_duration_s',
+                   'eval_count', 'prompt_eval_count', 'total_tokens')
+
+
+def generation_telemetry(collector) -> dict:
+    """
+    Telemetry of one streamed generation request (decoding.StreamCollector, read right after the stream).
+    Streams abandoned early have no final chunk, only the client-side timings are known for them.
+    """
+    now = time.perf_counter()
+    final = collector.final or {}
+    telemetry = {
+        'cached': False,
+        'aborted': collector.aborted,
+        'ttft_s': collector.first_token_at - collector.started_at if collector.first_token_at is not None else None,
+        'latency_s': now - collector.started_at,
+        'chars': collector.length,
+    }
+    for field in OLLAMA_COUNT_FIELDS:
+        telemetry[field] = final.get(field)
+    for field in OLLAMA_DURATION_FIELDS:
+        telemetry[f"{field}_s"] = final[field] / 1e9 if final.get(field) is not None else None
+
+    if telemetry['eval_count'] and telemetry['eval_duration_s']:
+        telemetry['tokens_per_sec'] = telemetry['eval_count'] / telemetry['eval_duration_s']
+    if telemetry['prompt_eval_count'] and telemetry['prompt_eval_duration_s']:
+        telemetry['prompt_tokens_per_sec'] = telemetry['prompt_eval_count'] / telemetry['prompt_eval_duration_s']
+    return telemetry
+
+
+def cached_telemetry() -> dict:
+    """
+    Telemetry of a request served from the generation or judge cache (left out of the summaries).
+    """
+    return {'cached': True}
+
+
+def error_telemetry(error) -> dict:
+    """
+    Telemetry of a failed generation request: the error message, kept as the row's last_error in the status index.
+    """
+    return {'cached': False, 'error': str(error)[:1000]}
+
+
+def judge_telemetry(started_at: float, completion=None, attempts: int = 1) -> dict:
+    """
+    Latency (since `started_at`, a time.perf_counter() value) and token usage of a client_openai judge call.
+    """
+    usage = getattr(completion, 'usage', None)
+    return {
+        'cached': False,
+        'latency_s': time.perf_counter() - started_at,
+        'attempts': attempts,
+        'prompt_tokens': getattr(usage, 'prompt_tokens', None),
+        'completion_tokens': getattr(usage, 'completion_tokens', None),
+        'total_tokens': getattr(usage, 'total_tokens', None),
+    }
+
+
+def summarize_telemetry(telemetry_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    p50/p95 of the telemetry metrics per model, benchmark and kind (generation/judge), cached requests excluded.
+    """
+    if telemetry_df.empty:
+        return pd.DataFrame()
+    live = telemetry_df[telemetry_df['cached'] != True]
+    metrics = [metric for metric in SUMMARY_METRICS if metric in live.columns]
+    if live.empty or not metrics:
+        return pd.DataFrame()
+
+    values = live[metrics].apply(pd.to_numeric, errors='coerce')
+    grouped = values.groupby([live['model'], live['benchmark'], live['kind']])
+    summary = pd.concat({'p50': grouped.quantile(0.5), 'p95': grouped.quantile(0.95)}, axis=1)
+    summary.columns = [f"{metric} {percentile}" for percentile, metric in summary.columns]
+    summary.insert(0, 'requests', grouped.size())
+    return summary.dropna(axis=1, how='all')
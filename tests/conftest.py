@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import socket
+import subprocess
+import textwrap
+
+import yaml
+import pytest
+import pandas as pd
+
+
+"""
+    The modules read config.yaml from the working directory when they are imported, so every test runs its script
+    in a subprocess inside a sandbox directory: its own config.yaml (fake_servers.py on a free port, caches, stores
+    and queues under the sandbox) and a small QA dataset.
+"""
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QA_DATASET = "datasets/input_datasets/test_qa.xlsx"
+QA_ROWS = 4
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Sandbox:
+    """
+    Working directory of one test. run(script) executes the script there and returns the JSON it prints last.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        with open(os.path.join(ROOT, 'config.yaml'), 'r', encoding='utf-8') as file:
+            self.config = yaml.safe_load(file)
+        self.config.update({
+            'metadata': {**self.config['metadata'], 'supported_models': ['m1'], 'benchmark_types': {'QA': ''},
+                         'dataset_naming_convention': {'_qa': 'QA'}},
+            'dataset_files': [QA_DATASET],
+            'output': {'results_file': "out/results.xlsx"},
+            'endpoints': {'ollama_host': self.url, 'judge_base_url': f"{self.url}/v1"},
+            'fake_servers': {**self.config['fake_servers'], 'port': self.port, 'load_ms': 0, 'tokens_per_sec': 10000,
+                             'latency': {'distribution': 'fixed', 'median_ms': 1}, 'seed': 1},
+            'run': {'mode': 'full', 'limit_rows': None},
+            'cache': {'generation': {'enabled': True, 'path': "cache/generation.sqlite3"},
+                      'judge': {'enabled': True, 'path': "cache/judge.sqlite3"}},
+            'predictions': {**self.config['predictions'], 'store': "out/predictions.sqlite3", 'export_excel': False},
+            'work_queue': {**self.config['work_queue'], 'path': "queue/queue.sqlite3", 'poll_s': 0.1},
+            'dataset_cache': {'enabled': True, 'dir': "cache/arrow"},
+            'resilience': {**self.config['resilience'], 'base_delay_s': 0.01, 'max_delay_s': 0.05},
+        })
+        self.config['judge'] = {**self.config['judge'], 'requests_per_minute': 6000}
+        self.config['ollama_pool'] = {**self.config['ollama_pool'], 'hosts': None}
+
+        os.makedirs(os.path.join(path, os.path.dirname(QA_DATASET)))
+        pd.DataFrame({'Sual': [f"Sual {row}?" for row in range(QA_ROWS)],
+                      'Cavab': [f"Cavab {row}." for row in range(QA_ROWS)]}).to_excel(os.path.join(path, QA_DATASET), index=False)
+
+    def run(self, script: str, timeout: float = 120):
+        with open(os.path.join(self.path, 'config.yaml'), 'w', encoding='utf-8') as file:
+            yaml.safe_dump(self.config, file, allow_unicode=True)
+        env = {**os.environ, 'PYTHONPATH': ROOT, 'API_KEY_NVIDIA_LLM': "test"}
+        completed = subprocess.run([sys.executable, '-c', textwrap.dedent(script)], cwd=self.path, env=env,
+                                   capture_output=True, text=True, timeout=timeout)
+        assert completed.returncode == 0, completed.stdout + completed.stderr
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+@pytest.fixture
+def sandbox(tmp_path):
+    return Sandbox(str(tmp_path))
@@ -0,0 +1,23 @@
+from conftest import QA_ROWS
+
+
+def test_error_judge_replies_are_left_out(sandbox):
+    # Every judge reply is "Error": step 2 and the step-1 estimate must finish with the rows left unscored
+    sandbox.config['fake_servers']['answers'] = {**sandbox.config['fake_servers']['answers'], 'judge': ["Error"]}
+    sandbox.config['tiered_scoring'] = {**sandbox.config['tiered_scoring'], 'enabled': False}
+    result = sandbox.run("""
+        import json
+        import fake_servers
+        fake_servers.start_fake_server()
+
+        from evalutate_yaml_chunked_main import run_step_1_store_answers
+        from evalutate_yaml_chunked_get_scores import calculate_scores, estimate_row_scores
+        from prediction_store import get_prediction_store
+
+        run_step_1_store_answers()
+        average = calculate_scores("QA_m1_predictions.xlsx", "QA", "m1")
+        rows = estimate_row_scores(get_prediction_store().to_frame("QA", "m1"), "QA", "m1")
+        print(json.dumps({'average': average, 'rows': rows}))
+    """)
+    assert result['rows'] == [None] * QA_ROWS
+    assert result['average'] == 0
@@ -0,0 +1,35 @@
+from conftest import free_port
+
+
+def test_failing_pool_host_does_not_stall_the_other(sandbox):
+    # Two pool hosts, one answers every request with HTTP 500. Its breaker opens before the pool
+    # ejects it, and the healthy host must keep serving the whole batch meanwhile.
+    failing_port = free_port()
+    sandbox.config['ollama_pool'] = {**sandbox.config['ollama_pool'], 'max_failures': 10,
+                                     'hosts': [sandbox.url, f"http://127.0.0.1:{failing_port}"]}
+    sandbox.config['resilience'] = {**sandbox.config['resilience'], 'breaker_failures': 2}
+    result = sandbox.run(f"""
+        import json
+        import time
+        import fake_servers
+        fake_servers.start_fake_server()
+        fake_servers.start_fake_server({{'port': {failing_port}, 'error_rate': 1.0}})
+
+        from residency import residency
+        from generation_engine import run_generation_jobs
+        from qa_quality import get_answer_from_local_ollama_async
+        from resilience import endpoint_stats
+
+        with residency.batch('m1'):
+            started = time.perf_counter()
+            answers = run_generation_jobs([lambda client, row=row: get_answer_from_local_ollama_async('m1', f"Sual {{row}}?", client)
+                                           for row in range(24)])
+            seconds = time.perf_counter() - started
+        print(json.dumps({{'errors': answers.count("Error"), 'seconds': seconds,
+                          'breakers': {{stats['Endpoint']: stats['Breaker'] for stats in endpoint_stats()}}}}))
+    """)
+    assert result['errors'] == 0
+    assert result['breakers'][f"ollama {sandbox.url}"] == 'closed'
+    assert result['breakers'][f"ollama http://127.0.0.1:{failing_port}"] != 'closed'
+    # Well under breaker_reset_s: the failing host's breaker never held back the batch
+    assert result['seconds'] < 10
@@ -0,0 +1,24 @@
+from conftest import QA_ROWS
+
+
+def test_sharded_rerun_reads_the_generation_cache(sandbox):
+    # Two queues over the same dataset: the second run must be served from the generation cache of the first
+    runs = sandbox.run("""
+        import json
+        import fake_servers
+        fake_servers.start_fake_server()
+
+        import sharded_runner
+        from work_queue import WorkQueue
+
+        runs = []
+        for path in ("queue/first.sqlite3", "queue/rerun.sqlite3"):
+            queue = WorkQueue(path)
+            sharded_runner.enqueue_all(queue, shard_size=2)
+            sharded_runner.run_worker(path)
+            runs.append([telemetry['cached'] for row_id, columns, values, telemetry in queue.results('QA', 'm1')])
+        print(json.dumps(runs))
+    """)
+    first, rerun = runs
+    assert first == [False] * QA_ROWS
+    assert rerun == [True] * QA_ROWS
@@ -0,0 +1,94 @@
+import threading
+import pandas as pd
+
+from base import CONFIG
+from result_cache import normalize_text
+
+
+"""
+    Tiered QA/ContextQA scoring: the lexical metrics (BLEU + ROUGE + Levenshtein) run first and decide the judge score
+    of the clear-cut rows without a network call; only the ambiguous middle goes to the LLM judge.
+        rule          error / long / empty predictions, score 0
+        lexical-high  exact match (case, whitespace and punctuation aside) or lexical overlap at or above
+                      high_threshold, judge score = high_score
+        lexical-low   lexical overlap below low_threshold, judge score = low_score
+        judge         everything else, scored by the LLM judge
+"""
+
+
+TIERS_CONFIG = CONFIG.get('tiered_scoring') or {}
+TIERS_ENABLED = TIERS_CONFIG.get('enabled', True)
+TIER_HIGH_THRESHOLD = float(TIERS_CONFIG.get('high_threshold', 0.9))
+TIER_LOW_THRESHOLD = float(TIERS_CONFIG.get('low_threshold', 0.05))
+TIER_HIGH_SCORE = int(TIERS_CONFIG.get('high_score', 100))
+TIER_LOW_SCORE = int(TIERS_CONFIG.get('low_score', 0))
+
+# BLEU, ROUGE and Levenshtein are 0-25 each
+LEXICAL_MAX = 75
+
+TIER_RULE, TIER_LEXICAL_HIGH, TIER_LEXICAL_LOW, TIER_JUDGE = 'rule', 'lexical-high', 'lexical-low', 'judge'
+TIERS = (TIER_RULE, TIER_LEXICAL_HIGH, TIER_LEXICAL_LOW, TIER_JUDGE)
+
+
+def is_failed_prediction(predicted_answer) -> bool:
+    """
+    Error, long or empty predictions (scored 0 without a judge call).
+    """
+    if not isinstance(predicted_answer, str) or not predicted_answer.strip():
+        return True
+    return predicted_answer.lower() == 'long answer' or 'error' in predicted_answer.lower()
+
+
+def _comparable(text) -> str:
+    return normalize_text(text).casefold().strip(' .!?;:,')
+
+
+def assign_tier(predicted_answer, lexical_score: float, actual_answer=None, enabled: bool = TIERS_ENABLED):
+    """
+    Tier of a row and its deterministic judge score (None for the judge tier).
+    BLEU is low for short sentences, so exact matches are recognized directly when actual_answer is given.
+    """
+    if is_failed_prediction(predicted_answer):
+        return TIER_RULE, 0
+    if enabled:
+        if actual_answer is not None and _comparable(actual_answer) == _comparable(predicted_answer):
+            return TIER_LEXICAL_HIGH, TIER_HIGH_SCORE
+        overlap = lexical_score / LEXICAL_MAX
+        if overlap >= TIER_HIGH_THRESHOLD:
+            return TIER_LEXICAL_HIGH, TIER_HIGH_SCORE
+        if overlap < TIER_LOW_THRESHOLD:
+            return TIER_LEXICAL_LOW, TIER_LOW_SCORE
+    return TIER_JUDGE, None
+
+
+class TierStats:
+    """
+    Rows per tier of every scored (model, benchmark), for the judge-call savings summary.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, model_name: str, benchmark_type: str, tiers: list):
+        with self._lock:
+            self.counts[(model_name, benchmark_type)] = {tier: tiers.count(tier) for tier in TIERS}
+
+    def summary(self) -> pd.DataFrame:
+        """
+        Rows per tier and the judge calls saved by the lexical tiers, as a share of the rows that needed a score
+        (rule rows never reach the judge), per model/benchmark.
+        """
+        with self._lock:
+            if not self.counts:
+                return pd.DataFrame()
+            summary = pd.DataFrame.from_dict(self.counts, orient='index')[list(TIERS)]
+        summary.index.names = ['model', 'benchmark']
+        summary.insert(0, 'rows', summary.sum(axis=1))
+        summary['judge calls saved'] = summary[TIER_LEXICAL_HIGH] + summary[TIER_LEXICAL_LOW]
+        scorable = summary['rows'] - summary[TIER_RULE]
+        summary['saved (%)'] = (100 * summary['judge calls saved'] / scorable.where(scorable > 0)).round(1)
+        return summary
+
+
+tier_stats = TierStats()
@@ -0,0 +1,140 @@
+import os
+import json
+import math
+import logging
+import threading
+import statistics
+import pandas as pd
+
+from base import CONFIG
+
+
+"""
+    Run modes of step 1 / evaluate_yaml.py and the tiny benchmark estimate.
+        full  every row of each dataset (only the first run.limit_rows rows if set, for smoke tests)
+        tiny  only the anchor rows picked by anchor_selection.py from past full runs; the full-dataset score is
+              estimated as the cluster-size weighted mean of the anchor scores, with an error bar from the spread of
+              the item scores inside each cluster and the leave-one-model-out error of the past runs
+"""
+
+
+RUN_CONFIG = CONFIG.get('run') or {}
+RUN_MODE = RUN_CONFIG.get('mode', 'full')
+LIMIT_ROWS = RUN_CONFIG.get('limit_rows')
+
+TINY_CONFIG = CONFIG.get('tiny_benchmark') or {}
+ANCHORS_PATH = TINY_CONFIG.get('anchors_path', "datasets/anchors/anchors.json")
+ANCHORS_PER_DATASET = int(TINY_CONFIG.get('anchors_per_dataset', 50))
+ANCHORS_MIN_MODELS = int(TINY_CONFIG.get('min_models', 2))
+ANCHORS_MIN_COVERAGE = float(TINY_CONFIG.get('min_coverage', 0.9))
+ANCHORS_SEED = TINY_CONFIG.get('seed', 42)
+TINY_CONFIDENCE = float(TINY_CONFIG.get('confidence', 0.95))
+
+FULL, TINY = 'full', 'tiny'
+RUN_MODES = (FULL, TINY)
+
+
+def load_anchors(path: str = ANCHORS_PATH) -> dict:
+    """
+    Anchor sets per benchmark type, {} if anchor_selection.py has not been run.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_anchors(anchor_sets: dict, path: str = ANCHORS_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(anchor_sets, file, ensure_ascii=False, indent=2)
+
+
+def dataset_rows(df: pd.DataFrame, benchmark_type: str, mode: str = RUN_MODE, limit: int = LIMIT_ROWS) -> pd.DataFrame:
+    """
+    Rows of a dataset to evaluate in the run mode: the anchor rows in tiny mode, otherwise the first `limit` rows
+    (all rows if limit is empty).
+    """
+    if mode == TINY:
+        anchor_set = load_anchors().get(benchmark_type)
+        if not anchor_set:
+            raise ValueError(f"No anchors for {benchmark_type} in {ANCHORS_PATH}, run anchor_selection.py first")
+        return df.loc[df.index.intersection(anchor_set['row_ids'])]
+    if mode != FULL:
+        raise ValueError(f"Unknown run mode: {mode}")
+    return df[:int(limit)] if limit else df
+
+
+def estimate_full_score(benchmark_type: str, anchor_scores: dict, confidence: float = TINY_CONFIDENCE) -> dict:
+    """
+    Full-dataset score estimated from the anchor scores ({row_id: score}).
+
+    Every anchor stands for its share of its cluster: estimate = sum(weight * score). The standard error combines
+    sqrt(sum(weight^2 * within-cluster variance)), the variances coming from the past runs the anchors were picked
+    from, with the backtest RMSE of those runs (models unlike the past ones fall outside the clusters).
+    Anchors without a score (failed rows) are left out and the remaining weights rescaled.
+    """
+    anchor_set = load_anchors()[benchmark_type]
+    scored = [(weight, variance, anchor_scores[row_id])
+              for row_id, weight, variance in zip(anchor_set['row_ids'], anchor_set['weights'], anchor_set['within_variances'])
+              if anchor_scores.get(row_id) is not None]
+    if not scored:
+        return {'estimate': None, 'ci low': None, 'ci high': None, 'anchors scored': 0}
+
+    total_weight = sum(weight for weight, variance, score in scored)
+    estimate = sum(weight * score for weight, variance, score in scored) / total_weight
+    standard_error = math.sqrt(sum((weight / total_weight) ** 2 * variance for weight, variance, score in scored)
+                               + anchor_set.get('backtest_rmse', 0) ** 2)
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+    low, high = anchor_set['score_range']
+    return {
+        'estimate': estimate,
+        'ci low': max(low, estimate - z * standard_error),
+        'ci high': min(high, estimate + z * standard_error),
+        'anchors scored': len(scored),
+    }
+
+
+class TinyResults:
+    """
+    Estimated full-dataset scores and error bars of every (model, benchmark) run in tiny mode.
+    """
+
+    def __init__(self):
+        self.records = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_name: str, benchmark_type: str, estimate: dict):
+        anchor_set = load_anchors()[benchmark_type]
+        with self._lock:
+            self.records[(model_name, benchmark_type)] = {
+                **estimate,
+                'anchors': len(anchor_set['row_ids']),
+                'dataset rows': anchor_set['dataset_rows'],
+                'backtest rmse': anchor_set.get('backtest_rmse'),
+            }
+
+    def summary(self) -> pd.DataFrame:
+        with self._lock:
+            if not self.records:
+                return pd.DataFrame()
+            summary = pd.DataFrame.from_dict(self.records, orient='index')
+        summary.index.names = ['model', 'benchmark']
+        return summary
+
+
+tiny_results = TinyResults()
+
+
+def tiny_score(model_name: str, benchmark_type: str, row_ids, scores) -> float:
+    """
+    Record the tiny-mode estimate of the scored anchor rows and return the estimated full-dataset score.
+    """
+    estimate = estimate_full_score(benchmark_type, dict(zip(row_ids, scores)))
+    tiny_results.record(model_name, benchmark_type, estimate)
+    if estimate['estimate'] is None:
+        logging.warning(f"Tiny {model_name}/{benchmark_type}: no anchor was scored")
+        return None
+    print(f"Tiny {model_name}/{benchmark_type}: estimated {estimate['estimate']:.4g} "
+          f"[{estimate['ci low']:.4g}, {estimate['ci high']:.4g}] from {estimate['anchors scored']} anchors")
+    return estimate['estimate']
@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from base import CONFIG
+from prediction_store import _json_default
+
+
+"""
+    Durable shard queue (SQLite) for the sharded runner. Each (dataset, model) pair is split into fixed-size row shards;
+    workers claim shards under a time-limited lease, renew it while they work, and complete the shard by writing
+    its rows in the same transaction that checks the lease is still theirs. Expired leases of dead workers are
+    reclaimed by the next claim, and a late completion from a worker that lost its lease is rejected,
+    so every row is written exactly once.
+    The default rollback journal (not WAL) keeps the file usable from several machines on a shared volume.
+"""
+
+
+WORK_QUEUE_CONFIG = CONFIG.get('work_queue') or {}
+WORK_QUEUE_PATH = WORK_QUEUE_CONFIG.get('path', "datasets/queue/work_queue.sqlite3")
+SHARD_SIZE = int(WORK_QUEUE_CONFIG.get('shard_size', 50))
+LEASE_SECONDS = float(WORK_QUEUE_CONFIG.get('lease_s', 300))
+MAX_ATTEMPTS = int(WORK_QUEUE_CONFIG.get('max_attempts', 3))
+JOURNAL_MODE = WORK_QUEUE_CONFIG.get('journal_mode', "DELETE")
+
+# Shard states
+PENDING, LEASED, DONE, FAILED = 'pending', 'leased', 'done', 'failed'
+
+
+class WorkQueue:
+    """
+    Shard queue of a sharded run.
+
+    Args:
+        path (str): SQLite file of the queue (on a volume shared by all workers).
+        lease_seconds (float): How long a claimed shard stays reserved without a heartbeat.
+        max_attempts (int): Claims of a shard before it is marked failed.
+    """
+
+    def __init__(self, path: str = WORK_QUEUE_PATH, lease_seconds: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        self._connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._connection.execute(f"PRAGMA journal_mode={JOURNAL_MODE}")
+        with self._transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS shards ("
+                "shard_id INTEGER PRIMARY KEY AUTOINCREMENT, dataset TEXT NOT NULL, benchmark TEXT NOT NULL, "
+                "model TEXT NOT NULL, start_row INTEGER NOT NULL, end_row INTEGER NOT NULL, "
+                "state TEXT NOT NULL, lease_owner TEXT, lease_token TEXT, lease_expires REAL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT, updated_at REAL NOT NULL, "
+                "UNIQUE (dataset, model, start_row))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS shard_results ("
+                "shard_id INTEGER NOT NULL, row_id INTEGER NOT NULL, columns TEXT NOT NULL, row_values TEXT NOT NULL, "
+                "telemetry TEXT, PRIMARY KEY (shard_id, row_id))"
+            )
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            else:
+                self._connection.execute("COMMIT")
+
+    def enqueue(self, dataset: str, benchmark: str, model: str, num_rows: int, shard_size: int = SHARD_SIZE) -> int:
+        """
+        Add the shards of a (dataset, model) pair (row positions [0, num_rows)). Existing shards are kept.
+        Returns the number of new shards.
+        """
+        shard_size = max(1, shard_size)
+        now = time.time()
+        with self._transaction() as connection:
+            before = connection.total_changes
+            connection.executemany(
+                "INSERT OR IGNORE INTO shards (dataset, benchmark, model, start_row, end_row, state, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(dataset, benchmark, model, start, min(start + shard_size, num_rows), PENDING, now)
+                 for start in range(0, num_rows, shard_size)]
+            )
+            return connection.total_changes - before
+
+    def claim(self, owner: str, preferred_model: str = None):
+        """
+        Lease the next pending (or expired) shard, preferring shards of `preferred_model` (the model the worker
+        has loaded). Returns the shard as a dict (with its lease_token), or None if nothing is claimable.
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            # Leases that ran out too often are given up
+            connection.execute(
+                "UPDATE shards SET state = ?, last_error = COALESCE(last_error, 'lease expired'), updated_at = ? "
+                "WHERE state = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, now, LEASED, now, self.max_attempts)
+            )
+            row = connection.execute(
+                "SELECT shard_id, dataset, benchmark, model, start_row, end_row, attempts FROM shards "
+                "WHERE state = ? OR (state = ? AND lease_expires < ?) "
+                "ORDER BY (model = ?) DESC, model, dataset, start_row LIMIT 1",
+                (PENDING, LEASED, now, preferred_model or '')
+            ).fetchone()
+            if row is None:
+                return None
+            token = uuid.uuid4().hex
+            connection.execute(
+                "UPDATE shards SET state = ?, lease_owner = ?, lease_token = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE shard_id = ?",
+                (LEASED, owner, token, now + self.lease_seconds, now, row[0])
+            )
+        keys = ('shard_id', 'dataset', 'benchmark', 'model', 'start_row', 'end_row', 'attempts')
+        return {**dict(zip(keys, row)), 'attempts': row[6] + 1, 'lease_token': token}
+
+    def heartbeat(self, shard: dict) -> bool:
+        """
+        Extend the lease of a shard. False if the lease was lost (expired and claimed by another worker).
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE shards SET lease_expires = ? WHERE shard_id = ? AND state = ? AND lease_token = ?",
+                (time.time() + self.lease_seconds, shard['shard_id'], LEASED, shard['lease_token'])
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, shard: dict, columns: list, results: list) -> bool:
+        """
+        Write the shard's rows and mark it done, only if the worker still holds the lease.
+
+        Args:
+            results (list): (row_id, row values, telemetry) per row.
+
+        Returns:
+            bool: False if the lease was lost, nothing is written then.
+        """
+        with self._transaction() as connection:
+            held = connection.execute(
+                "SELECT 1 FROM shards WHERE shard_id = ? AND state = ? AND lease_token = ?",
+                (shard['shard_id'], LEASED, shard['lease_token'])
+            ).fetchone()
+            if held is None:
+                return False
+            connection.execute("DELETE FROM shard_results WHERE shard_id = ?", (shard['shard_id'],))
+            connection.executemany(
+                "INSERT INTO shard_results (shard_id, row_id, columns, row_values, telemetry) VALUES (?, ?, ?, ?, ?)",
+                [(shard['shard_id'], int(row_id), json.dumps(columns),
+                  json.dumps(values, ensure_ascii=False, default=_json_default),
+                  json.dumps(telemetry, default=_json_default) if telemetry else None)
+                 for row_id, values, telemetry in results]
+            )
+            connection.execute(
+                "UPDATE shards SET state = ?, lease_token = NULL, lease_expires = NULL, last_error = NULL, updated_at = ? "
+                "WHERE shard_id = ?",
+                (DONE, time.time(), shard['shard_id'])
+            )
+            return True
+
+    def fail(self, shard: dict, error: str):
+        """
+        Give the shard back (pending again, or failed after max_attempts claims) with the error message.
+        """
+        with self._transaction() as connection:
+            connection.execute(
+                "UPDATE shards SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, lease_token = NULL, "
+                "lease_expires = NULL, last_error = ?, updated_at = ? WHERE shard_id = ? AND lease_token = ?",
+                (self.max_attempts, FAILED, PENDING, str(error)[:1000], time.time(), shard['shard_id'], shard['lease_token'])
+            )
+
+    def reset_failed(self) -> int:
+        """
+        Make failed shards claimable again (attempt counters restart). Returns the number of shards reset.
+        """
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE shards SET state = ?, attempts = 0, updated_at = ? WHERE state = ?", (PENDING, time.time(), FAILED)
+            )
+            return cursor.rowcount
+
+    def status(self) -> list:
+        """
+        Shard counts per (benchmark, model, state).
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT benchmark, model, state, COUNT(*), SUM(end_row - start_row) FROM shards "
+                "GROUP BY benchmark, model, state ORDER BY benchmark, model, state"
+            ).fetchall()
+
+    def has_open_shards(self) -> bool:
+        """
+        True while any shard is pending or leased.
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT 1 FROM shards WHERE state IN (?, ?) LIMIT 1", (PENDING, LEASED)
+            ).fetchone() is not None
+
+    def pairs(self) -> list:
+        """
+        (benchmark, model, total shards, done shards) of every queued pair.
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT benchmark, model, COUNT(*), SUM(state = ?) FROM shards GROUP BY benchmark, model ORDER BY model, benchmark",
+                (DONE,)
+            ).fetchall()
+
+    def results(self, benchmark: str, model: str):
+        """
+        Rows of the done shards of (benchmark, model): (row_id, columns, values, telemetry), in row order.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT r.row_id, r.columns, r.row_values, r.telemetry FROM shard_results r "
+                "JOIN shards s ON s.shard_id = r.shard_id "
+                "WHERE s.benchmark = ? AND s.model = ? AND s.state = ? ORDER BY r.row_id",
+                (benchmark, model, DONE)
+            ).fetchall()
+        for row_id, columns, values, telemetry in rows:
+            yield row_id, json.loads(columns), json.loads(values), json.loads(telemetry) if telemetry else None